@@ -1,10 +1,43 @@
-from flask import Flask, render_template, jsonify, send_file
+from flask import Flask, Response, render_template, jsonify, request, send_file
+import argparse
+import asyncio
+import gzip
+import hashlib
 import os
+import secrets
+import sys
 import json
-from datetime import datetime
+import html as html_lib
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlencode
+
+# En el contenedor series_store.py se copia junto al dashboard; en el repo vive en src/monitor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "monitor"))
+from series_store import list_series, query_series, METHOD_LTTB, METHOD_MINMAX
+from stream_summary import open_readonly, query_summaries, STATUS_FILTERS
+from record_log import query_history, project
+
+# Dependencias opcionales: servidor ASGI multiproceso y compresión brotli
+try:
+    import uvicorn
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError:
+    uvicorn = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
+def fmt(value, spec=".3f", scale=1):
+    """Formatea un valor numérico; sin datos muestra N/A en lugar de 0"""
+    return "N/A" if value is None else format(value / scale, spec)
+
 @app.route("/")
 def dashboard():
     return """
@@ -20,11 +53,13 @@ def dashboard():
         .status-ok { background-color: #d4edda; border-color: #c3e6cb; }
         .status-error { background-color: #f8d7da; border-color: #f5c6cb; }
         .status-warning { background-color: #fff3cd; border-color: #ffeaa7; }
+        .series-chart { height: 300px; }
     </style>
 </head>
 <body>
     <div class="container">
         <h1>Streaming Quality Monitor Dashboard</h1>
+        <p><a href="/streams">Vista general de streams</a></p>
         <div id="metrics"></div>
         <div id="charts"></div>
     </div>
@@ -36,26 +71,590 @@ def dashboard():
                     document.getElementById("metrics").innerHTML = data.html;
                 });
         }
-        
-        setInterval(updateMetrics, 5000);
-        updateMetrics();
+
+        // Aplica solo los campos que cambiaron (texto o atributo indicado en data-attr)
+        function applyDelta(fields) {
+            for (const [name, value] of Object.entries(fields)) {
+                document.querySelectorAll('[data-field="' + name + '"]').forEach(el => {
+                    if (el.dataset.attr) {
+                        el.setAttribute(el.dataset.attr, value);
+                    } else {
+                        el.textContent = value;
+                    }
+                });
+            }
+        }
+
+        if (window.EventSource) {
+            // Canal push: snapshot completo al conectar o si cambia la estructura, deltas en el resto
+            const source = new EventSource("/api/stream");
+            source.addEventListener("snapshot", e => {
+                document.getElementById("metrics").innerHTML = JSON.parse(e.data).html;
+            });
+            source.addEventListener("delta", e => applyDelta(JSON.parse(e.data)));
+        } else {
+            setInterval(updateMetrics, 5000);
+            updateMetrics();
+        }
+
+        // Series temporales: el servidor devuelve como mucho tantos puntos como píxeles tiene el gráfico
+        const SERIES_CHARTS = [
+            {title: "Health Score", metrics: ["health_score", "quality_score", "latency_score", "adaptation_score"]},
+            {title: "Latencia (ms)", metrics: ["manifest_latency_ms", "segment_latency_ms"]},
+            {title: "Bitrate medido (bps)", prefix: "measured_bitrate_bps."},
+            {title: "Retraso de disponibilidad (s)", metrics: ["availability_delay_s"]},
+        ];
+        const SERIES_WINDOW_S = 24 * 3600;
+
+        function fetchSeries(stream, metric, from, to, points) {
+            const params = new URLSearchParams({stream: stream, metric: metric, points: points});
+            if (from !== null) params.set("from", from);
+            if (to !== null) params.set("to", to);
+            return fetch("/api/series?" + params).then(response => response.json());
+        }
+
+        function drawChart(chart, from, to) {
+            const points = Math.max(100, chart.div.clientWidth);
+            Promise.all(chart.metrics.map(metric => fetchSeries(chart.stream, metric, from, to, points)))
+                .then(results => {
+                    const traces = results.map(series => ({
+                        x: series.t.map(t => new Date(t * 1000)),
+                        y: series.v,
+                        name: series.metric,
+                        mode: "lines",
+                    }));
+                    Plotly.react(chart.div, traces, {title: chart.title, margin: {t: 40}}, {responsive: true});
+                });
+        }
+
+        function setupCharts() {
+            fetch("/api/series")
+                .then(response => response.json())
+                .then(catalog => {
+                    const stream = Object.keys(catalog.series)[0];
+                    if (!stream) return;
+                    const available = catalog.series[stream];
+                    const container = document.getElementById("charts");
+                    SERIES_CHARTS.forEach(spec => {
+                        const metrics = spec.prefix ? available.filter(m => m.startsWith(spec.prefix))
+                                                    : spec.metrics.filter(m => available.includes(m));
+                        if (!metrics.length) return;
+                        const div = document.createElement("div");
+                        div.className = "metric-card series-chart";
+                        container.appendChild(div);
+                        const chart = {div: div, stream: stream, metrics: metrics, title: spec.title, zoomed: false};
+                        drawChart(chart, Date.now() / 1000 - SERIES_WINDOW_S, null);
+                        // Al hacer zoom se piden de nuevo los puntos del rango visible con más resolución
+                        div.on("plotly_relayout", e => {
+                            if (e["xaxis.range[0]"] !== undefined) {
+                                chart.zoomed = true;
+                                drawChart(chart, new Date(e["xaxis.range[0]"]).getTime() / 1000,
+                                          new Date(e["xaxis.range[1]"]).getTime() / 1000);
+                            } else if (e["xaxis.autorange"]) {
+                                chart.zoomed = false;
+                                drawChart(chart, Date.now() / 1000 - SERIES_WINDOW_S, null);
+                            }
+                        });
+                        setInterval(() => {
+                            if (!chart.zoomed) drawChart(chart, Date.now() / 1000 - SERIES_WINDOW_S, null);
+                        }, 60000);
+                    });
+                });
+        }
+
+        setupCharts();
     </script>
 </body>
 </html>
 """
 
+# Archivos de los que depende la vista de métricas
+SUITE_DATA_FILE = "/app/stream_analysis/dashboard_data.json"
+SERIES_DIR = "/app/stream_analysis/series"
+MAX_SERIES_POINTS = 5000
+SERIES_CLOSED_AFTER_S = 300
+HISTORY_DIRS = {
+    "suite": "/app/stream_analysis/history",
+    "quality": "/app/stream_analysis/quality/history",
+    "latency": "/app/stream_analysis/latency/history",
+    "adaptation": "/app/stream_analysis/adaptation/history",
+}
+MAX_HISTORY_RECORDS = 10000
+SUMMARY_DB = os.environ.get("STREAM_SUMMARY_DB", "/app/stream_analysis/streams.db")
+MAX_STREAMS_PER_PAGE = 500
+CHART_FILE = "/app/stream_analysis/adaptation/bitrate_adaptation.png"
+MONITOR_DATA_FILE = "/app/logs/stream_quality.jsonl"
+
+
+class MetricsView:
+    """Registra los valores dinámicos del HTML para poder enviar solo los que cambian"""
+
+    def __init__(self):
+        self.values = {}
+        self.structure = []
+
+    def text(self, name, value):
+        value = html_lib.escape(str(value))
+        self.values[name] = value
+        return f'<span data-field="{name}">{value}</span>'
+
+    def attr(self, name, attr, value):
+        self.values[name] = value
+        return f'data-field="{name}" data-attr="{attr}" {attr}="{html_lib.escape(value)}"'
+
+    def block(self, *parts):
+        """Partes que cambian la estructura de la página (tarjetas opcionales, recomendaciones)"""
+        self.structure.append(parts)
+
+
+class MetricsSnapshot:
+    """Respuesta de /api/metrics ya renderizada y compartida por todos los clientes; se regenera solo si cambia algún archivo"""
+
+    def __init__(self, paths, render):
+        self.paths = paths
+        self.render = render
+        self.key = None
+        self.html = None
+        self.view = None
+        self.body = None
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def file_key(self):
+        key = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                key.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+    def refresh(self):
+        """Regenera la vista si cambió algún archivo; devuelve True si hubo cambios"""
+        key = self.file_key()
+        if key == self.key:
+            return False
+        with self.lock:
+            # Otro hilo pudo regenerarla mientras se esperaba el lock
+            if key == self.key:
+                return False
+            view = MetricsView()
+            self.html = self.render(view)
+            self.view = view
+            self.body = json.dumps({"html": self.html}).encode()
+            self.key = key
+            self.version += 1
+            return True
+
+    def current(self):
+        """Versión, vista y HTML coherentes entre sí"""
+        with self.lock:
+            return self.version, self.view, self.html
+
+    def get(self):
+        self.refresh()
+        return self.body
+
+
+class MetricsStream:
+    """Fan-out de Server-Sent Events: cada cambio se serializa una sola vez y se comparte entre todos los clientes"""
+
+    def __init__(self, snapshot, poll_interval=0.5, keepalive=15, backlog=256):
+        self.snapshot = snapshot
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.frames = deque(maxlen=backlog)
+        self.full_frame = None
+        self.seq = 0
+        # Los ids llevan un token del proceso: con varios workers (o tras un reinicio) una reconexión puede
+        # llegar a otro proceso, cuyo contador no tiene relación con el del cliente
+        self.token = secrets.token_hex(4)
+        self.condition = threading.Condition()
+        self.async_waiters = set()
+        self.watcher = None
+
+    def frame(self, event, payload):
+        data = json.dumps(payload, separators=(',', ':'))
+        return f"id: {self.token}-{self.seq}\nevent: {event}\ndata: {data}\n\n".encode()
+
+    def publish(self, previous_view, view, html):
+        """Construye el frame del cambio (delta o snapshot si cambió la estructura) y despierta a los clientes"""
+        changed = None
+        if previous_view is not None and previous_view.structure == view.structure:
+            changed = {name: value for name, value in view.values.items() if previous_view.values.get(name) != value}
+            if not changed:
+                return
+        with self.condition:
+            self.seq += 1
+            self.full_frame = self.frame("snapshot", {"html": html})
+            self.frames.append((self.seq, self.frame("delta", changed) if changed else self.full_frame))
+            self.condition.notify_all()
+            waiters = list(self.async_waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def watch(self):
+        # Se compara la versión: /api/metrics también puede haber regenerado el snapshot
+        published_version = None
+        previous_view = None
+        while True:
+            try:
+                self.snapshot.refresh()
+                version, view, html = self.snapshot.current()
+                if version != published_version:
+                    self.publish(previous_view, view, html)
+                    published_version, previous_view = version, view
+            except Exception as e:
+                print(f"Error actualizando métricas: {e}")
+            time.sleep(self.poll_interval)
+
+    def start(self):
+        with self.condition:
+            if self.watcher is None:
+                self.snapshot.refresh()
+                self.watcher = threading.Thread(target=self.watch, name="metrics-stream", daemon=True)
+                self.watcher.start()
+                # Esperar el primer snapshot para no enviar un stream vacío
+                self.condition.wait_for(lambda: self.full_frame is not None, timeout=5)
+
+    def parse_event_id(self, value):
+        """Secuencia de un Last-Event-ID emitido por este proceso; None si es de otro (o no es válido)"""
+        token, _, seq = (value or "").partition("-")
+        return int(seq) if token == self.token and seq.isdigit() else None
+
+    def resume(self, last_event_id):
+        """Retoma desde Last-Event-ID si sigue en el backlog; si no, el cliente recibe el snapshot completo"""
+        with self.condition:
+            if last_event_id is not None and self.frames and self.frames[0][0] <= last_event_id + 1 and last_event_id <= self.seq:
+                return last_event_id, None
+            return self.seq, self.full_frame
+
+    def pending(self, last):
+        """Frames posteriores a `last` (None si no hay) y nuevo último id"""
+        with self.condition:
+            if self.seq <= last:
+                return None, last
+            return b"".join(frame for seq, frame in self.frames if seq > last), self.seq
+
+    def events(self, last_event_id=None):
+        """Generador por cliente (un hilo por conexión en el servidor WSGI)"""
+        self.start()
+        last, initial = self.resume(last_event_id)
+        if initial:
+            yield initial
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.seq > last, timeout=self.keepalive)
+            data, last = self.pending(last)
+            yield data or b": keepalive\n\n"
+
+    async def async_events(self, last_event_id=None):
+        """Generador por cliente en el servidor ASGI: una corrutina por conexión, sin hilo dedicado"""
+        await asyncio.get_running_loop().run_in_executor(None, self.start)
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.condition:
+            self.async_waiters.add(waiter)
+        try:
+            last, initial = self.resume(last_event_id)
+            if initial:
+                yield initial
+            while True:
+                try:
+                    await asyncio.wait_for(event.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+                data, last = self.pending(last)
+                yield data or b": keepalive\n\n"
+        finally:
+            with self.condition:
+                self.async_waiters.discard(waiter)
+
+
+class ResponseEncoder:
+    """ETag fuerte por contenido, 304 y compresión gzip/brotli; los cuerpos comprimidos se reutilizan entre clientes"""
+
+    COMPRESSIBLE = ("text/html", "text/plain", "text/css", "application/json", "application/javascript")
+
+    def __init__(self, min_size=512, cache_size=256):
+        self.min_size = min_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def choose_encoding(self, accept_encodings):
+        if brotli is not None and accept_encodings["br"]:
+            return "br"
+        if accept_encodings["gzip"]:
+            return "gzip"
+        return None
+
+    def compress(self, digest, encoding, body):
+        key = (digest, encoding)
+        with self.lock:
+            data = self.cache.get(key)
+            if data is not None:
+                self.cache.move_to_end(key)
+                return data
+        data = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, compresslevel=6, mtime=0)
+        with self.lock:
+            self.cache[key] = data
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return data
+
+    def process(self, response):
+        if (request.method not in ("GET", "HEAD") or response.status_code != 200 or response.direct_passthrough
+                or response.is_streamed or response.mimetype not in self.COMPRESSIBLE):
+            return response
+        body = response.get_data()
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        encoding = self.choose_encoding(request.accept_encodings) if len(body) >= self.min_size else None
+        # La ETag distingue cada codificación; el 304 vale para cualquiera del mismo contenido
+        etag = f"{digest}-{encoding}" if encoding else digest
+        response.vary.add("Accept-Encoding")
+        response.headers.setdefault("Cache-Control", "no-cache")
+        client_tags = request.if_none_match
+        if client_tags.star_tag or any(tag.split("-")[0] == digest for tag in client_tags.as_set(include_weak=True)):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            for header in ("Cache-Control", "Vary"):
+                not_modified.headers[header] = response.headers[header]
+            return not_modified
+        response.set_etag(etag)
+        if encoding:
+            response.set_data(self.compress(digest, encoding, body))
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+
+response_encoder = ResponseEncoder()
+
+@app.after_request
+def encode_response(response):
+    return response_encoder.process(response)
+
+
 @app.route("/api/metrics")
 def get_metrics():
+    return Response(metrics_snapshot.get(), mimetype="application/json")
+
+
+@app.route("/api/stream")
+def stream_metrics():
+    last_event_id = metrics_stream.parse_event_id(request.headers.get("Last-Event-ID"))
+    return Response(metrics_stream.events(last_event_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/series")
+def get_series():
+    stream = request.args.get("stream")
+    metric = request.args.get("metric")
+    if not stream or not metric:
+        return jsonify({"series": list_series(SERIES_DIR)})
+    
+    try:
+        # from/to en epoch (segundos); por defecto la última hora
+        end = float(request.args.get("to", time.time()))
+        start = float(request.args.get("from", end - 3600))
+        points = min(max(int(request.args.get("points", 500)), 3), MAX_SERIES_POINTS)
+    except ValueError:
+        return jsonify({"error": "from, to y points deben ser numéricos"}), 400
+    method = request.args.get("method", METHOD_LTTB)
+    if method not in (METHOD_LTTB, METHOD_MINMAX):
+        return jsonify({"error": f"method debe ser {METHOD_LTTB} o {METHOD_MINMAX}"}), 400
+    
+    response = jsonify(query_series(SERIES_DIR, stream, metric, start, end, points, method))
+    # Las series son append-only con timestamps no decrecientes: un rango ya cerrado no cambia
+    if "to" in request.args and end < time.time() - SERIES_CLOSED_AFTER_S:
+        response.headers["Cache-Control"] = "public, max-age=86400"
+    return response
+
+
+@app.route("/api/history")
+def get_history():
+    name = request.args.get("analyzer", "")
+    if name not in HISTORY_DIRS:
+        return jsonify({"error": f"analyzer debe ser uno de: {', '.join(HISTORY_DIRS)}"}), 400
+    try:
+        # from/to en epoch (segundos); por defecto la última hora
+        end = float(request.args.get("to", time.time()))
+        start = float(request.args.get("from", end - 3600))
+        limit = min(max(int(request.args.get("limit", 1000)), 1), MAX_HISTORY_RECORDS)
+    except ValueError:
+        return jsonify({"error": "from, to y limit deben ser numéricos"}), 400
+    fields = [field for field in request.args.get("fields", "").split(",") if field]
+    
+    # Solo se leen las particiones y los bytes del rango (índice disperso + mmap)
+    records = []
+    truncated = False
+    for timestamp, record in query_history(HISTORY_DIRS[name], name, start, end):
+        if len(records) == limit:
+            truncated = True
+            break
+        records.append({"t": timestamp, "record": project(record, fields) if fields else record})
+    
+    response = jsonify({"analyzer": name, "from": start, "to": end, "count": len(records),
+                        "truncated": truncated, "records": records})
+    if "to" in request.args and end < time.time() - SERIES_CLOSED_AFTER_S:
+        response.headers["Cache-Control"] = "public, max-age=86400"
+    return response
+
+# Una conexión de solo lectura por hilo del servidor
+summary_connections = threading.local()
+
+def summary_connection():
+    conn = getattr(summary_connections, "conn", None)
+    if conn is None:
+        conn = summary_connections.conn = open_readonly(SUMMARY_DB)
+    return conn
+
+def streams_page():
+    """Página de la tabla resumen según los parámetros de la petición (ValueError si son inválidos)"""
+    conn = summary_connection()
+    if conn is None:
+        return None
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = min(max(int(request.args.get("per_page", 50)), 1), MAX_STREAMS_PER_PAGE)
+    except ValueError:
+        raise ValueError("page y per_page deben ser enteros")
+    return query_summaries(conn,
+                           sort=request.args.get("sort", "health_score"),
+                           descending=request.args.get("order", "asc") == "desc",
+                           search=request.args.get("q") or None,
+                           status=request.args.get("status") or None,
+                           page=page, per_page=per_page)
+
+@app.route("/api/streams")
+def get_streams():
+    try:
+        result = streams_page()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if result is None:
+        return jsonify({"total": 0, "streams": []})
+    return jsonify(result)
+
+STATUS_CLASSES = {"excellent": "status-ok", "good": "status-ok", "fair": "status-warning",
+                  "critical": "status-error", "nodata": "status-warning"}
+
+def format_age(seconds):
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+@app.route("/streams")
+def streams_overview():
+    try:
+        result = streams_page()
+    except ValueError as e:
+        return f"<p>Parámetros inválidos: {html_lib.escape(str(e))}</p>", 400
+    result = result or {"total": 0, "page": 1, "pages": 0, "per_page": 50, "sort": "health_score",
+                        "order": "asc", "streams": []}
+    
+    def link(**changes):
+        params = request.args.to_dict()
+        params.update(changes)
+        return html_lib.escape("/streams?" + urlencode(params))
+    
+    headers = [("stream", "Stream"), ("health_score", "Health"), ("confidence", "Confianza"),
+               ("latency_p95_ms", "Latencia p95"), ("measured_bitrate_bps", "Bitrate medido"),
+               ("updated_at", "Actualizado")]
+    header_html = ""
+    for column, title in headers:
+        order = "desc" if result["sort"] == column and result["order"] == "asc" else "asc"
+        arrow = ("▲" if result["order"] == "asc" else "▼") if result["sort"] == column else ""
+        header_html += f'<th><a href="{link(sort=column, order=order, page=1)}">{title} {arrow}</a></th>'
+    
+    rows_html = []
+    for item in result["streams"]:
+        rows_html.append(
+            f'<tr class="{STATUS_CLASSES[item["status"]]}">'
+            f'<td title="{html_lib.escape(item["manifest_url"])}">{html_lib.escape(item["stream"])}</td>'
+            f'<td>{fmt(item["health_score"])}</td>'
+            f'<td>{fmt(item["confidence"], ".2f")}</td>'
+            f'<td>{fmt(item["latency_p95_ms"], ".1f")} ms</td>'
+            f'<td>{fmt(item["measured_bitrate_bps"], ".1f", 1000)} kbps</td>'
+            f'<td>hace {format_age(item["age_s"])}</td></tr>')
+    
+    status_options = "".join(
+        f'<option value="{status}"{" selected" if request.args.get("status") == status else ""}>{status}</option>'
+        for status in STATUS_FILTERS)
+    pager = f'Página {result["page"]} de {max(result["pages"], 1)} ({result["total"]} streams)'
+    if result["page"] > 1:
+        pager = f'<a href="{link(page=result["page"] - 1)}">« Anterior</a> ' + pager
+    if result["page"] < result["pages"]:
+        pager += f' <a href="{link(page=result["page"] + 1)}">Siguiente »</a>'
+    
+    return f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Streams - Streaming Quality Monitor</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; margin: 20px; }}
+        table {{ border-collapse: collapse; width: 100%; }}
+        th, td {{ border: 1px solid #ddd; padding: 6px 10px; text-align: left; }}
+        .status-ok {{ background-color: #d4edda; }}
+        .status-error {{ background-color: #f8d7da; }}
+        .status-warning {{ background-color: #fff3cd; }}
+    </style>
+</head>
+<body>
+    <h1>Streams</h1>
+    <form method="get" action="/streams">
+        <input type="hidden" name="sort" value="{html_lib.escape(result["sort"])}">
+        <input type="hidden" name="order" value="{result["order"]}">
+        <input type="text" name="q" placeholder="Buscar stream" value="{html_lib.escape(request.args.get("q", ""))}">
+        <select name="status"><option value="">Todos</option>{status_options}</select>
+        <button type="submit">Filtrar</button>
+    </form>
+    <p>{pager}</p>
+    <table>
+        <tr>{header_html}</tr>
+        {"".join(rows_html)}
+    </table>
+</body>
+</html>
+"""
+
+def read_last_record(path, block=64 * 1024):
+    """Último registro completo de un archivo JSONL, leyendo solo desde el final"""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            tail = f.read(end - start) + tail
+            end = start
+            # Una línea a medio escribir (sin '\n' final) se ignora
+            lines = tail[:tail.rfind(b"\n") + 1].splitlines()
+            if len(lines) > 1 or (lines and start == 0):
+                return json.loads(lines[-1])
+    return None
+
+def render_metrics(view):
     try:
         # Intentar leer datos de la suite de análisis primero
-        suite_data_file = "/app/stream_analysis/dashboard_data.json"
+        suite_data_file = SUITE_DATA_FILE
         if os.path.exists(suite_data_file):
             with open(suite_data_file, "r") as f:
                 suite_data = json.load(f)
             
             # Determinar estado basado en health score
-            health_score = suite_data.get('overall_health', 0)
-            if health_score >= 0.8:
+            health_score = suite_data.get('overall_health')
+            confidence = suite_data.get('health_confidence', 1.0)
+            if health_score is None:
+                status_class = "status-warning"
+                status_text = "SIN DATOS"
+            elif health_score >= 0.8:
                 status_class = "status-ok"
                 status_text = "EXCELENTE"
             elif health_score >= 0.6:
@@ -68,61 +667,63 @@ def get_metrics():
                 status_class = "status-error"
                 status_text = "CRÍTICO"
             
+            view.block("suite")
             html = f"""
-            <div class="metric-card {status_class}">
-                <h3>Estado del Stream - {status_text}</h3>
-                <p><strong>Health Score:</strong> {health_score:.3f}</p>
-                <p><strong>Última actualización:</strong> {suite_data.get('timestamp', 'N/A')}</p>
-                <p><strong>Duración de sesión:</strong> {suite_data.get('session_duration', 0):.1f}s</p>
+            <div {view.attr('status_class', 'class', f'metric-card {status_class}')}>
+                <h3>Estado del Stream - {view.text('status_text', status_text)}</h3>
+                <p><strong>Health Score:</strong> {view.text('health_score', fmt(health_score))} (confianza {view.text('health_confidence', fmt(confidence, '.2f'))})</p>
+                <p><strong>Última actualización:</strong> {view.text('timestamp', suite_data.get('timestamp', 'N/A'))}</p>
+                <p><strong>Duración de sesión:</strong> {view.text('session_duration', fmt(suite_data.get('session_duration', 0), '.1f'))}s</p>
             </div>
             """
             
             # Métricas de calidad
-            quality_score = suite_data.get('quality_score', 0)
-            avg_bitrate = suite_data.get('avg_bitrate', 0)
-            avg_ssim = suite_data.get('avg_ssim', 0)
+            quality_score = suite_data.get('quality_score')
+            avg_bitrate = suite_data.get('avg_bitrate')
+            avg_ssim = suite_data.get('avg_ssim')
             
             html += f"""
             <div class="metric-card status-ok">
                 <h3>Métricas de Calidad</h3>
-                <p><strong>Quality Score:</strong> {quality_score:.3f}</p>
-                <p><strong>Bitrate promedio:</strong> {avg_bitrate/1000:.1f} kbps</p>
-                <p><strong>SSIM promedio:</strong> {avg_ssim:.4f}</p>
+                <p><strong>Quality Score:</strong> {view.text('quality_score', fmt(quality_score))}</p>
+                <p><strong>Bitrate promedio:</strong> {view.text('avg_bitrate', fmt(avg_bitrate, '.1f', 1000))} kbps</p>
+                <p><strong>SSIM promedio:</strong> {view.text('avg_ssim', fmt(avg_ssim, '.4f'))}</p>
             </div>
             """
             
             # Métricas de latencia
-            latency_score = suite_data.get('latency_score', 0)
-            avg_latency = suite_data.get('avg_latency_ms', 0)
+            latency_score = suite_data.get('latency_score')
+            avg_latency = suite_data.get('avg_latency_ms')
             
             html += f"""
             <div class="metric-card status-ok">
                 <h3>Métricas de Latencia</h3>
-                <p><strong>Latency Score:</strong> {latency_score:.3f}</p>
-                <p><strong>Latencia promedio:</strong> {avg_latency:.1f} ms</p>
+                <p><strong>Latency Score:</strong> {view.text('latency_score', fmt(latency_score))}</p>
+                <p><strong>Latencia promedio:</strong> {view.text('avg_latency', fmt(avg_latency, '.1f'))} ms</p>
             </div>
             """
             
             # Métricas de adaptación
-            adaptation_score = suite_data.get('adaptation_score', 0)
-            stability_score = suite_data.get('stability_score', 0)
+            adaptation_score = suite_data.get('adaptation_score')
+            stability_score = suite_data.get('stability_score')
             switching_events = suite_data.get('switching_events', 0)
             
             html += f"""
             <div class="metric-card status-ok">
                 <h3>Métricas de Adaptación</h3>
-                <p><strong>Adaptation Score:</strong> {adaptation_score:.3f}</p>
-                <p><strong>Estabilidad:</strong> {stability_score:.3f}</p>
-                <p><strong>Eventos de switching:</strong> {switching_events}</p>
+                <p><strong>Adaptation Score:</strong> {view.text('adaptation_score', fmt(adaptation_score))}</p>
+                <p><strong>Estabilidad:</strong> {view.text('stability_score', fmt(stability_score))}</p>
+                <p><strong>Eventos de switching:</strong> {view.text('switching_events', switching_events)}</p>
             </div>
             """
             
             # Recomendaciones
             recommendations = suite_data.get('recommendations', [])
             if recommendations:
+                view.block("recommendations", *recommendations)
                 rec_html = ""
                 for rec in recommendations:
-                    rec_html += f"<p>• {rec}</p>"
+                    rec_html += f"<p>• {html_lib.escape(rec)}</p>"
                 
                 html += f"""
                 <div class="metric-card status-warning">
@@ -141,19 +742,22 @@ def get_metrics():
             # </div>
             # """
             
-            html += """
+            # El renderizador reemplaza el PNG de forma atómica; usar su mtime permite cachearlo en el navegador
+            chart_path = CHART_FILE
+            chart_version = int(os.path.getmtime(chart_path)) if os.path.exists(chart_path) else 0
+            html += f"""
             <div class="metric-card status-ok">
                 <h3>Gráfico de Adaptación de Bitrate</h3>
-                <img src="/adaptation/bitrate_adaptation.png?ts={}" alt="Bitrate Adaptation" style="max-width:100%;">
+                <img {view.attr('chart_src', 'src', f'/adaptation/bitrate_adaptation.png?ts={chart_version}')} alt="Bitrate Adaptation" style="max-width:100%;">
             </div>
-            """.format(int(datetime.now().timestamp()))
-
-            return jsonify({"html": html})
+            """
+            
+            return html
         
         # Fallback a datos del monitor básico
-        if not os.path.exists("/app/logs/stream_quality.json"):
-            return jsonify({
-                "html": """
+        if not os.path.exists(MONITOR_DATA_FILE):
+            view.block("waiting")
+            return """
                 <div class="metric-card status-warning">
                     <h3>Estado del Sistema</h3>
                     <p><strong>Estado:</strong> Esperando datos del monitor</p>
@@ -162,24 +766,19 @@ def get_metrics():
                     <p><strong>Sugerencia:</strong> Ejecutar suite de análisis para métricas avanzadas</p>
                 </div>
                 """
-            })
         
-        with open("/app/logs/stream_quality.json", "r") as f:
-            data = json.load(f)
+        latest = read_last_record(MONITOR_DATA_FILE)
         
-        if not data:
-            return jsonify({
-                "html": """
+        if not latest:
+            view.block("empty")
+            return """
                 <div class="metric-card status-warning">
                     <h3>Estado del Sistema</h3>
                     <p><strong>Estado:</strong> Sin datos de monitoreo</p>
-                    <p><strong>Archivo:</strong> stream_quality.json está vacío</p>
+                    <p><strong>Archivo:</strong> stream_quality.jsonl está vacío</p>
                     <p><strong>Acción:</strong> Verificar que el stream esté activo</p>
                 </div>
                 """
-            })
-        
-        latest = data[-1]
         
         # Determinar el estado basado en los datos
         status_class = "status-ok"
@@ -191,34 +790,37 @@ def get_metrics():
                 status_class = "status-error"
                 status_text = "ERROR"
         
+        view.block("monitor")
         html = f"""
-        <div class="metric-card {status_class}">
-            <h3>Estado del Stream - {status_text}</h3>
-            <p><strong>Última verificación:</strong> {latest.get("timestamp", "N/A")}</p>
-            <p><strong>Estado de red:</strong> {latest.get("network_info", {}).get("status", "N/A")}</p>
-            <p><strong>Tiempo de respuesta:</strong> {latest.get("network_info", {}).get("response_time", "N/A")}s</p>
+        <div {view.attr('status_class', 'class', f'metric-card {status_class}')}>
+            <h3>Estado del Stream - {view.text('status_text', status_text)}</h3>
+            <p><strong>Última verificación:</strong> {view.text('timestamp', latest.get("timestamp", "N/A"))}</p>
+            <p><strong>Estado de red:</strong> {view.text('network_status', latest.get("network_info", {}).get("status", "N/A"))}</p>
+            <p><strong>Tiempo de respuesta:</strong> {view.text('response_time', latest.get("network_info", {}).get("response_time", "N/A"))}s</p>
         </div>
         """
         
         if "manifest_info" in latest:
+            view.block("manifest_info")
             manifest = latest["manifest_info"]
             html += f"""
             <div class="metric-card status-ok">
                 <h3>Información del Manifest</h3>
-                <p><strong>Tipo:</strong> {manifest.get("type", "N/A")}</p>
-                <p><strong>Streams de video:</strong> {manifest.get("video_streams", "N/A")}</p>
-                <p><strong>Streams de audio:</strong> {manifest.get("audio_streams", "N/A")}</p>
+                <p><strong>Tipo:</strong> {view.text('manifest_type', manifest.get("type", "N/A"))}</p>
+                <p><strong>Streams de video:</strong> {view.text('video_streams', manifest.get("video_streams", "N/A"))}</p>
+                <p><strong>Streams de audio:</strong> {view.text('audio_streams', manifest.get("audio_streams", "N/A"))}</p>
             </div>
             """
         
         if "bitrate_stats" in latest:
+            view.block("bitrate_stats")
             stats = latest["bitrate_stats"]
             html += f"""
             <div class="metric-card status-ok">
                 <h3>Estadísticas de Bitrate</h3>
-                <p><strong>Mínimo:</strong> {stats.get("min", "N/A")} bps</p>
-                <p><strong>Máximo:</strong> {stats.get("max", "N/A")} bps</p>
-                <p><strong>Promedio:</strong> {stats.get("avg", "N/A"):.0f} bps</p>
+                <p><strong>Mínimo:</strong> {view.text('bitrate_min', stats.get("min", "N/A"))} bps</p>
+                <p><strong>Máximo:</strong> {view.text('bitrate_max', stats.get("max", "N/A"))} bps</p>
+                <p><strong>Promedio:</strong> {view.text('bitrate_avg', fmt(stats.get("avg"), '.0f'))} bps</p>
             </div>
             """
         
@@ -233,26 +835,98 @@ def get_metrics():
         # </div>
         # """
         
-        return jsonify({"html": html})
-        
+        return html
+
     except Exception as e:
-        return jsonify({
-            "html": f"""
+        view.block("error", str(e))
+        return f"""
             <div class="metric-card status-error">
                 <h3>Error del Sistema</h3>
-                <p><strong>Error:</strong> {str(e)}</p>
-                <p><strong>Archivo:</strong> /app/logs/stream_quality.json</p>
+                <p><strong>Error:</strong> {html_lib.escape(str(e))}</p>
+                <p><strong>Archivo:</strong> {MONITOR_DATA_FILE}</p>
                 <p><strong>Acción:</strong> Verificar logs del contenedor</p>
             </div>
             """
-        })
+
+metrics_snapshot = MetricsSnapshot([SUITE_DATA_FILE, CHART_FILE, MONITOR_DATA_FILE], render_metrics)
+metrics_stream = MetricsStream(metrics_snapshot)
 
 @app.route("/adaptation/bitrate_adaptation.png")
 def adaptation_plot():
-    path = "/app/stream_analysis/adaptation/bitrate_adaptation.png"
+    path = CHART_FILE
     if os.path.exists(path):
-        return send_file(path, mimetype="image/png")
+        response = send_file(path, mimetype="image/png", conditional=True)
+        # La URL versionada (?ts=mtime) no cambia de contenido; sin versión hay que revalidar
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if request.args.get("ts") else "no-cache"
+        return response
     return "No plot available", 404
 
+
+if uvicorn is not None:
+    class DashboardWsgiInstance(WsgiToAsgiInstance):
+        # thread_sensitive=True (el valor por defecto) ejecutaría todas las peticiones en un único hilo
+        run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, thread_sensitive=False)
+
+    class DashboardWsgiToAsgi(WsgiToAsgi):
+        async def __call__(self, scope, receive, send):
+            await DashboardWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+    wsgi_asgi_app = DashboardWsgiToAsgi(app)
+
+    async def wait_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def stream_metrics_asgi(scope, receive, send):
+        """/api/stream nativo en ASGI: los clientes SSE no ocupan hilos del pool WSGI"""
+        headers = dict(scope["headers"])
+        last_event_id = metrics_stream.parse_event_id(headers.get(b"last-event-id", b"").decode())
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        events = metrics_stream.async_events(last_event_id)
+        try:
+            async for chunk in events:
+                if disconnected.done():
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            disconnected.cancel()
+            await events.aclose()
+
+    async def asgi_app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] == "http" and scope["path"] == "/api/stream":
+            await stream_metrics_asgi(scope, receive, send)
+        else:
+            await wsgi_asgi_app(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard del monitor de calidad de streaming")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("DASHBOARD_WORKERS", os.cpu_count() or 1)),
+                        help="Procesos del servidor ASGI (por defecto $DASHBOARD_WORKERS o núcleos disponibles)")
+    parser.add_argument("--wsgi", action="store_true", help="Usa el servidor WSGI de Flask (un proceso, un hilo por petición)")
+    args = parser.parse_args()
+    
+    if args.wsgi or uvicorn is None:
+        if not args.wsgi:
+            print("⚠️  uvicorn/asgiref no disponibles, usando el servidor WSGI de Flask")
+        app.run(host=args.host, port=args.port, threaded=True)
+        return
+    
+    print(f"✓ Dashboard ASGI en {args.host}:{args.port} con {args.workers} procesos")
+    uvicorn.run("dashboard:asgi_app", host=args.host, port=args.port, workers=args.workers,
+                app_dir=os.path.dirname(os.path.abspath(__file__)), log_level="warning")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8081, debug=True) 
\ No newline at end of file
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+ABR Simulator - Simula algoritmos ABR (throughput, BOLA, híbrido) sobre trazas de throughput medidas
+Uso: python3 abr_simulator.py <latency_analysis.json> [options]
+"""
+
+import argparse
+import itertools
+import json
+import os
+
+import numpy as np
+
+import stream_analisys_common as common
+
+RULE_THROUGHPUT = 'throughput'
+RULE_BOLA = 'bola'
+RULE_HYBRID = 'hybrid'
+RULES = (RULE_THROUGHPUT, RULE_BOLA, RULE_HYBRID)
+
+# Parámetros por defecto de las reglas (valores similares a dash.js)
+DEFAULT_PARAMS = {
+    'safety_factor': 0.9,       # Fracción del throughput estimado que se usa
+    'ewma_alpha': 0.3,          # Peso de la última muestra en la estimación de throughput
+    'buffer_target': 12.0,      # Buffer máximo del cliente en segundos
+    'bola_gamma': 5.0,          # Parámetro gamma*p de BOLA (en segmentos)
+    'hybrid_threshold': 10.0,   # Buffer (s) a partir del cual el híbrido usa BOLA
+}
+
+
+class AbrState:
+    """Estado vectorizado de P clientes ABR simulados en paralelo (uno por combinación de parámetros)"""
+
+    def __init__(self, ladder, segment_duration, rule=RULE_HYBRID, **params):
+        if rule not in RULES:
+            raise ValueError(f"Regla ABR desconocida: {rule}")
+        self.ladder = np.sort(np.asarray(ladder, dtype=np.float64))
+        if self.ladder.size == 0:
+            raise ValueError("La escalera de bitrates está vacía")
+        self.segment_duration = float(segment_duration)
+        self.rule = rule
+
+        values = dict(DEFAULT_PARAMS)
+        values.update({k: v for k, v in params.items() if v is not None})
+        arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(values[k], dtype=np.float64)) for k in DEFAULT_PARAMS])
+        self.params = {k: a.copy() for k, a in zip(DEFAULT_PARAMS, arrays)}
+        self.size = arrays[0].size
+
+        # Utilidades de BOLA: v_m = ln(S_m / S_1)
+        self._utilities = np.log(self.ladder / self.ladder[0])
+        buffer_segments = np.maximum(self.params['buffer_target'] / self.segment_duration, 2.0)
+        self._bola_v = (buffer_segments - 1.0) / (self._utilities[-1] + self.params['bola_gamma'])
+
+        self.reset()
+
+    def reset(self):
+        """Reinicia el estado de reproducción de todos los clientes"""
+        self.estimate = np.full(self.size, np.nan)
+        self.buffer_level = np.zeros(self.size)
+        self.quality = np.zeros(self.size, dtype=np.int16)
+        self.switch_count = np.zeros(self.size, dtype=np.int64)
+        self.stall_time = np.zeros(self.size)
+        self.stall_events = np.zeros(self.size, dtype=np.int64)
+        self.bits_played = np.zeros(self.size)
+        self.segments = 0
+
+    def _throughput_choice(self):
+        estimate = np.nan_to_num(self.estimate, nan=0.0)
+        idx = np.searchsorted(self.ladder, self.params['safety_factor'] * estimate, side='right') - 1
+        return np.clip(idx, 0, self.ladder.size - 1)
+
+    def _bola_choice(self):
+        buffer_segments = self.buffer_level / self.segment_duration
+        v = self._bola_v[:, None]
+        scores = (v * (self._utilities[None, :] + self.params['bola_gamma'][:, None]) - buffer_segments[:, None]) / self.ladder[None, :]
+        return np.argmax(scores, axis=1)
+
+    def choose(self):
+        """Calcula la representación elegida para el próximo segmento"""
+        if self.rule == RULE_THROUGHPUT:
+            return self._throughput_choice()
+        if self.rule == RULE_BOLA:
+            return self._bola_choice()
+        use_bola = self.buffer_level >= self.params['hybrid_threshold']
+        return np.where(use_bola, self._bola_choice(), self._throughput_choice())
+
+    def step(self, throughput_bps):
+        """Descarga un segmento con el throughput medido y actualiza buffer, stalls y switches"""
+        throughput_bps = max(float(throughput_bps), 1.0)
+        quality = self.choose().astype(np.int16)
+        if self.segments:
+            self.switch_count += quality != self.quality
+        self.quality = quality
+
+        bits = self.ladder[quality] * self.segment_duration
+        download_time = bits / throughput_bps
+        stall = np.maximum(download_time - self.buffer_level, 0.0)
+        if self.segments:
+            # El arranque inicial no se contabiliza como stall
+            self.stall_time += stall
+            self.stall_events += stall > 0
+        self.buffer_level = np.minimum(
+            np.maximum(self.buffer_level - download_time, 0.0) + self.segment_duration,
+            np.maximum(self.params['buffer_target'], self.segment_duration)
+        )
+        self.bits_played += bits
+
+        alpha = self.params['ewma_alpha']
+        self.estimate = np.where(np.isnan(self.estimate), throughput_bps,
+                                 alpha * throughput_bps + (1.0 - alpha) * self.estimate)
+        self.segments += 1
+        return quality
+
+    def summary(self):
+        """Resumen por cliente: bitrate medio, switches y stalls"""
+        played = max(self.segments, 1) * self.segment_duration
+        return {
+            'avg_bitrate': self.bits_played / played,
+            'switch_count': self.switch_count.copy(),
+            'stall_time': self.stall_time.copy(),
+            'stall_events': self.stall_events.copy(),
+            'buffer_level': self.buffer_level.copy(),
+        }
+
+
+def simulate(ladder, segment_duration, throughputs, rule=RULE_HYBRID, keep_history=False, **params):
+    """Simulación offline: reproduce una traza de throughput (bps por segmento) para todas las combinaciones de parámetros"""
+    state = AbrState(ladder, segment_duration, rule, **params)
+    throughputs = np.asarray(throughputs, dtype=np.float64)
+    history = np.empty((state.size, throughputs.size), dtype=np.int16) if keep_history else None
+
+    for t, throughput in enumerate(throughputs):
+        quality = state.step(throughput)
+        if keep_history:
+            history[:, t] = quality
+
+    result = state.summary()
+    result['params'] = state.params
+    result['ladder'] = state.ladder
+    if keep_history:
+        result['selected_bitrates'] = state.ladder[history]
+    return result
+
+
+def parameter_grid(**values):
+    """Expande listas de valores a arrays planos con todas las combinaciones"""
+    keys = list(values)
+    combos = list(itertools.product(*[np.atleast_1d(values[k]) for k in keys]))
+    return {k: np.array([c[i] for c in combos], dtype=np.float64) for i, k in enumerate(keys)}
+
+
+class OnlineAbrSimulator:
+    """Simulador online: un cliente por regla alimentado con el throughput medido en cada tick"""
+
+    def __init__(self, segment_duration, rules=RULES, **params):
+        self.segment_duration = segment_duration
+        self.rules = rules
+        self.params = params
+        self.ladder = None
+        self.states = {}
+
+    def update_ladder(self, ladder):
+        """Reinicia los clientes si la escalera de bitrates cambió"""
+        ladder = sorted(ladder)
+        if ladder != self.ladder:
+            self.ladder = ladder
+            self.states = {rule: AbrState(ladder, self.segment_duration, rule, **self.params) for rule in self.rules}
+
+    def next_bitrate(self, rule=RULE_HYBRID):
+        """Bitrate que el cliente elegiría para el próximo segmento"""
+        state = self.states.get(rule)
+        if state is None:
+            return None
+        return float(state.ladder[state.choose()[0]])
+
+    def step(self, throughput_bps):
+        """Avanza un segmento en todos los clientes y devuelve su estado"""
+        result = {}
+        for rule, state in self.states.items():
+            quality = state.step(throughput_bps)[0]
+            result[rule] = {
+                'selected_bitrate': float(state.ladder[quality]),
+                'buffer_level': float(state.buffer_level[0]),
+                'switch_count': int(state.switch_count[0]),
+                'stall_time': float(state.stall_time[0]),
+                'stall_events': int(state.stall_events[0]),
+            }
+        return result
+
+
+def load_latency_trace(path):
+    """Extrae el throughput por segmento (bps) de un latency_analysis.json"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    throughputs = []
+    for analysis in data:
+        for seg in analysis.get('segment_latencies', []):
+            if seg.get('status') == 'success' and seg.get('latency_ms') and seg.get('content_length'):
+                throughputs.append(seg['content_length'] * 8 / (seg['latency_ms'] / 1000))
+    return np.array(throughputs, dtype=np.float64)
+
+
+def parse_float_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simula algoritmos ABR sobre trazas de throughput medidas')
+    parser.add_argument('trace', help='Traza de throughput (latency_analysis.json)')
+    parser.add_argument('--manifest', help='URL del manifest DASH para obtener la escalera de bitrates')
+    parser.add_argument('--ladder', type=parse_float_list, help='Escalera de bitrates en bps separada por comas')
+    parser.add_argument('-d', '--segment-duration', type=float, default=2.0, help='Duración de segmento en segundos')
+    parser.add_argument('-r', '--rule', choices=RULES, default=RULE_HYBRID, help='Regla ABR')
+    for name, default in DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=parse_float_list, default=[default],
+                            help=f'Valores separados por comas (default: {default})')
+    parser.add_argument('--top', type=int, default=10, help='Número de combinaciones a mostrar')
+    parser.add_argument('-o', '--output', help='Archivo JSON de salida con todos los resultados')
+
+    args = parser.parse_args()
+
+    if args.ladder:
+        ladder = args.ladder
+    elif args.manifest:
+        root, namespace = common.fetch_mpd_root(args.manifest)
+        ladder = common.extract_manifest_info(root, namespace)['bitrates']
+    else:
+        parser.error('Se requiere --ladder o --manifest')
+
+    throughputs = load_latency_trace(args.trace)
+    if throughputs.size == 0:
+        print(f"✗ La traza {args.trace} no contiene mediciones de segmentos")
+        return
+
+    grid = parameter_grid(**{name: getattr(args, name) for name in DEFAULT_PARAMS})
+    result = simulate(ladder, args.segment_duration, throughputs, args.rule, **grid)
+
+    # Ordenar por stalls (asc) y bitrate medio (desc)
+    order = np.lexsort((-result['avg_bitrate'], result['stall_time']))
+    print(f"=== Simulación ABR ({args.rule}) ===")
+    print(f"Segmentos simulados: {throughputs.size} ({throughputs.size * args.segment_duration / 3600:.2f} h)")
+    print(f"Combinaciones evaluadas: {order.size}")
+    for idx in order[:args.top]:
+        params = ', '.join(f"{k}={result['params'][k][idx]:g}" for k in DEFAULT_PARAMS)
+        print(f"  {params} → bitrate {result['avg_bitrate'][idx]/1000:.1f} kbps, "
+              f"switches {result['switch_count'][idx]}, stalls {result['stall_time'][idx]:.1f}s")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        rows = []
+        for idx in order:
+            row = {k: float(result['params'][k][idx]) for k in DEFAULT_PARAMS}
+            row.update({
+                'avg_bitrate': float(result['avg_bitrate'][idx]),
+                'switch_count': int(result['switch_count'][idx]),
+                'stall_time': float(result['stall_time'][idx]),
+                'stall_events': int(result['stall_events'][idx]),
+            })
+            rows.append(row)
+        with open(args.output, 'w') as f:
+            json.dump({'rule': args.rule, 'ladder': list(map(float, ladder)), 'results': rows}, f, indent=2)
+        print(f"✓ Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
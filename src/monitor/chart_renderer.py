@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Chart Renderer - Renderiza el gráfico de adaptación de bitrate en un proceso separado
+Recibe puntos y eventos por una cola y actualiza incrementalmente los artistas de matplotlib
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from collections import deque
+from datetime import datetime
+
+import profiling
+
+# Mensajes de la cola
+MSG_POINT = 'point'
+MSG_EVENT = 'event'
+
+
+class ChartRenderer:
+    """Lado del analizador: envía métricas al proceso renderizador sin bloquear"""
+
+    def __init__(self, chart_file, dpi=100, min_interval=10.0, max_points=100, max_events=10):
+        self.chart_file = chart_file
+        self.dpi = dpi
+        self.min_interval = min_interval
+        self.max_points = max_points
+        self.max_events = max_events
+        # 'spawn' evita hacer fork de un proceso con hilos de análisis activos
+        self.context = multiprocessing.get_context('spawn')
+        self.queue = self.context.Queue(maxsize=10000)
+        self.process = None
+
+    def start(self):
+        """Lanza el proceso renderizador"""
+        if self.process and self.process.is_alive():
+            return
+        self.process = self.context.Process(
+            target=render_loop,
+            args=(self.queue, self.chart_file, self.dpi, self.min_interval, self.max_points, self.max_events),
+            name='chart-renderer',
+            daemon=True
+        )
+        self.process.start()
+
+    def _send(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            pass  # Preferimos perder un punto antes que bloquear el análisis
+
+    def add_point(self, timestamp, bitrate):
+        """Agrega un punto (timestamp ISO, bitrate en bps)"""
+        self._send((MSG_POINT, timestamp, bitrate))
+
+    def add_event(self, timestamp, bitrate, direction):
+        """Agrega un evento de switching"""
+        self._send((MSG_EVENT, timestamp, bitrate, direction))
+
+    def stop(self, timeout=5):
+        """Detiene el renderizador tras volcar el último gráfico"""
+        process, self.process = self.process, None
+        if not process:
+            return
+        self._send(None)
+        process.join(timeout=timeout)
+        if process.is_alive():
+            process.terminate()
+
+
+class _BitrateChart:
+    """Figura con artistas cacheados que se actualizan en lugar de redibujarse desde cero"""
+
+    def __init__(self, dpi, max_points, max_events, bins=20):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.dates as mdates
+        import matplotlib.pyplot as plt
+        import numpy as np
+
+        self.np = np
+        self.mdates = mdates
+        self.dpi = dpi
+        self.bins = bins
+        self.times = deque(maxlen=max_points)
+        self.bitrates = deque(maxlen=max_points)
+        self.events = deque(maxlen=max_events)
+
+        self.figure, (self.ax_line, self.ax_hist) = plt.subplots(2, 1, figsize=(12, 8))
+        self.line, = self.ax_line.plot([], [], 'b-', linewidth=2, marker='o', markersize=4)
+        self.upgrades = self.ax_line.scatter([], [], color='green', s=100, zorder=5)
+        self.downgrades = self.ax_line.scatter([], [], color='red', s=100, zorder=5)
+        self.ax_line.xaxis_date()
+        self.ax_line.set_title('Adaptación de Bitrate a lo Largo del Tiempo')
+        self.ax_line.set_ylabel('Bitrate (kbps)')
+        self.ax_line.grid(True, alpha=0.3)
+
+        _, _, self.bars = self.ax_hist.hist([0], bins=bins, alpha=0.7, color='skyblue', edgecolor='black')
+        self.ax_hist.set_title('Distribución de Bitrates')
+        self.ax_hist.set_xlabel('Bitrate (kbps)')
+        self.ax_hist.set_ylabel('Frecuencia')
+        self.ax_hist.grid(True, alpha=0.3)
+        self.figure.tight_layout()
+
+    def add_point(self, timestamp, bitrate):
+        self.times.append(self.mdates.date2num(datetime.fromisoformat(timestamp)))
+        self.bitrates.append(bitrate / 1000)  # Convertir a kbps
+
+    def add_event(self, timestamp, bitrate, direction):
+        self.events.append((self.mdates.date2num(datetime.fromisoformat(timestamp)), bitrate / 1000, direction))
+
+    def _offsets(self, upgrade):
+        points = [(t, b) for t, b, d in self.events if (d == 'upgrade') == upgrade]
+        return self.np.array(points) if points else self.np.empty((0, 2))
+
+    def render(self, chart_file):
+        np = self.np
+        if not self.bitrates:
+            return
+
+        self.line.set_data(list(self.times), list(self.bitrates))
+        self.upgrades.set_offsets(self._offsets(True))
+        self.downgrades.set_offsets(self._offsets(False))
+        self.ax_line.relim()
+        self.ax_line.autoscale_view()
+
+        # Actualizar barras del histograma existentes en lugar de crear nuevas
+        counts, edges = np.histogram(np.fromiter(self.bitrates, dtype=float), bins=self.bins)
+        for bar, count, left, right in zip(self.bars, counts, edges[:-1], edges[1:]):
+            bar.set_x(left)
+            bar.set_width(right - left)
+            bar.set_height(count)
+        self.ax_hist.set_xlim(edges[0], edges[-1] if edges[-1] > edges[0] else edges[0] + 1)
+        self.ax_hist.set_ylim(0, max(1, counts.max()) * 1.05)
+
+        # Escritura atómica: el dashboard nunca lee un PNG a medio escribir
+        tmp_file = f"{chart_file}.tmp"
+        self.figure.savefig(tmp_file, format='png', dpi=self.dpi, bbox_inches='tight')
+        os.replace(tmp_file, chart_file)
+
+
+def render_loop(message_queue, chart_file, dpi, min_interval, max_points, max_events):
+    """Bucle del proceso renderizador: consume la cola y re-renderiza solo si hubo cambios"""
+    # La detención la controla el proceso padre enviando None
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    chart = _BitrateChart(dpi, max_points, max_events)
+    profile_path = os.path.join(os.path.dirname(chart_file) or '.', 'profile_stats.chart.json')
+    dirty = False
+    last_render = 0.0
+    running = True
+
+    while running:
+        timeout = max(0.1, min_interval - (time.time() - last_render)) if dirty else None
+        try:
+            message = message_queue.get(timeout=timeout)
+            if message is None:
+                running = False
+            elif message[0] == MSG_POINT:
+                chart.add_point(*message[1:])
+                dirty = True
+            elif message[0] == MSG_EVENT:
+                chart.add_event(*message[1:])
+                dirty = True
+        except queue.Empty:
+            pass
+        except (EOFError, OSError):
+            running = False
+
+        if dirty and (not running or time.time() - last_render >= min_interval):
+            try:
+                with profiling.span('chart.render'):
+                    chart.render(chart_file)
+                profiling.PROFILER.dump(profile_path)
+                print(f"✓ Gráfico guardado en {chart_file}")
+            except Exception as e:
+                print(f"Error generando gráfico: {e}")
+            dirty = False
+            last_render = time.time()
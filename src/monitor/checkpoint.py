@@ -0,0 +1,85 @@
+"""
+Checkpoint - Estado móvil de los analizadores persistido de forma atómica
+Cada analizador guarda periódicamente sus ventanas (ring buffers, sketches de rollup, estado de switching
+y ABR, último segmento medido por representación) y al arrancar continúa desde ahí sin releer los logs.
+"""
+
+import os
+import pickle
+import time
+from datetime import datetime
+
+import profiling
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, manifest_url, state):
+    """Escribe el checkpoint en un temporal y lo renombra: un corte nunca deja un archivo a medias"""
+    payload = {
+        'version': CHECKPOINT_VERSION,
+        'manifest_url': manifest_url,
+        'saved_at': datetime.now().isoformat(),
+        'state': state,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, manifest_url):
+    """Estado guardado para este manifest, o None si no hay checkpoint utilizable"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+    except Exception as e:
+        print(f"⚠️  Checkpoint ilegible en {path}, se inicia sin estado: {e}")
+        return None
+    if payload.get('version') != CHECKPOINT_VERSION:
+        print(f"⚠️  Checkpoint {path} de otra versión, se ignora")
+        return None
+    if payload.get('manifest_url') != manifest_url:
+        print(f"⚠️  Checkpoint {path} pertenece a otro manifest, se ignora")
+        return None
+    return payload
+
+
+class Checkpointer:
+    """Guarda el estado de un analizador cada `interval` segundos (0 = desactivado) y lo restaura al crearlo"""
+
+    def __init__(self, name, path, interval=60):
+        self.name = name
+        self.path = path
+        self.interval = interval
+        self.last_save = time.monotonic()
+
+    def restore(self, analyzer):
+        if not self.interval:
+            return False
+        start = time.perf_counter()
+        payload = load_checkpoint(self.path, analyzer.manifest_url)
+        if payload is None:
+            return False
+        analyzer.restore_state(payload['state'])
+        print(f"✓ Estado de {self.name} restaurado desde {payload['saved_at']} "
+              f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return True
+
+    def maybe_save(self, analyzer):
+        if self.interval and time.monotonic() - self.last_save >= self.interval:
+            self.save(analyzer)
+
+    def save(self, analyzer):
+        if not self.interval:
+            return
+        try:
+            with profiling.span(f"{self.name}.checkpoint"):
+                save_checkpoint(self.path, analyzer.manifest_url, analyzer.get_state())
+        except Exception as e:
+            print(f"Error guardando checkpoint de {self.name}: {e}")
+        self.last_save = time.monotonic()
@@ -0,0 +1,178 @@
+"""
+Circuit Breaker - Cortocircuito por origen y presupuesto de tiempo por ciclo de análisis
+Cuando el origen cae, las peticiones se rechazan al instante en lugar de acumular timeouts,
+y la caída se registra como un intervalo compacto en vez de miles de errores.
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+
+# Estados del circuito
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Presupuesto mínimo de un ciclo aunque el intervalo sea más corto
+MIN_TICK_BUDGET = 5.0
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """El circuito del origen está abierto: la petición no se envía"""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Se agotó el presupuesto de tiempo del ciclo actual"""
+
+
+class CircuitBreaker:
+    """Circuito de un origen: abre tras N fallos seguidos y prueba con una petición al vencer la espera"""
+
+    def __init__(self, origin, failure_threshold=3, reset_timeout=15.0, max_reset_timeout=300.0, max_outages=100):
+        self.origin = origin
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.outages = deque(maxlen=max_outages)
+        self.current_outage = None
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        """Lanza CircuitOpenError si el circuito no admite la petición"""
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return
+            if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+            if self.state == STATE_HALF_OPEN and not self.probe_in_flight:
+                # Una sola petición de prueba a la vez
+                self.probe_in_flight = True
+                return
+            self.current_outage['rejected'] += 1
+            raise CircuitOpenError(f"Circuito abierto para {self.origin}")
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+            if self.state != STATE_CLOSED:
+                self.state = STATE_CLOSED
+                self.reset_timeout = self.base_reset_timeout
+                self.current_outage['end'] = datetime.now().isoformat()
+                self.current_outage['duration_s'] = time.monotonic() - self.current_outage.pop('_started')
+                self.current_outage = None
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == STATE_HALF_OPEN:
+                # La prueba falló: volver a abrir con espera creciente
+                self.probe_in_flight = False
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self.current_outage['failures'] += 1
+            elif self.state == STATE_CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+                self.current_outage = {
+                    'start': datetime.now().isoformat(),
+                    'end': None,
+                    'failures': self.consecutive_failures,
+                    'rejected': 0,
+                    '_started': self.opened_at,
+                }
+                self.outages.append(self.current_outage)
+
+    def release_probe(self):
+        """La petición admitida no llegó a probar el origen (p.ej. se agotó el presupuesto del ciclo)"""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def summary(self):
+        with self.lock:
+            outages = []
+            for outage in self.outages:
+                entry = {k: v for k, v in outage.items() if not k.startswith('_')}
+                if outage['end'] is None:
+                    entry['duration_s'] = time.monotonic() - outage['_started']
+                outages.append(entry)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'reset_timeout_s': self.reset_timeout,
+                'outages': outages,
+            }
+
+
+class CircuitBreakerRegistry:
+    """Un circuito por origen (host:puerto), compartido por todos los analizadores del proceso"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=15.0, max_reset_timeout=300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def config(self):
+        """Parámetros para reconstruir el mismo registro en otro proceso"""
+        return {
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout,
+            'max_reset_timeout': self.max_reset_timeout,
+        }
+
+    def get(self, url):
+        origin = urlparse(url).netloc
+        breaker = self.breakers.get(origin)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.setdefault(origin, CircuitBreaker(
+                    origin, self.failure_threshold, self.reset_timeout, self.max_reset_timeout))
+        return breaker
+
+    def is_open(self, url):
+        return self.get(url).state != STATE_CLOSED
+
+    def summary(self):
+        with self.lock:
+            breakers = dict(self.breakers)
+        return {origin: breaker.summary() for origin, breaker in breakers.items()}
+
+
+class TickDeadline:
+    """Presupuesto de tiempo del ciclo actual de cada hilo"""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def start(self, seconds):
+        self.local.deadline = time.monotonic() + max(seconds, MIN_TICK_BUDGET) if seconds else None
+
+    def clear(self):
+        self.local.deadline = None
+
+    def remaining(self):
+        deadline = getattr(self.local, 'deadline', None)
+        return None if deadline is None else deadline - time.monotonic()
+
+    def clamp(self, timeout):
+        """Recorta el timeout al tiempo restante del ciclo; lanza DeadlineExceeded si ya no queda"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout, False
+        if remaining <= 0:
+            raise DeadlineExceeded("Presupuesto del ciclo agotado")
+        if timeout is None or remaining < timeout:
+            return remaining, True
+        return timeout, False
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+CMAF Chunk Probe - Llegada de chunks CMAF (moof+mdat) de un segmento LL-DASH en curso
+El segmento se descarga en streaming mientras se codifica; los límites de chunk se detectan sobre
+los bytes a medida que llegan (solo se guardan las cabeceras de caja y el moof, nunca el mdat) y cada
+llegada se compara con la disponibilidad anunciada por availabilityTimeOffset y con el tiempo de
+media del chunk (tfdt + trun).
+Uso: python3 cmaf_chunk_probe.py <manifest_url> [--count 3]
+"""
+
+import argparse
+import math
+import struct
+import time
+from datetime import datetime
+
+import requests
+
+import stream_analisys_common as common
+from circuit_breaker import CircuitOpenError
+from metric_history import RunningStats
+
+BOX_HEADER = struct.Struct('>I4s')
+BOX_LARGESIZE = struct.Struct('>Q')
+UINT32 = struct.Struct('>I')
+
+CHUNK_READ_SIZE = 16 * 1024
+# Un moof mayor que esto no se analiza (el chunk se cuenta igual, sin tiempo de media)
+MAX_MOOF_SIZE = 256 * 1024
+
+# Flags de tfhd / trun (ISO/IEC 14496-12)
+TFHD_BASE_DATA_OFFSET = 0x000001
+TFHD_SAMPLE_DESCRIPTION_INDEX = 0x000002
+TFHD_DEFAULT_SAMPLE_DURATION = 0x000008
+TRUN_DATA_OFFSET = 0x000001
+TRUN_FIRST_SAMPLE_FLAGS = 0x000004
+TRUN_SAMPLE_DURATION = 0x000100
+TRUN_SAMPLE_FIELDS = 0x000F00
+
+
+def _boxes(data, start=0, end=None):
+    """(tipo, inicio del contenido, fin) de las cajas contenidas en data[start:end]"""
+    end = len(data) if end is None else end
+    while start + BOX_HEADER.size <= end:
+        size, box_type = BOX_HEADER.unpack_from(data, start)
+        header = BOX_HEADER.size
+        if size == 1:
+            size = BOX_LARGESIZE.unpack_from(data, start + header)[0]
+            header += BOX_LARGESIZE.size
+        elif size == 0:
+            size = end - start
+        if size < header or start + size > end:
+            return
+        yield box_type, start + header, start + size
+        start += size
+
+
+def parse_moof(data):
+    """Tiempo de decodificación base, duración y muestras (unidades del track) del primer traf"""
+    try:
+        for box_type, start, end in _boxes(data):
+            if box_type != b'traf':
+                continue
+            decode_time = None
+            default_duration = None
+            duration = 0
+            samples = 0
+            complete = True
+            for child, child_start, child_end in _boxes(data, start, end):
+                version_flags = UINT32.unpack_from(data, child_start)[0]
+                version, flags = version_flags >> 24, version_flags & 0xFFFFFF
+                pos = child_start + 4
+                if child == b'tfhd':
+                    pos += 4  # track_ID
+                    if flags & TFHD_BASE_DATA_OFFSET:
+                        pos += 8
+                    if flags & TFHD_SAMPLE_DESCRIPTION_INDEX:
+                        pos += 4
+                    if flags & TFHD_DEFAULT_SAMPLE_DURATION:
+                        default_duration = UINT32.unpack_from(data, pos)[0]
+                elif child == b'tfdt':
+                    decode_time = (BOX_LARGESIZE if version == 1 else UINT32).unpack_from(data, pos)[0]
+                elif child == b'trun':
+                    count = UINT32.unpack_from(data, pos)[0]
+                    pos += 4
+                    if flags & TRUN_DATA_OFFSET:
+                        pos += 4
+                    if flags & TRUN_FIRST_SAMPLE_FLAGS:
+                        pos += 4
+                    samples += count
+                    if flags & TRUN_SAMPLE_DURATION:
+                        stride = 4 * bin(flags & TRUN_SAMPLE_FIELDS).count('1')
+                        duration += sum(UINT32.unpack_from(data, pos + i * stride)[0] for i in range(count))
+                    elif default_duration is not None:
+                        duration += count * default_duration
+                    else:
+                        # Duración por defecto del trex (segmento de inicialización): no disponible aquí
+                        complete = False
+            return {
+                'decode_time': decode_time,
+                'duration': duration if complete and samples else None,
+                'samples': samples,
+            }
+    except struct.error:
+        pass
+    return {}
+
+
+class ChunkParser:
+    """Delimita chunks CMAF sobre un flujo de bytes incremental (memoria acotada: cabeceras + moof)"""
+
+    def __init__(self):
+        self.header = bytearray()
+        self.box_type = None
+        self.remaining = 0
+        self.moof = None
+        self.moof_info = None
+        self.chunk_bytes = 0
+        self.total_bytes = 0
+
+    def feed(self, data, now):
+        """Consume los bytes recibidos en `now` y devuelve los chunks que se completaron"""
+        chunks = []
+        view = memoryview(data)
+        pos = 0
+        self.total_bytes += len(view)
+        while pos < len(view):
+            if self.box_type is None:
+                # Cabecera de caja: 8 bytes, 16 si usa largesize
+                need = BOX_HEADER.size - len(self.header) if len(self.header) < BOX_HEADER.size else \
+                    BOX_HEADER.size + BOX_LARGESIZE.size - len(self.header)
+                taken = view[pos:pos + need]
+                self.header += taken
+                pos += len(taken)
+                if len(self.header) < BOX_HEADER.size:
+                    continue
+                size, box_type = BOX_HEADER.unpack_from(self.header)
+                if size == 1:
+                    if len(self.header) < BOX_HEADER.size + BOX_LARGESIZE.size:
+                        continue
+                    size = BOX_LARGESIZE.unpack_from(self.header, BOX_HEADER.size)[0]
+                header_size = len(self.header)
+                if size and size < header_size:
+                    raise ValueError(f"Caja ISO-BMFF inválida ({box_type!r}, {size} bytes)")
+                self.box_type = box_type
+                # size 0: la caja llega hasta el final de la respuesta
+                self.remaining = size - header_size if size else None
+                self.chunk_bytes += header_size
+                self.header = bytearray()
+                if box_type == b'moof':
+                    self.moof = bytearray()
+                if self.remaining == 0:
+                    self._end_box(now, chunks)
+                continue
+
+            available = len(view) - pos
+            taken = available if self.remaining is None else min(self.remaining, available)
+            if self.moof is not None:
+                if len(self.moof) + taken <= MAX_MOOF_SIZE:
+                    self.moof += view[pos:pos + taken]
+                else:
+                    self.moof = None
+                    self.moof_info = {}
+            self.chunk_bytes += taken
+            pos += taken
+            if self.remaining is not None:
+                self.remaining -= taken
+                if not self.remaining:
+                    self._end_box(now, chunks)
+        return chunks
+
+    def finish(self, now):
+        """Fin de la respuesta: cierra un mdat de tamaño 0 (hasta el final) si lo había"""
+        chunks = []
+        if self.box_type is not None and self.remaining is None:
+            self._end_box(now, chunks)
+        return chunks
+
+    def _end_box(self, now, chunks):
+        if self.box_type == b'moof':
+            if self.moof is not None:
+                self.moof_info = parse_moof(bytes(self.moof))
+            self.moof = None
+        elif self.box_type == b'mdat' and self.moof_info is not None:
+            chunks.append(dict(self.moof_info, arrival=now, bytes=self.chunk_bytes))
+            self.chunk_bytes = 0
+            self.moof_info = None
+        self.box_type = None
+
+
+def _parse_offset(value):
+    if not value:
+        return 0.0
+    if value.upper() == 'INF':
+        return math.inf
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def chunk_probe_target(root, namespace, manifest_url, now=None):
+    """Próximo segmento de video cuya disponibilidad adelantada (availabilityTimeOffset) aún no llegó.
+    None si el MPD no es dinámico o no anuncia availabilityTimeOffset (no es LL-DASH)."""
+    availability_start = common.parse_iso_datetime(root.get('availabilityStartTime'))
+    if root.get('type') != 'dynamic' or availability_start is None:
+        return None
+    now = time.time() if now is None else now
+    period = root.find('mpd:Period', namespace)
+
+    for adaptation in common.get_adaptation_sets(root, namespace):
+        if adaptation.get('contentType') != 'video' and not (adaptation.get('mimeType') or '').startswith('video'):
+            continue
+        representations = adaptation.findall('mpd:Representation', namespace)
+        if not representations:
+            continue
+        # La representación más liviana: el ritmo de chunks lo marca el encoder, no el bitrate
+        rep = min(representations, key=lambda r: int(r.get('bandwidth', '0') or 0))
+        template = rep.find('mpd:SegmentTemplate', namespace)
+        if template is None:
+            template = adaptation.find('mpd:SegmentTemplate', namespace)
+        if template is None or not template.get('media'):
+            continue
+
+        # availabilityTimeOffset del SegmentTemplate más el del BaseURL más cercano
+        offset = _parse_offset(template.get('availabilityTimeOffset'))
+        for element in (rep, adaptation, period, root):
+            base_url = element.find('mpd:BaseURL', namespace) if element is not None else None
+            if base_url is not None:
+                offset += _parse_offset(base_url.get('availabilityTimeOffset'))
+                break
+        if offset <= 0:
+            return None
+
+        edge = common.get_live_edge_segment(template, namespace, availability_start,
+                                            datetime.fromtimestamp(now, availability_start.tzinfo))
+        if edge is None or 'availability_time' not in edge:
+            continue
+        timescale = float(template.get('timescale', '1'))
+        duration = edge['duration']
+        offset = min(offset, duration)
+        number = edge['number'] + 1
+        segment_time = edge['time'] + round(duration * timescale)
+        segment_start = edge['availability_time'].timestamp()
+        # Avanzar hasta un segmento cuyo primer chunk aún no esté disponible: se mide desde el primer byte
+        while segment_start + duration - offset < now:
+            number += 1
+            segment_time += round(duration * timescale)
+            segment_start += duration
+        return {
+            'url': common.build_segment_url(manifest_url, template.get('media'), rep.get('id', ''),
+                                            number, segment_time),
+            'number': number,
+            'representation_id': rep.get('id'),
+            'segment_start': segment_start,
+            'duration': duration,
+            'available_at': segment_start + duration - offset,
+            'availability_time_offset': offset,
+            'availability_time_complete': template.get('availabilityTimeComplete', 'true') != 'false',
+            'availability_start': availability_start.timestamp(),
+            'timescale': timescale,
+            'presentation_time_offset': int(template.get('presentationTimeOffset', '0')),
+        }
+    return None
+
+
+def _chunk_timing(target, chunks, request_start):
+    """Tiempos por chunk: llegada, latencia extremo a extremo y retraso frente a la disponibilidad ATO"""
+    duration = target['duration']
+    offset = target['availability_time_offset']
+    # Con ATO = duración - chunk, la disponibilidad adelantada coincide con el final del primer chunk
+    nominal_chunk = duration - offset if offset < duration else duration / max(1, len(chunks))
+    segment_end = target['segment_start'] + duration
+
+    timings = []
+    for i, chunk in enumerate(chunks):
+        expected = target['available_at'] + i * nominal_chunk
+        media_end = None
+        if chunk.get('decode_time') is not None and chunk.get('duration') is not None:
+            media_end = target['availability_start'] + (
+                chunk['decode_time'] + chunk['duration'] - target['presentation_time_offset']) / target['timescale']
+            # Timescale del track distinto del MPD (o Period@start no nulo): se descarta el tiempo de media
+            if not target['segment_start'] - duration <= media_end <= segment_end + duration:
+                media_end = None
+        timings.append({
+            'arrival_ms': (chunk['arrival'] - request_start) * 1000,
+            'bytes': chunk['bytes'],
+            'media_duration_ms': chunk['duration'] * 1000 / target['timescale']
+            if media_end is not None else None,
+            'latency_ms': (chunk['arrival'] - (media_end if media_end is not None else expected)) * 1000,
+            'availability_delay_ms': (chunk['arrival'] - expected) * 1000,
+        })
+    return timings, nominal_chunk
+
+
+def summarize_chunks(timings):
+    """Intervalo entre chunks (media, jitter = desviación típica, máximo) y latencias agregadas"""
+    intervals = RunningStats()
+    latency = RunningStats()
+    delay = RunningStats()
+    previous = None
+    for timing in timings:
+        if previous is not None:
+            intervals.add(timing['arrival_ms'] - previous)
+        previous = timing['arrival_ms']
+        latency.add(timing['latency_ms'])
+        delay.add(timing['availability_delay_ms'])
+    return {
+        'chunks': len(timings),
+        'chunk_interval_avg_ms': intervals.mean if intervals.count else None,
+        'chunk_interval_jitter_ms': math.sqrt(intervals.variance) if intervals.count else None,
+        'chunk_interval_max_ms': intervals.max,
+        'chunk_latency_avg_ms': latency.mean if latency.count else None,
+        'chunk_latency_max_ms': latency.max,
+        'availability_delay_avg_ms': delay.mean if delay.count else None,
+        'availability_delay_max_ms': delay.max,
+    }
+
+
+def probe_segment(target, timeout=10, wait=None, session=None):
+    """Espera la disponibilidad adelantada del segmento, lo descarga en streaming y mide cada chunk.
+    `wait(segundos)` permite interrumpir la espera (devuelve True si se pidió detener)."""
+    result = {
+        'segment_url': target['url'],
+        'number': target['number'],
+        'representation_id': target['representation_id'],
+        'availability_time_offset': target['availability_time_offset'],
+        'availability_time_complete': target['availability_time_complete'],
+        'timestamp': datetime.now().isoformat(),
+    }
+    delay = target['available_at'] - time.time()
+    if delay > 0:
+        if (wait or time.sleep)(delay):
+            return dict(result, status='cancelled')
+    result['wait_ms'] = max(0.0, delay) * 1000
+
+    request_start = time.time()
+    result['request_offset_ms'] = (request_start - target['available_at']) * 1000
+    # Sin límite, un segmento que nunca termina (mdat de tamaño 0) bloquearía el ciclo
+    deadline = request_start + target['duration'] + timeout
+    parser = ChunkParser()
+    chunks = []
+    try:
+        response = common.http_get(target['url'], timeout=timeout, url_class=common.URL_CLASS_SEGMENT,
+                                   session=session, stream=True)
+        with response:
+            result['http_status'] = response.status_code
+            result['ttfb_ms'] = (time.time() - request_start) * 1000
+            result['chunked'] = 'chunked' in response.headers.get('transfer-encoding', '').lower()
+            if response.status_code != 200:
+                return dict(result, status='error', error=f"HTTP {response.status_code}")
+            for data in response.iter_content(CHUNK_READ_SIZE):
+                chunks.extend(parser.feed(data, time.time()))
+                if time.time() > deadline:
+                    result['truncated'] = True
+                    break
+            else:
+                chunks.extend(parser.finish(time.time()))
+    except CircuitOpenError as e:
+        return dict(result, status='circuit_open', error=str(e))
+    except requests.exceptions.Timeout:
+        result.update(status='timeout', error='Timeout durante la descarga por chunks')
+    except (requests.exceptions.RequestException, ValueError) as e:
+        result.update(status='error', error=str(e))
+    download_end = time.time()
+
+    if not chunks:
+        result.setdefault('status', 'error')
+        result.setdefault('error', 'Respuesta sin chunks moof/mdat')
+        return result
+    # Con un error a mitad de segmento se conservan los chunks ya recibidos (status indica el error)
+    result['partial'] = 'status' in result
+    timings, nominal_chunk = _chunk_timing(target, chunks, request_start)
+    result.update(summarize_chunks(timings))
+    result.update({
+        'download_ms': (download_end - request_start) * 1000,
+        'bytes': parser.total_bytes,
+        'nominal_chunk_ms': nominal_chunk * 1000,
+        'chunk_arrivals': timings,
+    })
+    result.setdefault('status', 'success')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mide la llegada de chunks CMAF de un stream LL-DASH')
+    parser.add_argument('manifest_url', help='URL del manifest MPD')
+    parser.add_argument('--count', type=int, default=3, help='Segmentos a sondear')
+    parser.add_argument('--timeout', type=float, default=10, help='Timeout de lectura entre chunks (s)')
+    args = parser.parse_args()
+
+    for _ in range(args.count):
+        root, namespace = common.fetch_mpd_root(args.manifest_url)
+        target = chunk_probe_target(root, namespace, args.manifest_url)
+        if target is None:
+            print("✗ El manifest no es LL-DASH (sin availabilityTimeOffset o no dinámico)")
+            return
+        print(f"Segmento {target['number']} ({target['representation_id']}), ATO={target['availability_time_offset']:.3f}s, "
+              f"espera {max(0.0, target['available_at'] - time.time()):.2f}s")
+        result = probe_segment(target, timeout=args.timeout)
+        if not result.get('chunks'):
+            print(f"  ✗ {result.get('error', result['status'])}")
+            continue
+        if result['partial']:
+            print(f"  ⚠️  {result['error']}: se muestran los chunks recibidos")
+        for i, timing in enumerate(result['chunk_arrivals'], 1):
+            print(f"  chunk {i:3d}: +{timing['arrival_ms']:8.1f} ms  {timing['bytes']:8d} B  "
+                  f"latencia {timing['latency_ms']:7.1f} ms  retraso ATO {timing['availability_delay_ms']:7.1f} ms")
+        jitter = result['chunk_interval_jitter_ms']
+        print(f"  ✓ {result['chunks']} chunks en {result['download_ms']:.0f} ms, "
+              f"intervalo {result['chunk_interval_avg_ms'] or 0:.1f} ms (jitter {jitter or 0:.1f} ms), "
+              f"latencia media {result['chunk_latency_avg_ms']:.1f} ms"
+              + ("" if result['chunked'] else "  ⚠️  respuesta sin Transfer-Encoding chunked"))
+
+
+if __name__ == "__main__":
+    main()
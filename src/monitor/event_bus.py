@@ -0,0 +1,75 @@
+"""
+Event Bus - Bus pub/sub en memoria con colas acotadas para los resultados de los analizadores
+"""
+
+import threading
+from collections import deque
+
+# Tópicos publicados por los analizadores
+TOPIC_QUALITY = 'quality'
+TOPIC_LATENCY = 'latency'
+TOPIC_ADAPTATION = 'adaptation'
+ANALYZER_TOPICS = (TOPIC_QUALITY, TOPIC_LATENCY, TOPIC_ADAPTATION)
+
+# Métricas del presupuesto de recursos de cada proceso de análisis
+TOPIC_RESOURCES = 'resources'
+
+
+class Subscription:
+    """Cola acotada de un suscriptor; si se llena se descartan los eventos más antiguos"""
+
+    def __init__(self, bus, topics, maxsize):
+        self.bus = bus
+        self.topics = topics
+        self.events = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, topic, payload):
+        with self.condition:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append((topic, payload))
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Devuelve el próximo (topic, payload) o None si vence el timeout"""
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            return self.events.popleft() if self.events else None
+
+    def drain(self):
+        """Devuelve y vacía todos los eventos pendientes"""
+        with self.condition:
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Distribuye cada evento publicado a los suscriptores del tópico"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+
+    def subscribe(self, *topics, maxsize=100):
+        """Suscribe a los tópicos indicados (todos si no se indica ninguno)"""
+        subscription = Subscription(self, frozenset(topics), maxsize)
+        with self.lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def publish(self, topic, payload):
+        # Copia inmutable de la lista: publicar no bloquea a quien se suscribe
+        for subscription in self.subscriptions:
+            if not subscription.topics or topic in subscription.topics:
+                subscription.put(topic, payload)
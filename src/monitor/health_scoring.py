@@ -0,0 +1,148 @@
+"""
+Health Scoring - Puntuación incremental de salud del stream
+Cada evento de un analizador actualiza en O(1) la EWMA y la media de ventana de su dimensión.
+El score general pondera cada dimensión por su confianza (muestras y antigüedad): un dato
+ausente o viejo pierde peso en lugar de contar como 0.
+"""
+
+import math
+import time
+from collections import deque
+
+from event_bus import TOPIC_QUALITY, TOPIC_LATENCY, TOPIC_ADAPTATION
+
+# Latencia de manifest a partir de la cual el score de latencia es 0
+LATENCY_ZERO_SCORE_MS = 1000.0
+
+# Umbrales de las recomendaciones por dimensión
+RECOMMENDATIONS = {
+    'quality': (0.7, "Calidad de video baja - revisar configuración de codificación"),
+    'latency': (0.8, "Latencia alta - optimizar red o servidor"),
+    'adaptation': (0.6, "Inestabilidad en adaptación - revisar configuración de bitrates"),
+}
+
+
+def quality_score(payload):
+    """SSIM promedio del ciclo; sin SSIM no hay muestra (no es un 0)"""
+    ssim = (payload.get('aggregate_metrics') or {}).get('avg_ssim')
+    if ssim is None or math.isnan(ssim):
+        return None
+    return max(0.0, min(1.0, ssim))
+
+
+def latency_score(payload):
+    """Latencia del manifest en este ciclo; un fallo de red sí puntúa 0"""
+    manifest = payload.get('manifest_latency') or {}
+    if manifest.get('status') == 'success' and manifest.get('latency_ms') is not None:
+        return max(0.0, 1.0 - manifest['latency_ms'] / LATENCY_ZERO_SCORE_MS)
+    if manifest.get('status') in ('timeout', 'error'):
+        return 0.0
+    return None  # Circuito abierto o ciclo omitido: sin muestra nueva
+
+
+def adaptation_score(payload):
+    stability = (payload.get('aggregate_metrics') or {}).get('stability_score')
+    return None if stability is None else max(0.0, min(1.0, stability))
+
+
+class DimensionScore:
+    """EWMA, media de ventana, número de muestras y antigüedad de una dimensión"""
+
+    def __init__(self, name, stale_after, alpha=0.2, window=20, warmup=5):
+        self.name = name
+        self.stale_after = stale_after
+        self.alpha = alpha
+        self.window = deque(maxlen=window)
+        self.window_total = 0.0
+        self.warmup = warmup
+        self.ewma = None
+        self.samples = 0
+        self.updated_at = None
+
+    def update(self, value, now=None):
+        if len(self.window) == self.window.maxlen:
+            self.window_total -= self.window[0]
+        self.window.append(value)
+        self.window_total += value
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+        self.samples += 1
+        self.updated_at = time.monotonic() if now is None else now
+
+    def age(self, now):
+        return None if self.updated_at is None else now - self.updated_at
+
+    def confidence(self, now):
+        """0-1: crece con las primeras muestras y decae linealmente tras stale_after hasta 3x stale_after"""
+        if self.updated_at is None:
+            return 0.0
+        warm = min(1.0, self.samples / self.warmup)
+        overdue = self.age(now) - self.stale_after
+        freshness = 1.0 if overdue <= 0 else max(0.0, 1.0 - overdue / (2 * self.stale_after))
+        return warm * freshness
+
+    def summary(self, now):
+        return {
+            'score': self.ewma,
+            'window_score': self.window_total / len(self.window) if self.window else None,
+            'confidence': self.confidence(now),
+            'samples': self.samples,
+            'age_s': self.age(now),
+            'stale': self.updated_at is not None and self.age(now) > self.stale_after,
+        }
+
+
+class HealthScorer:
+    """Scores por dimensión alimentados desde el bus de resultados y score general ponderado por confianza"""
+
+    def __init__(self, quality_interval=30, latency_interval=5, adaptation_interval=10, stale_factor=3,
+                 weights=None):
+        # Una dimensión se considera vieja tras varios intervalos sin resultados de su analizador
+        self.dimensions = {
+            'quality': DimensionScore('quality', max(1, quality_interval) * stale_factor),
+            'latency': DimensionScore('latency', max(1, latency_interval) * stale_factor),
+            'adaptation': DimensionScore('adaptation', max(1, adaptation_interval) * stale_factor),
+        }
+        self.extractors = {
+            TOPIC_QUALITY: ('quality', quality_score),
+            TOPIC_LATENCY: ('latency', latency_score),
+            TOPIC_ADAPTATION: ('adaptation', adaptation_score),
+        }
+        self.weights = weights or {'quality': 1.0, 'latency': 1.0, 'adaptation': 1.0}
+
+    def update(self, topic, payload, now=None):
+        """Procesa un resultado de analizador; devuelve False si no aportó muestra"""
+        name, extract = self.extractors.get(topic, (None, None))
+        if name is None or not payload:
+            return False
+        value = extract(payload)
+        if value is None:
+            return False
+        self.dimensions[name].update(value, now)
+        return True
+
+    def overall_metrics(self, now=None):
+        """Scores actuales en el formato de overall_metrics de la suite (None = dimensión sin datos)"""
+        now = time.monotonic() if now is None else now
+        dimensions = {name: dimension.summary(now) for name, dimension in self.dimensions.items()}
+
+        weighted = 0.0
+        total_weight = 0.0
+        for name, summary in dimensions.items():
+            weight = self.weights.get(name, 1.0) * summary['confidence']
+            if weight:
+                weighted += weight * summary['score']
+                total_weight += weight
+
+        overall = {
+            'stream_health_score': weighted / total_weight if total_weight else None,
+            'confidence': sum(summary['confidence'] for summary in dimensions.values()) / len(dimensions),
+            'dimensions': dimensions,
+            'recommendations': [],
+        }
+        for name, summary in dimensions.items():
+            overall[f'{name}_score'] = summary['score']
+            threshold, message = RECOMMENDATIONS[name]
+            # Solo se recomienda con datos actuales: una dimensión vieja no genera alarmas
+            if summary['score'] is not None and not summary['stale'] and summary['score'] < threshold:
+                overall['recommendations'].append(message)
+        return overall
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+HLS Engine - Parser de playlists HLS (RFC 8216 + LL-HLS) y seguimiento incremental de media playlists
+Parsea listas de atributos con valores entre comillas, sigue las variantes de una master playlist,
+procesa solo los segmentos con media sequence nuevo, calcula la latencia a partir de
+EXT-X-PROGRAM-DATE-TIME y usa recargas bloqueantes (_HLS_msn/_HLS_part) cuando el servidor las admite.
+Uso: python3 hls_engine.py <playlist_url> [--no-blocking] [--duration 60]
+"""
+
+import argparse
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+
+import requests
+
+import stream_analisys_common as common
+
+_PDT = re.compile(r'^(?P<base>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(?P<fraction>\d+))?(?P<tz>Z|[+-]\d{2}:?\d{2})?$')
+
+
+def parse_attribute_list(text):
+    """Lista de atributos (RFC 8216 4.2): los valores entre comillas pueden contener comas"""
+    attributes = {}
+    pos, length = 0, len(text)
+    while pos < length:
+        eq = text.find('=', pos)
+        if eq < 0:
+            break
+        name = text[pos:eq].strip()
+        pos = eq + 1
+        if pos < length and text[pos] == '"':
+            end = text.find('"', pos + 1)
+            end = length if end < 0 else end
+            value = text[pos + 1:end]
+            comma = text.find(',', end)
+            pos = length if comma < 0 else comma + 1
+        else:
+            comma = text.find(',', pos)
+            end = length if comma < 0 else comma
+            value = text[pos:end].strip()
+            pos = end + 1
+        attributes[name] = value
+    return attributes
+
+
+def parse_program_date_time(value):
+    """EXT-X-PROGRAM-DATE-TIME a datetime UTC (acepta cualquier cantidad de decimales y +hhmm)"""
+    match = _PDT.match(value.strip())
+    if not match:
+        return None
+    fraction = (match.group('fraction') or '0')[:6].ljust(6, '0')
+    tz = match.group('tz') or 'Z'
+    if tz == 'Z':
+        tz = '+00:00'
+    elif ':' not in tz:
+        tz = f"{tz[:3]}:{tz[3:]}"
+    try:
+        return datetime.fromisoformat(f"{match.group('base')}.{fraction}{tz}").astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+
+def _tag(line):
+    """('#EXT-X-TAG', 'valor') de una línea de tag"""
+    name, _, value = line.partition(':')
+    return name, value
+
+
+class MasterPlaylist:
+    def __init__(self, variants, renditions):
+        self.variants = variants
+        self.renditions = renditions
+
+
+class MediaPlaylist:
+    """Segmentos (con su media sequence number), partes LL-HLS y directivas del servidor"""
+
+    def __init__(self):
+        self.target_duration = None
+        self.media_sequence = 0
+        self.discontinuity_sequence = 0
+        self.playlist_type = None
+        self.endlist = False
+        self.segments = []
+        self.trailing_parts = []
+        self.server_control = {}
+        self.part_target = None
+        self.preload_hints = []
+        self.rendition_reports = []
+        self.skipped_segments = 0
+
+    @property
+    def next_msn(self):
+        """Media sequence del segmento en construcción (al que pertenecen las partes finales)"""
+        return self.media_sequence + self.skipped_segments + len(self.segments)
+
+    @property
+    def last_msn(self):
+        return self.next_msn - 1 if self.segments else None
+
+    @property
+    def can_block_reload(self):
+        return self.server_control.get('CAN-BLOCK-RELOAD') == 'YES'
+
+    @property
+    def hold_back(self):
+        """Distancia mínima al live edge que respeta un reproductor (PART-HOLD-BACK en LL-HLS)"""
+        if self.part_target and 'PART-HOLD-BACK' in self.server_control:
+            return float(self.server_control['PART-HOLD-BACK'])
+        if 'HOLD-BACK' in self.server_control:
+            return float(self.server_control['HOLD-BACK'])
+        return 3 * self.target_duration if self.target_duration else None
+
+    def edge_time(self):
+        """Hora de fin del contenido más nuevo publicado (segmento + partes finales), según PROGRAM-DATE-TIME"""
+        if not self.segments or self.segments[-1]['program_date_time'] is None:
+            return None
+        last = self.segments[-1]
+        parts = sum(part['duration'] for part in self.trailing_parts)
+        return last['program_date_time'] + timedelta(seconds=last['duration'] + parts)
+
+    def latency(self, now=None):
+        """Segundos entre el reloj y el final del contenido más nuevo (None sin PROGRAM-DATE-TIME)"""
+        edge = self.edge_time()
+        if edge is None:
+            return None
+        now = now or datetime.now(timezone.utc)
+        return (now - edge).total_seconds()
+
+
+def parse_playlist(text, base_url):
+    """MasterPlaylist o MediaPlaylist según el contenido"""
+    if '#EXT-X-STREAM-INF' in text or ('#EXTINF' not in text and '#EXT-X-MEDIA:' in text):
+        return parse_master_playlist(text, base_url)
+    return parse_media_playlist(text, base_url)
+
+
+def parse_master_playlist(text, base_url):
+    variants = []
+    renditions = []
+    stream_inf = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            stream_inf = parse_attribute_list(_tag(line)[1])
+        elif line.startswith('#EXT-X-MEDIA:'):
+            attributes = parse_attribute_list(_tag(line)[1])
+            if 'URI' in attributes:
+                attributes['URI'] = urljoin(base_url, attributes['URI'])
+            renditions.append(attributes)
+        elif not line.startswith('#') and stream_inf is not None:
+            variants.append({
+                'uri': urljoin(base_url, line),
+                'bandwidth': int(stream_inf.get('BANDWIDTH', 0) or 0),
+                'average_bandwidth': int(stream_inf['AVERAGE-BANDWIDTH']) if stream_inf.get('AVERAGE-BANDWIDTH') else None,
+                'codecs': stream_inf.get('CODECS'),
+                'resolution': stream_inf.get('RESOLUTION'),
+                'frame_rate': float(stream_inf['FRAME-RATE']) if stream_inf.get('FRAME-RATE') else None,
+                'audio': stream_inf.get('AUDIO'),
+            })
+            stream_inf = None
+    return MasterPlaylist(variants, renditions)
+
+
+def _part(attributes, base_url):
+    return {
+        'uri': urljoin(base_url, attributes.get('URI', '')),
+        'duration': float(attributes.get('DURATION', 0) or 0),
+        'independent': attributes.get('INDEPENDENT') == 'YES',
+        'gap': attributes.get('GAP') == 'YES',
+    }
+
+
+def parse_media_playlist(text, base_url):
+    playlist = MediaPlaylist()
+    pending = {'duration': None, 'title': '', 'program_date_time': None, 'discontinuity': False, 'gap': False, 'parts': []}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith('#'):
+            playlist.segments.append({
+                'msn': playlist.next_msn,
+                'uri': urljoin(base_url, line),
+                'duration': pending['duration'] or 0.0,
+                'title': pending['title'],
+                'program_date_time': pending['program_date_time'],
+                'discontinuity': pending['discontinuity'],
+                'gap': pending['gap'],
+                'parts': pending['parts'],
+            })
+            pending = {'duration': None, 'title': '', 'program_date_time': None, 'discontinuity': False, 'gap': False, 'parts': []}
+            continue
+
+        name, value = _tag(line)
+        if name == '#EXTINF':
+            duration, _, title = value.partition(',')
+            pending['duration'] = float(duration)
+            pending['title'] = title
+        elif name == '#EXT-X-PROGRAM-DATE-TIME':
+            pending['program_date_time'] = parse_program_date_time(value)
+        elif name == '#EXT-X-DISCONTINUITY':
+            pending['discontinuity'] = True
+        elif name == '#EXT-X-GAP':
+            pending['gap'] = True
+        elif name == '#EXT-X-PART':
+            pending['parts'].append(_part(parse_attribute_list(value), base_url))
+        elif name == '#EXT-X-TARGETDURATION':
+            playlist.target_duration = float(value)
+        elif name == '#EXT-X-MEDIA-SEQUENCE':
+            playlist.media_sequence = int(value)
+        elif name == '#EXT-X-DISCONTINUITY-SEQUENCE':
+            playlist.discontinuity_sequence = int(value)
+        elif name == '#EXT-X-PLAYLIST-TYPE':
+            playlist.playlist_type = value
+        elif name == '#EXT-X-ENDLIST':
+            playlist.endlist = True
+        elif name == '#EXT-X-SERVER-CONTROL':
+            playlist.server_control = parse_attribute_list(value)
+        elif name == '#EXT-X-PART-INF':
+            playlist.part_target = float(parse_attribute_list(value).get('PART-TARGET', 0) or 0) or None
+        elif name == '#EXT-X-SKIP':
+            # Delta update: los segmentos omitidos conservan su numeración
+            playlist.skipped_segments = int(parse_attribute_list(value).get('SKIPPED-SEGMENTS', 0) or 0)
+        elif name == '#EXT-X-PRELOAD-HINT':
+            attributes = parse_attribute_list(value)
+            playlist.preload_hints.append({'type': attributes.get('TYPE'), 'uri': urljoin(base_url, attributes.get('URI', ''))})
+        elif name == '#EXT-X-RENDITION-REPORT':
+            attributes = parse_attribute_list(value)
+            playlist.rendition_reports.append({
+                'uri': urljoin(base_url, attributes.get('URI', '')),
+                'last_msn': int(attributes['LAST-MSN']) if attributes.get('LAST-MSN') else None,
+                'last_part': int(attributes['LAST-PART']) if attributes.get('LAST-PART') else None,
+            })
+
+    # Las partes tras el último segmento pertenecen al segmento en construcción (next_msn)
+    playlist.trailing_parts = pending['parts']
+
+    # PROGRAM-DATE-TIME se propaga a los segmentos siguientes hasta una discontinuidad
+    previous = None
+    for segment in playlist.segments:
+        if segment['program_date_time'] is None and previous is not None and previous['program_date_time'] is not None \
+                and not segment['discontinuity']:
+            segment['program_date_time'] = previous['program_date_time'] + timedelta(seconds=previous['duration'])
+        previous = segment
+    return playlist
+
+
+def with_delivery_directives(url, msn, part=None):
+    """URL de recarga bloqueante: el servidor retiene la respuesta hasta que existe msn (y la parte)"""
+    parsed = urlparse(url)
+    query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True) if not key.startswith('_HLS_')]
+    query.append(('_HLS_msn', str(msn)))
+    if part is not None:
+        query.append(('_HLS_part', str(part)))
+    return urlunparse(parsed._replace(query=urlencode(query)))
+
+
+class HlsMediaTracker:
+    """Sigue una media playlist: entrega solo los segmentos y partes nuevos desde la actualización anterior"""
+
+    def __init__(self, url, session=None, blocking=True):
+        self.url = url
+        self.session = session
+        self.blocking = blocking
+        self.playlist = None
+        self.last_seen_msn = None
+        self.last_seen_part = None
+        self.changed = True
+
+    def blocking_reload_available(self):
+        return (self.blocking and self.playlist is not None and self.playlist.can_block_reload
+                and not self.playlist.endlist)
+
+    def reload_url(self):
+        if not self.blocking_reload_available():
+            return self.url
+        part = len(self.playlist.trailing_parts) if self.playlist.part_target else None
+        return with_delivery_directives(self.url, self.playlist.next_msn, part)
+
+    def request_timeout(self):
+        # Un servidor LL-HLS debe responder en 3 target durations (o devolver 503)
+        if self.blocking_reload_available() and self.playlist.target_duration:
+            return 3 * self.playlist.target_duration + 1
+        return 10
+
+    def update(self):
+        """Recarga la playlist (bloqueante si el servidor lo admite) y devuelve los cambios"""
+        blocking = self.blocking_reload_available()
+        start_time = time.time()
+        response = common.http_get(self.reload_url(), timeout=self.request_timeout(), url_class=common.URL_CLASS_MANIFEST,
+                                   session=self.session)
+        response.raise_for_status()
+        update = self.ingest(response.text, response.url or self.url)
+        update['fetch_time_s'] = time.time() - start_time
+        update['blocking'] = blocking
+        return update
+
+    def ingest(self, text, base_url=None):
+        """Procesa una playlist ya descargada (p.ej. la misma respuesta usada para otro análisis)"""
+        playlist = parse_media_playlist(text, base_url or self.url)
+        if self.last_seen_msn is None:
+            # Primera carga: solo el live edge es "nuevo"
+            new_segments = playlist.segments[-1:]
+            missed = 0
+        else:
+            new_segments = [segment for segment in playlist.segments if segment['msn'] > self.last_seen_msn]
+            # Segmentos que salieron de la ventana antes de verlos (recargas demasiado espaciadas)
+            missed = max(0, playlist.media_sequence - self.last_seen_msn - 1)
+
+        part_key = (playlist.next_msn, len(playlist.trailing_parts))
+        if self.last_seen_part is None or self.last_seen_part[0] != part_key[0]:
+            new_parts = len(playlist.trailing_parts)
+        else:
+            new_parts = max(0, part_key[1] - self.last_seen_part[1])
+
+        self.changed = bool(new_segments) or bool(new_parts) or self.playlist is None
+        self.playlist = playlist
+        if playlist.last_msn is not None:
+            self.last_seen_msn = playlist.last_msn if self.last_seen_msn is None else max(self.last_seen_msn, playlist.last_msn)
+        self.last_seen_part = part_key
+
+        return {
+            'url': self.url,
+            'media_sequence': playlist.media_sequence,
+            'last_msn': playlist.last_msn,
+            'target_duration': playlist.target_duration,
+            'part_target': playlist.part_target,
+            'low_latency': playlist.part_target is not None,
+            'can_block_reload': playlist.can_block_reload,
+            'endlist': playlist.endlist,
+            'new_segments': new_segments,
+            'new_parts': new_parts,
+            'missed_segments': missed,
+            'latency_s': playlist.latency(),
+            'hold_back_s': playlist.hold_back,
+            'preload_hint': playlist.preload_hints[0]['uri'] if playlist.preload_hints else None,
+        }
+
+    def wait_interval(self):
+        """Espera antes de una recarga no bloqueante (RFC 8216 6.3.4: la mitad si la playlist no cambió)"""
+        if self.playlist is None or not self.playlist.target_duration:
+            return 1.0
+        if self.playlist.part_target:
+            return self.playlist.part_target
+        return self.playlist.target_duration if self.changed else self.playlist.target_duration / 2
+
+    def watch(self, callback, running=lambda: True):
+        """Bucle de seguimiento: con recargas bloqueantes no hay polling, el servidor marca el ritmo"""
+        while running() and not (self.playlist and self.playlist.endlist):
+            try:
+                update = self.update()
+                callback(update)
+                if update['blocking']:
+                    continue
+            except requests.RequestException as e:
+                print(f"Error recargando playlist: {e}")
+            time.sleep(self.wait_interval())
+
+
+def resolve_media_playlists(url, session=None):
+    """URLs de las media playlists (las variantes si es una master) y la playlist parseada"""
+    response = common.http_get(url, timeout=10, url_class=common.URL_CLASS_MANIFEST, session=session)
+    response.raise_for_status()
+    playlist = parse_playlist(response.text, response.url or url)
+    if isinstance(playlist, MasterPlaylist):
+        return [variant['uri'] for variant in playlist.variants], playlist
+    return [url], playlist
+
+
+def format_update(update):
+    latency = 'N/A' if update['latency_s'] is None else f"{update['latency_s']:.2f}s"
+    segments = ', '.join(str(segment['msn']) for segment in update['new_segments']) or '-'
+    mode = 'bloqueante' if update['blocking'] else 'polling'
+    return (f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] msn nuevos: {segments} | partes nuevas: {update['new_parts']} | "
+            f"latencia: {latency} | perdidos: {update['missed_segments']} | {mode} {update['fetch_time_s'] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seguimiento de una playlist HLS/LL-HLS')
+    parser.add_argument('playlist_url', help='URL de la master o media playlist')
+    parser.add_argument('--no-blocking', action='store_true', help='Recargas por polling aunque el servidor admita _HLS_msn')
+    parser.add_argument('--duration', type=float, help='Segundos de seguimiento')
+    args = parser.parse_args()
+
+    session = requests.Session()
+    urls, playlist = resolve_media_playlists(args.playlist_url, session)
+    if isinstance(playlist, MasterPlaylist):
+        print(f"✓ Master playlist con {len(playlist.variants)} variantes")
+        for variant in playlist.variants:
+            print(f"  {variant['bandwidth']} bps {variant['resolution'] or ''} {variant['codecs'] or ''} -> {variant['uri']}")
+    if not urls:
+        print("✗ La playlist no tiene variantes")
+        return
+
+    tracker = HlsMediaTracker(urls[0], session, blocking=not args.no_blocking)
+    deadline = time.time() + args.duration if args.duration else None
+    try:
+        tracker.watch(lambda update: print(format_update(update)),
+                      running=lambda: deadline is None or time.time() < deadline)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Metric History - Historial compacto en columnas tipadas (ring buffer) con agregados incrementales
+"""
+
+import math
+
+import numpy as np
+
+# Estados de medición almacenados en la columna 'status'
+STATUS_SUCCESS = 0
+STATUS_TIMEOUT = 1
+STATUS_ERROR = 2
+
+STATUS_CODES = {
+    'success': STATUS_SUCCESS,
+    'timeout': STATUS_TIMEOUT,
+    'error': STATUS_ERROR,
+}
+
+# Columnas por defecto del historial
+HISTORY_COLUMNS = [
+    ('timestamp', '<f8'),
+    ('bitrate', '<f8'),
+    ('latency', '<f4'),
+    ('size', '<u4'),
+    ('status', 'u1'),
+    ('switch', 'u1'),
+]
+
+
+class RunningStats:
+    """Media, varianza (Welford), mínimo y máximo de todas las muestras en O(1)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None or math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+
+class Ewma:
+    """Media móvil exponencial"""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.value = None
+
+    def add(self, value):
+        if value is None or math.isnan(value):
+            return self.value
+        self.value = value if self.value is None else self.alpha * value + (1 - self.alpha) * self.value
+        return self.value
+
+
+class WindowStats:
+    """Suma y suma de cuadrados de una ventana deslizante (altas y bajas en O(1))"""
+
+    def __init__(self):
+        self.count = 0
+        self.shift = None  # Desplazamiento para evitar cancelación numérica
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, value):
+        if math.isnan(value):
+            return
+        if self.shift is None:
+            self.shift = value
+        value -= self.shift
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+
+    def remove(self, value):
+        if math.isnan(value):
+            return
+        value -= self.shift
+        self.count -= 1
+        self.total -= value
+        self.total_sq -= value * value
+        if self.count == 0:
+            self.shift, self.total, self.total_sq = None, 0.0, 0.0
+
+    @property
+    def mean(self):
+        return self.shift + self.total / self.count if self.count else None
+
+    @property
+    def variance(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return max(0.0, self.total_sq / self.count - mean * mean)
+
+
+class RingHistory:
+    """Historial de tamaño fijo en un array estructurado de NumPy con agregados de ventana incrementales"""
+
+    def __init__(self, capacity, columns=HISTORY_COLUMNS, stats_columns=('bitrate', 'latency'), ewma_alpha=0.2):
+        self.capacity = capacity
+        self.dtype = np.dtype(columns)
+        self.data = np.zeros(capacity, dtype=self.dtype)
+        self.head = 0
+        self.count = 0
+        self.window = {name: WindowStats() for name in stats_columns}
+        self.ewma = {name: Ewma(ewma_alpha) for name in stats_columns}
+        self.counters = {name: np.zeros(256, dtype=np.int64) for name in ('status', 'switch') if name in self.dtype.names}
+
+    def __len__(self):
+        return self.count
+
+    def _default(self, name):
+        return np.nan if self.dtype[name].kind == 'f' else 0
+
+    def append(self, **values):
+        """Agrega una fila; si el buffer está lleno descuenta la fila más antigua de los agregados"""
+        idx = self.head
+        if self.count == self.capacity:
+            evicted = self.data[idx]
+            for name, stats in self.window.items():
+                stats.remove(float(evicted[name]))
+            for name, counts in self.counters.items():
+                counts[evicted[name]] -= 1
+        else:
+            self.count += 1
+
+        for name in self.dtype.names:
+            value = values.get(name)
+            self.data[name][idx] = self._default(name) if value is None else value
+
+        row = self.data[idx]
+        for name, stats in self.window.items():
+            value = float(row[name])
+            stats.add(value)
+            self.ewma[name].add(value)
+        for name, counts in self.counters.items():
+            counts[row[name]] += 1
+        self.head = (idx + 1) % self.capacity
+
+    def column(self, name):
+        """Columna en orden cronológico (vista o copia contigua)"""
+        values = self.data[name]
+        if self.count < self.capacity:
+            return values[:self.count]
+        return np.concatenate((values[self.head:], values[:self.head]))
+
+    def last(self, name):
+        if not self.count:
+            return None
+        return self.data[name][(self.head - 1) % self.capacity].item()
+
+    def mean(self, name):
+        return self.window[name].mean
+
+    def variance(self, name):
+        return self.window[name].variance
+
+    def valid_count(self, name):
+        return self.window[name].count
+
+    def ewma_value(self, name):
+        return self.ewma[name].value
+
+    def count_of(self, name, value):
+        """Número de filas de la ventana con ese valor (p.ej. status=STATUS_TIMEOUT)"""
+        return int(self.counters[name][value])
+
+    def nan_min(self, name):
+        values = self.column(name)
+        values = values[~np.isnan(values)]
+        return float(values.min()) if values.size else None
+
+    def nan_max(self, name):
+        values = self.column(name)
+        values = values[~np.isnan(values)]
+        return float(values.max()) if values.size else None
+
+    def percentile(self, name, q):
+        values = self.column(name)
+        values = values[~np.isnan(values)]
+        return float(np.percentile(values, q)) if values.size else None
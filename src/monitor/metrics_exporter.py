@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Metrics Exporter - Endpoint /metrics en formato OpenMetrics alimentado desde memoria
+Los analizadores publican en el bus; el exportador actualiza gauges e histogramas por stream
+y cada serie guarda su texto ya renderizado, así un scrape solo concatena cadenas (sin leer archivos).
+"""
+
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from event_bus import ANALYZER_TOPICS, TOPIC_QUALITY, TOPIC_LATENCY, TOPIC_ADAPTATION, TOPIC_RESOURCES
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+SUMMARY = 'summary'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """Histograma acumulativo de una serie"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, [('le', _number(bound))])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(self.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return '\n'.join(lines)
+
+
+class MetricFamily:
+    """Familia de métricas; cada serie (conjunto de labels) cachea su texto hasta que cambia"""
+
+    def __init__(self, name, metric_type, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.type = metric_type
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.rendered = {}
+        self.header = f"# TYPE {name} {metric_type}\n# HELP {name} {help_text}"
+
+    def set(self, labels, value):
+        key = tuple(labels)
+        if self.series.get(key) != value or key not in self.rendered:
+            self.series[key] = value
+            self.rendered[key] = f"{self.name}{_labels(key)} {_number(value)}"
+
+    def observe(self, labels, value):
+        key = tuple(labels)
+        histogram = self.series.get(key)
+        if histogram is None:
+            histogram = self.series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+        self.rendered[key] = histogram.render(self.name, key)
+
+    def set_summary(self, labels, quantiles, total, count):
+        key = tuple(labels)
+        lines = [f"{self.name}{_labels(key, [('quantile', q)])} {_number(v)}" for q, v in quantiles]
+        lines.append(f"{self.name}_sum{_labels(key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(key)} {count}")
+        self.rendered[key] = '\n'.join(lines)
+
+    def remove(self, match):
+        """Elimina las series cuyos labels contienen todos los pares de match"""
+        for key in [k for k in self.rendered if set(match) <= set(k)]:
+            self.rendered.pop(key, None)
+            self.series.pop(key, None)
+
+    def render(self):
+        if not self.rendered:
+            return None
+        return self.header + '\n' + '\n'.join(self.rendered.values())
+
+
+class MetricsRegistry:
+    """Conjunto de familias compartido por todos los streams del proceso"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+        for name, metric_type, help_text in METRIC_FAMILIES:
+            self.families[name] = MetricFamily(name, metric_type, help_text)
+
+    def set(self, name, labels, value):
+        with self.lock:
+            self.families[name].set(labels, value)
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self.families[name].observe(labels, value)
+
+    def set_summary(self, name, labels, quantiles, total, count):
+        with self.lock:
+            self.families[name].set_summary(labels, quantiles, total, count)
+
+    def remove_stream(self, stream):
+        with self.lock:
+            for family in self.families.values():
+                family.remove([('stream', stream)])
+
+    def render(self):
+        with self.lock:
+            blocks = [block for block in (f.render() for f in self.families.values()) if block]
+        blocks.append('# EOF\n')
+        return '\n'.join(blocks).encode('utf-8')
+
+
+METRIC_FAMILIES = [
+    ('lvl_manifest_latency_seconds', HISTOGRAM, 'Tiempo de descarga del manifest'),
+    ('lvl_segment_latency_seconds', HISTOGRAM, 'Tiempo de descarga de segmentos'),
+    ('lvl_segment_latency_percentile_seconds', GAUGE, 'Percentiles de latencia de segmentos en la ventana del analizador'),
+    ('lvl_manifest_latency_ewma_seconds', GAUGE, 'EWMA de la latencia del manifest'),
+    ('lvl_request_timeout_ratio', GAUGE, 'Proporción de timeouts en la ventana del analizador'),
+    ('lvl_availability_delay_seconds', GAUGE, 'Retraso entre la disponibilidad anunciada del último segmento y su observación'),
+    ('lvl_declared_bitrate_bps', GAUGE, 'Bandwidth declarado en el MPD por representación'),
+    ('lvl_measured_bitrate_bps', GAUGE, 'Bitrate medido del último segmento por representación'),
+    ('lvl_measured_bitrate_peak_bps', GAUGE, 'Pico de bitrate medido por representación'),
+    ('lvl_quality_avg_bitrate_bps', GAUGE, 'Bitrate promedio de los segmentos analizados por ffprobe'),
+    ('lvl_quality_ssim', GAUGE, 'SSIM promedio del último análisis de calidad'),
+    ('lvl_abr_selected_bitrate_bps', GAUGE, 'Bitrate elegido por el cliente ABR simulado'),
+    ('lvl_abr_buffer_seconds', GAUGE, 'Buffer del cliente ABR simulado'),
+    ('lvl_abr_stall_seconds', GAUGE, 'Tiempo total de stall estimado por el cliente ABR simulado'),
+    ('lvl_adaptation_stability_score', GAUGE, 'Estabilidad de la adaptación (0-1)'),
+    ('lvl_stream_health_score', GAUGE, 'Health score general del stream (0-1)'),
+    ('lvl_stream_health_confidence', GAUGE, 'Confianza del health score según muestras y antigüedad (0-1)'),
+    ('lvl_stream_component_score', GAUGE, 'Score de calidad, latencia y adaptación (0-1)'),
+    ('lvl_stage_duration_seconds', SUMMARY, 'Duración por etapa de los ciclos de análisis (incluye <analizador>.tick)'),
+]
+
+
+class StreamMetricsFeeder:
+    """Consume los resultados del bus de un stream y actualiza el registro"""
+
+    def __init__(self, registry, stream, event_bus):
+        self.registry = registry
+        self.stream = stream
+        self.labels = (('stream', stream),)
+        self.subscription = event_bus.subscribe(*ANALYZER_TOPICS, TOPIC_RESOURCES, maxsize=1000)
+        self.running = False
+        self.thread = None
+        self.handlers = {
+            TOPIC_LATENCY: self.on_latency,
+            TOPIC_ADAPTATION: self.on_adaptation,
+            TOPIC_QUALITY: self.on_quality,
+            TOPIC_RESOURCES: self.on_resources,
+        }
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f"metrics-{self.stream}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.subscription.close()
+
+    def run(self):
+        while self.running:
+            event = self.subscription.get(timeout=1.0)
+            if event is None:
+                continue
+            topic, payload = event
+            try:
+                self.handlers[topic](payload)
+            except Exception as e:
+                print(f"Error actualizando métricas ({topic}): {e}")
+
+    def on_latency(self, result):
+        manifest = result.get('manifest_latency') or {}
+        if manifest.get('latency_ms') is not None:
+            self.registry.observe('lvl_manifest_latency_seconds', self.labels, manifest['latency_ms'] / 1000)
+        for segment in result.get('segment_latencies') or []:
+            if segment.get('latency_ms') is not None:
+                self.registry.observe('lvl_segment_latency_seconds', self.labels, segment['latency_ms'] / 1000)
+
+        segment_metrics = result.get('segment_metrics') or {}
+        # Gauges de la ventana, no un summary: el label "quantile" queda reservado a los summaries
+        for percentile in ('50', '95', '99'):
+            value = segment_metrics.get(f'p{percentile}_latency_ms')
+            if value is not None:
+                self.registry.set('lvl_segment_latency_percentile_seconds',
+                                  self.labels + (('percentile', percentile),), value / 1000)
+        manifest_metrics = result.get('manifest_metrics') or {}
+        if manifest_metrics.get('ewma_latency_ms') is not None:
+            self.registry.set('lvl_manifest_latency_ewma_seconds', self.labels, manifest_metrics['ewma_latency_ms'] / 1000)
+        for kind, metrics in (('manifest', manifest_metrics), ('segment', segment_metrics)):
+            if metrics.get('timeout_rate') is not None:
+                self.registry.set('lvl_request_timeout_ratio', self.labels + (('kind', kind),), metrics['timeout_rate'])
+
+    def on_adaptation(self, result):
+        analysis = result.get('adaptation_analysis') or {}
+        for segment in analysis.get('current_segments') or []:
+            if segment.get('availability_delay_s') is not None:
+                self.registry.set('lvl_availability_delay_seconds',
+                                  self.labels + (('representation', segment['representation_id']),),
+                                  segment['availability_delay_s'])
+
+        metrics = analysis.get('adaptation_metrics') or {}
+        for rep_id, summary in (metrics.get('measured_bitrates') or {}).items():
+            labels = self.labels + (('representation', rep_id),)
+            self.registry.set('lvl_declared_bitrate_bps', labels, summary['declared_bandwidth'])
+            if summary['last_measured_bitrate'] is not None:
+                self.registry.set('lvl_measured_bitrate_bps', labels, summary['last_measured_bitrate'])
+            if summary['peak_bitrate'] is not None:
+                self.registry.set('lvl_measured_bitrate_peak_bps', labels, summary['peak_bitrate'])
+
+        for rule, simulation in (metrics.get('abr_simulation') or {}).items():
+            if not isinstance(simulation, dict):
+                continue
+            labels = self.labels + (('rule', rule),)
+            self.registry.set('lvl_abr_selected_bitrate_bps', labels, simulation['selected_bitrate'])
+            self.registry.set('lvl_abr_buffer_seconds', labels, simulation['buffer_level'])
+            self.registry.set('lvl_abr_stall_seconds', labels, simulation['stall_time'])
+
+        aggregate = result.get('aggregate_metrics') or {}
+        if aggregate.get('stability_score') is not None:
+            self.registry.set('lvl_adaptation_stability_score', self.labels, aggregate['stability_score'])
+
+    def on_quality(self, result):
+        aggregate = result.get('aggregate_metrics') or {}
+        if aggregate.get('avg_bitrate') is not None:
+            self.registry.set('lvl_quality_avg_bitrate_bps', self.labels, aggregate['avg_bitrate'])
+        if aggregate.get('avg_ssim') is not None:
+            self.registry.set('lvl_quality_ssim', self.labels, aggregate['avg_ssim'])
+
+    def on_resources(self, payload):
+        if payload.get('profile'):
+            self.update_stages(payload['profile'])
+
+    def update_stages(self, stages):
+        """Resumen por etapa del profiler (profiling.Profiler.snapshot()['stages'])"""
+        for stage, stats in stages.items():
+            if not stats['count']:
+                continue
+            quantiles = [(q, stats[key] / 1000) for q, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms'))]
+            self.registry.set_summary('lvl_stage_duration_seconds', self.labels + (('stage', stage),),
+                                      quantiles, stats['total_s'], stats['count'])
+
+    def update_health(self, overall_metrics):
+        """Scores calculados por la suite en cada agregación"""
+        if overall_metrics['stream_health_score'] is not None:
+            self.registry.set('lvl_stream_health_score', self.labels, overall_metrics['stream_health_score'])
+        self.registry.set('lvl_stream_health_confidence', self.labels, overall_metrics['confidence'])
+        for component in ('quality', 'latency', 'adaptation'):
+            # Una dimensión sin datos no se exporta como 0
+            if overall_metrics[f'{component}_score'] is not None:
+                self.registry.set('lvl_stream_component_score', self.labels + (('component', component),),
+                                  overall_metrics[f'{component}_score'])
+
+
+class MetricsServer:
+    """Servidor HTTP mínimo que sirve el registro en /metrics"""
+
+    def __init__(self, registry, port, host='0.0.0.0', collectors=None):
+        self.registry = registry
+        self.collectors = collectors or []
+        registry_ref = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                for collector in registry_ref.collectors:
+                    collector()
+                body = registry_ref.registry.render()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Un scrape cada 15 s no necesita log
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+        print(f"✓ Métricas OpenMetrics en http://0.0.0.0:{self.port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,174 @@
+"""
+MPD Diff - Diferenciador incremental de manifests DASH
+Separa la estructura (periods, adaptation sets, representations, templates) del crecimiento
+del timeline para que los analizadores no repitan trabajo cuando el manifest no cambió.
+"""
+
+import hashlib
+import time
+import xml.etree.ElementTree as ET
+
+import stream_analisys_common as common
+import profiling
+
+# Tipos de eventos de cambio
+EVENT_UNCHANGED = 'unchanged'
+EVENT_LADDER_CHANGED = 'ladder_changed'
+EVENT_STRUCTURE_CHANGED = 'structure_changed'
+EVENT_NEW_PERIOD = 'new_period'
+EVENT_TIMELINE_ADVANCED = 'timeline_advanced'
+EVENT_PUBLISH_STALLED = 'publish_stalled'
+
+# Atributos del MPD que cambian en cada publicación y no forman parte de la estructura
+VOLATILE_MPD_ATTRIBUTES = ('publishTime',)
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class ManifestChange:
+    """Resultado de comparar un manifest con el anterior"""
+
+    def __init__(self, root, namespace, events):
+        self.root = root
+        self.namespace = namespace
+        self.events = events
+        self.types = {event['type'] for event in events}
+
+    def has(self, event_type):
+        return event_type in self.types
+
+    @property
+    def structure_changed(self):
+        """True si hay que volver a extraer representaciones y bitrates"""
+        return bool(self.types & {EVENT_LADDER_CHANGED, EVENT_STRUCTURE_CHANGED, EVENT_NEW_PERIOD})
+
+    @property
+    def content_changed(self):
+        return EVENT_UNCHANGED not in self.types
+
+
+class ManifestDiffer:
+    """Mantiene los hashes del último manifest y emite eventos tipados de cambio"""
+
+    def __init__(self, stall_grace=1.0):
+        self.stall_grace = stall_grace
+        self.root = None
+        self.namespace = common.MPD_NAMESPACE
+        self.content_hash = None
+        self.structure_hash = None
+        self.ladder_hash = None
+        self.timeline_hash = None
+        self.period_ids = ()
+        self.publish_time = None
+        # Último avance de publishTime o del timeline
+        self.progress_at = None
+        self.has_timeline = False
+        self.minimum_update_period = None
+        self.dynamic = False
+        self.stalled = False
+
+    def _hashes(self, root):
+        """Calcula hashes separados de estructura, escalera de bitrates y timeline"""
+        structure = hashlib.blake2b(digest_size=16)
+        ladder = set()
+        timeline = hashlib.blake2b(digest_size=16)
+        periods = []
+        timelines = []
+
+        def visit(element, in_timeline):
+            tag = _local(element.tag)
+            if tag == 'SegmentTimeline':
+                timelines.append(element)
+            in_timeline = in_timeline or tag == 'SegmentTimeline'
+            attributes = sorted(element.attrib.items())
+            if tag == 'MPD':
+                attributes = [(k, v) for k, v in attributes if k not in VOLATILE_MPD_ATTRIBUTES]
+            if tag == 'Period':
+                periods.append(element.get('id') or element.get('start') or str(len(periods)))
+
+            target = timeline if in_timeline else structure
+            target.update(tag.encode())
+            target.update(repr(attributes).encode())
+            if tag == 'Representation':
+                ladder.add((element.get('id') or '', element.get('bandwidth') or '', element.get('width') or '',
+                            element.get('height') or '', element.get('codecs') or ''))
+            for child in element:
+                visit(child, in_timeline)
+
+        visit(root, False)
+        ladder_hash = hashlib.blake2b(repr(sorted(ladder)).encode(), digest_size=16).digest()
+        return structure.digest(), ladder_hash, timeline.digest(), tuple(periods), bool(timelines)
+
+    def _check_stalled(self, now, events):
+        """Un manifest dinámico con SegmentTimeline cuyo publishTime y timeline no avanzan en más de
+        minimumUpdatePeriod está atascado. Con SegmentTemplate@duration el MPD no cambia nunca y no aplica."""
+        if not self.dynamic or not self.has_timeline or not self.minimum_update_period or self.progress_at is None:
+            return
+        stalled_for = now - self.progress_at
+        if stalled_for > self.minimum_update_period + self.stall_grace:
+            events.append({
+                'type': EVENT_PUBLISH_STALLED,
+                'publish_time': self.publish_time,
+                'stalled_seconds': stalled_for,
+                'minimum_update_period': self.minimum_update_period,
+                'first_detection': not self.stalled
+            })
+            self.stalled = True
+
+    def update(self, content, now=None):
+        """Compara los bytes del manifest con el anterior y devuelve un ManifestChange"""
+        now = time.monotonic() if now is None else now
+        events = []
+
+        content_hash = hashlib.blake2b(content, digest_size=16).digest()
+        if content_hash == self.content_hash:
+            # Recarga sin cambios: no se vuelve a parsear
+            events.append({'type': EVENT_UNCHANGED})
+            self._check_stalled(now, events)
+            return ManifestChange(self.root, self.namespace, events)
+
+        with profiling.span('mpd.parse'):
+            root = ET.fromstring(content)
+        with profiling.span('mpd.hash'):
+            structure_hash, ladder_hash, timeline_hash, period_ids, has_timeline = self._hashes(root)
+        first = self.content_hash is None
+
+        if not first:
+            new_periods = [p for p in period_ids if p not in self.period_ids]
+            if new_periods:
+                events.append({'type': EVENT_NEW_PERIOD, 'periods': new_periods})
+            if ladder_hash != self.ladder_hash:
+                events.append({'type': EVENT_LADDER_CHANGED})
+            elif structure_hash != self.structure_hash and not new_periods:
+                events.append({'type': EVENT_STRUCTURE_CHANGED})
+            if timeline_hash != self.timeline_hash:
+                events.append({'type': EVENT_TIMELINE_ADVANCED})
+        else:
+            events.append({'type': EVENT_STRUCTURE_CHANGED})
+
+        publish_time = root.get('publishTime')
+        if publish_time != self.publish_time or timeline_hash != self.timeline_hash or first:
+            self.publish_time = publish_time
+            self.progress_at = now
+            self.stalled = False
+
+        self.dynamic = root.get('type') == 'dynamic'
+        self.has_timeline = has_timeline
+        self.minimum_update_period = common.parse_iso_duration(root.get('minimumUpdatePeriod'))
+        self.root = root
+        self.content_hash = content_hash
+        self.structure_hash = structure_hash
+        self.ladder_hash = ladder_hash
+        self.timeline_hash = timeline_hash
+        self.period_ids = period_ids
+
+        if not events:
+            events.append({'type': EVENT_UNCHANGED})
+        self._check_stalled(now, events)
+        return ManifestChange(root, self.namespace, events)
+
+    def fetch(self, manifest_url, timeout=10):
+        """Descarga el manifest y lo compara con el anterior"""
+        return self.update(common.fetch_mpd_content(manifest_url, timeout))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Process Runner - Ejecuta cada analizador en su propio proceso supervisado
+Evita que la codificación JSON, ffprobe y matplotlib de un analizador compitan por el GIL
+con las mediciones de latencia de otro. Los resultados viajan por una cola al bus del proceso padre.
+"""
+
+import importlib
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+from event_bus import TOPIC_RESOURCES
+
+# Mensajes de la cola de resultados
+MSG_RESULT = 'result'
+MSG_READY = 'ready'
+
+
+class QueueEventBus:
+    """Bus del lado del proceso hijo: reenvía cada publicación a la cola del padre"""
+
+    def __init__(self, name, result_queue):
+        self.name = name
+        self.result_queue = result_queue
+        self.dropped = 0
+
+    def publish(self, topic, payload):
+        try:
+            self.result_queue.put_nowait((MSG_RESULT, self.name, topic, payload))
+        except queue.Full:
+            self.dropped += 1  # El padre no consume: se pierde el resultado, el análisis sigue
+
+
+def configure_runtime(runtime):
+    """Instala en el proceso hijo la traza, el governor y los circuit breakers configurados por el padre"""
+    import stream_analisys_common as common
+    if runtime.get('trace_path'):
+        from throughput_trace import TraceRecorder
+        common.set_trace_recorder(TraceRecorder(runtime['trace_path']))
+    if runtime.get('governor'):
+        from resource_governor import ResourceGovernor
+        common.set_resource_governor(ResourceGovernor(**runtime['governor']))
+    if runtime.get('circuit_breakers'):
+        from circuit_breaker import CircuitBreakerRegistry
+        common.set_circuit_breakers(CircuitBreakerRegistry(**runtime['circuit_breakers']))
+    if runtime.get('profile_path'):
+        import profiling
+        profiling.PROFILER.enable(runtime['profile_path'])
+        profiling.PROFILER.install_signal_handler()
+    return common
+
+
+def analyzer_worker(name, module_name, class_name, args, kwargs, result_queue, stop_event, runtime, metrics_interval=10):
+    """Punto de entrada del proceso hijo: construye el analizador y lo ejecuta hasta stop_event"""
+    # Ctrl+C lo gestiona el padre, que pide la detención por stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    common = configure_runtime(runtime)
+    import profiling
+
+    event_bus = QueueEventBus(name, result_queue)
+    analyzer_class = getattr(importlib.import_module(module_name), class_name)
+    analyzer = analyzer_class(*args, event_bus=event_bus, **kwargs)
+
+    def watch_stop():
+        # Mientras no se pida la detención, publicar esperas en cola y estado de los circuitos
+        while not stop_event.wait(metrics_interval):
+            governor = common.get_resource_governor()
+            breakers = common.get_circuit_breakers()
+            event_bus.publish(TOPIC_RESOURCES, {
+                'source': name,
+                'metrics': governor.metrics() if governor else None,
+                'circuits': breakers.summary() if breakers else None,
+                'profile': profiling.PROFILER.snapshot()['stages'],
+            })
+        analyzer.stop()
+
+    threading.Thread(target=watch_stop, name=f"{name}-stop", daemon=True).start()
+    result_queue.put((MSG_READY, name, None, None))
+    analyzer.start()
+    if runtime.get('profile_path'):
+        profiling.PROFILER.dump()
+
+
+class AnalyzerProcess:
+    """Proceso de un analizador con su evento de detención y contador de reinicios"""
+
+    def __init__(self, name, module_name, class_name, args=(), kwargs=None, runtime=None):
+        self.name = name
+        self.module_name = module_name
+        self.class_name = class_name
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.runtime = runtime or {}
+        self.process = None
+        self.stop_event = None
+        self.restarts = 0
+        self.started_at = None
+        self.last_exit_code = None
+
+    def start(self, context, result_queue):
+        self.stop_event = context.Event()
+        # No daemon: el adaptation analyzer lanza a su vez el proceso renderizador
+        self.process = context.Process(
+            target=analyzer_worker,
+            args=(self.name, self.module_name, self.class_name, self.args, self.kwargs,
+                  result_queue, self.stop_event, self.runtime),
+            name=f"analyzer-{self.name}",
+            daemon=False
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def request_stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def join(self, timeout):
+        """Espera la salida; si no termina a tiempo lo fuerza con SIGTERM y luego SIGKILL"""
+        process = self.process
+        if process is None:
+            return
+        process.join(timeout)
+        if process.is_alive():
+            print(f"⚠️  Analizador {self.name} no terminó en {timeout}s, forzando salida")
+            process.terminate()
+            process.join(2)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.last_exit_code = process.exitcode
+
+
+class AnalyzerSupervisor:
+    """Lanza los procesos de análisis, reenvía sus resultados al bus y reinicia los que caen"""
+
+    def __init__(self, event_bus, max_restarts=5, restart_backoff=2.0, stable_after=300.0, queue_size=1000):
+        self.event_bus = event_bus
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.stable_after = stable_after
+        # 'spawn' evita hacer fork de un proceso con hilos activos
+        self.context = multiprocessing.get_context('spawn')
+        self.result_queue = self.context.Queue(maxsize=queue_size)
+        self.analyzers = {}
+        self.pending_restarts = {}
+        self.running = False
+        self.stopping = False
+        self.thread = None
+
+    def add(self, name, module_name, class_name, *args, runtime=None, **kwargs):
+        """runtime: {'trace_path', 'governor', 'circuit_breakers', 'profile_path'} a instalar en el proceso hijo"""
+        self.analyzers[name] = AnalyzerProcess(name, module_name, class_name, args, kwargs, runtime)
+
+    def start(self):
+        self.running = True
+        for analyzer in self.analyzers.values():
+            analyzer.start(self.context, self.result_queue)
+        self.thread = threading.Thread(target=self.supervise, name='analyzer-supervisor', daemon=True)
+        self.thread.start()
+
+    def supervise(self):
+        """Bucle del padre: reenvía resultados y revisa el estado de los procesos"""
+        last_check = 0.0
+        while self.running:
+            try:
+                message = self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                break
+            if message:
+                kind, name, topic, payload = message
+                if kind == MSG_RESULT:
+                    self.event_bus.publish(topic, payload)
+                elif kind == MSG_READY:
+                    print(f"✓ Analizador {name} iniciado (proceso {self.analyzers[name].process.pid})")
+
+            now = time.monotonic()
+            if now - last_check >= 1.0:
+                last_check = now
+                self.check_processes(now)
+
+    def check_processes(self, now):
+        """Reinicia con backoff exponencial los procesos que terminaron inesperadamente"""
+        for name, analyzer in self.analyzers.items():
+            if self.stopping or analyzer.is_alive() or analyzer.process is None:
+                continue
+            if name not in self.pending_restarts:
+                analyzer.last_exit_code = analyzer.process.exitcode
+                # Un proceso que corrió estable un buen rato vuelve a tener todos sus reintentos
+                if now - analyzer.started_at >= self.stable_after:
+                    analyzer.restarts = 0
+                if analyzer.restarts >= self.max_restarts:
+                    print(f"✗ Analizador {name} cayó {analyzer.restarts} veces, no se reinicia")
+                    analyzer.process = None
+                    continue
+                delay = self.restart_backoff * (2 ** analyzer.restarts)
+                print(f"⚠️  Analizador {name} terminó (código {analyzer.last_exit_code}), reinicio en {delay:.0f}s")
+                self.pending_restarts[name] = now + delay
+            elif now >= self.pending_restarts[name]:
+                del self.pending_restarts[name]
+                analyzer.restarts += 1
+                analyzer.start(self.context, self.result_queue)
+
+    def stop(self, timeout=10):
+        """Pide la detención a todos los procesos, espera su salida y cierra la cola"""
+        # El hilo supervisor sigue vaciando la cola mientras los hijos terminan:
+        # un hijo con resultados sin enviar no puede salir si nadie lee la cola
+        self.stopping = True
+        for analyzer in self.analyzers.values():
+            analyzer.request_stop()
+        for analyzer in self.analyzers.values():
+            analyzer.join(timeout)
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        # Reenviar los últimos resultados que quedaron en la cola
+        while True:
+            try:
+                kind, name, topic, payload = self.result_queue.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                break
+            if kind == MSG_RESULT:
+                self.event_bus.publish(topic, payload)
+        self.result_queue.close()
+        self.result_queue.join_thread()
+
+    def status(self):
+        return {
+            name: {
+                'alive': analyzer.is_alive(),
+                'pid': analyzer.process.pid if analyzer.process else None,
+                'restarts': analyzer.restarts,
+                'last_exit_code': analyzer.last_exit_code,
+            }
+            for name, analyzer in self.analyzers.items()
+        }
@@ -0,0 +1,212 @@
+"""
+Profiling - Instrumentación por etapas de cada ciclo de análisis
+Spans con perf_counter_ns agregados en histogramas logarítmicos por etapa, volcados periódicamente a JSON.
+Con SIGUSR1 se captura bajo demanda un cProfile del siguiente ciclo de cada hilo y un snapshot de tracemalloc.
+"""
+
+import cProfile
+import json
+import os
+import signal
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Histograma logarítmico en nanosegundos: 4 sub-buckets por potencia de 2 (error relativo < 25%)
+HISTOGRAM_OCTAVES = 48
+HISTOGRAM_BUCKETS = HISTOGRAM_OCTAVES * 4
+
+
+def _bucket(elapsed_ns):
+    bits = elapsed_ns.bit_length()
+    if bits < 3:
+        return elapsed_ns
+    return min(bits * 4 + ((elapsed_ns >> (bits - 3)) & 3), HISTOGRAM_BUCKETS - 1)
+
+
+def _bucket_upper_bound(index):
+    if index < 12:
+        return min(index + 1, 4)  # 0-3 ns exactos; 4-11 no se usan
+    bits, sub = divmod(index, 4)
+    return (5 + sub) << (bits - 3)
+
+
+class StageStats:
+    """Conteo, total, mínimo, máximo e histograma logarítmico de la duración de una etapa"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, elapsed_ns):
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if self.min_ns is None or elapsed_ns < self.min_ns:
+            self.min_ns = elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.buckets[_bucket(elapsed_ns)] += 1
+
+    def percentile_ns(self, q):
+        """Cota superior del bucket que contiene el percentil q"""
+        if not self.count:
+            return None
+        target = self.count * q / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(_bucket_upper_bound(i), self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_s': self.total_ns / 1e9,
+            'mean_ms': self.total_ns / self.count / 1e6 if self.count else None,
+            'min_ms': self.min_ns / 1e6 if self.min_ns is not None else None,
+            'p50_ms': self.percentile_ns(50) / 1e6 if self.count else None,
+            'p95_ms': self.percentile_ns(95) / 1e6 if self.count else None,
+            'p99_ms': self.percentile_ns(99) / 1e6 if self.count else None,
+            'max_ms': self.max_ns / 1e6,
+        }
+
+
+class Profiler:
+    """Registro de spans por etapa, volcado periódico y captura bajo demanda"""
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.dump_path = None
+        self.dump_interval = 60
+        self.capture_dir = None
+        self.capture_duration = 30
+        self.capture_generation = 0
+        self.tracemalloc_until = None
+        self.dumper = None
+        self.wake = threading.Event()
+
+    @contextmanager
+    def span(self, stage):
+        """Mide la duración de una etapa (también si lanza excepción)"""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter_ns() - start)
+
+    def record(self, stage, elapsed_ns):
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(elapsed_ns)
+
+    def begin_tick(self, name):
+        """Inicia el span del ciclo; si hay una captura pendiente, perfila este ciclo con cProfile"""
+        self.end_tick()
+        profile = None
+        if self.capture_dir and getattr(self.local, 'generation', 0) < self.capture_generation:
+            self.local.generation = self.capture_generation
+            profile = cProfile.Profile()
+            profile.enable()
+        self.local.tick = (name, time.perf_counter_ns(), profile)
+
+    def end_tick(self):
+        """Cierra el span del ciclo actual del hilo (antes de esperar al siguiente)"""
+        current = getattr(self.local, 'tick', None)
+        if current is None:
+            return
+        self.local.tick = None
+        name, start, profile = current
+        self.record(f"{name}.tick", time.perf_counter_ns() - start)
+        if profile:
+            profile.disable()
+            path = os.path.join(self.capture_dir, f"profile_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pstats")
+            profile.dump_stats(path)
+            print(f"✓ Perfil del ciclo guardado en {path}")
+
+    def snapshot(self):
+        with self.lock:
+            stages = {stage: stats.summary() for stage, stats in self.stages.items()}
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'pid': os.getpid(),
+            'stages': dict(sorted(stages.items())),
+        }
+
+    def dump(self, path=None):
+        """Escribe el resumen de etapas de forma atómica"""
+        path = path or self.dump_path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def enable(self, dump_path, dump_interval=60, capture_dir=None, capture_duration=30):
+        """Activa el volcado periódico y el directorio de capturas bajo demanda"""
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.capture_dir = capture_dir or os.path.dirname(dump_path) or '.'
+        self.capture_duration = capture_duration
+        if self.dumper is None:
+            self.dumper = threading.Thread(target=self._dump_loop, name='profiler-dump', daemon=True)
+            self.dumper.start()
+
+    def _dump_loop(self):
+        while True:
+            self.wake.wait(min(self.dump_interval, 5) if self.tracemalloc_until else self.dump_interval)
+            self.wake.clear()
+            try:
+                if self.tracemalloc_until and time.monotonic() >= self.tracemalloc_until:
+                    self._write_tracemalloc()
+                self.dump()
+            except Exception as e:
+                print(f"Error volcando perfil: {e}")
+
+    def request_capture(self):
+        """Pide un cProfile del próximo ciclo de cada hilo e inicia tracemalloc durante capture_duration"""
+        self.capture_generation += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.tracemalloc_until = time.monotonic() + self.capture_duration
+            self.wake.set()
+        print(f"⚠️  Captura de perfil solicitada (tracemalloc durante {self.capture_duration}s)")
+
+    def _write_tracemalloc(self, limit=30):
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.tracemalloc_until = None
+        path = os.path.join(self.capture_dir, f"tracemalloc_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        with open(path, 'w') as f:
+            f.write(f"=== TOP {limit} ASIGNACIONES (pid {os.getpid()}) ===\n")
+            for stat in snapshot.statistics('lineno')[:limit]:
+                f.write(f"{stat}\n")
+        print(f"✓ Snapshot de tracemalloc guardado en {path}")
+
+    def install_signal_handler(self, signum=signal.SIGUSR1, forward=None):
+        """Captura bajo demanda con `kill -USR1 <pid>`; forward() devuelve pids a los que reenviar la señal"""
+        def handler(received, frame):
+            self.request_capture()
+            for pid in (forward() if forward else ()):
+                try:
+                    os.kill(pid, received)
+                except OSError:
+                    pass
+        signal.signal(signum, handler)
+
+
+# Profiler del proceso, compartido por todos los analizadores
+PROFILER = Profiler()
+span = PROFILER.span
+begin_tick = PROFILER.begin_tick
+end_tick = PROFILER.end_tick
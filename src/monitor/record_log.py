@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Record Log - Historial completo de registros por ciclo con índice temporal disperso
+Cada registro se agrega a una partición diaria JSONL; cada INDEX_STRIDE bytes se anota
+(timestamp, offset) en un índice binario. Una consulta por rango hace búsqueda binaria en el
+índice y lee por mmap solo los bytes del rango, sin cargar el historial en memoria.
+Uso: python3 record_log.py <directorio_history> <nombre> --from "2024-05-01 20:00" --to "2024-05-01 20:15" [--field ruta]
+"""
+
+import argparse
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+
+# Entrada del índice: timestamp (epoch, s) y offset del inicio de la línea
+INDEX_RECORD = struct.Struct('<dQ')
+INDEX_STRIDE = 64 * 1024
+
+PARTITION_FORMAT = '%Y%m%d'
+LINE_PREFIX = b'{"t":'
+
+
+def partition_paths(history_dir, name, epoch):
+    suffix = datetime.fromtimestamp(epoch, timezone.utc).strftime(PARTITION_FORMAT)
+    base = os.path.join(history_dir, f"{name}_{suffix}")
+    return f"{base}.jsonl", f"{base}.idx"
+
+
+def _partition_start(path):
+    suffix = os.path.basename(path).rsplit('_', 1)[-1].split('.')[0]
+    try:
+        return datetime.strptime(suffix, PARTITION_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def _line_timestamp(line):
+    # Las líneas empiezan con {"t":<epoch>, : el filtro por tiempo no necesita decodificar el JSON
+    return float(line[len(LINE_PREFIX):line.index(b',')])
+
+
+class RecordLog:
+    """Escritor append-only del historial de un analizador (un solo escritor por nombre)"""
+
+    def __init__(self, history_dir, name, ttl=7 * 86400):
+        self.history_dir = history_dir
+        self.name = name
+        self.ttl = ttl
+        os.makedirs(history_dir, exist_ok=True)
+        self.partition = None
+        self.data = None
+        self.index = None
+        self.last_indexed = 0
+        self.last_timestamp = None
+
+    def _open(self, epoch):
+        self.close()
+        data_path, index_path = partition_paths(self.history_dir, self.name, epoch)
+        self.data = open(data_path, 'ab')
+        self.index = open(index_path, 'ab')
+        self._repair()
+        self.partition = os.path.basename(data_path)
+        self.expire(epoch)
+
+    def _repair(self):
+        """Tras un corte: descarta la línea incompleta del final y las entradas de índice que apuntan fuera"""
+        size = self.data.tell()
+        if size:
+            with open(self.data.name, 'rb') as f:
+                end = size
+                while end > 0:
+                    start = max(0, end - INDEX_STRIDE)
+                    f.seek(start)
+                    chunk = f.read(end - start)
+                    newline = chunk.rfind(b'\n')
+                    if newline >= 0:
+                        size = start + newline + 1
+                        break
+                    end = start
+                else:
+                    size = 0
+            self.data.truncate(size)
+            self.data.seek(size)
+
+        index_size = self.index.tell()
+        index_size -= index_size % INDEX_RECORD.size
+        entries = []
+        if index_size:
+            with open(self.index.name, 'rb') as f:
+                entries = [entry for entry in INDEX_RECORD.iter_unpack(f.read(index_size)) if entry[1] < size]
+        self.index.truncate(len(entries) * INDEX_RECORD.size)
+        self.index.seek(len(entries) * INDEX_RECORD.size)
+        self.last_indexed = entries[-1][1] if entries else None
+        self.last_timestamp = entries[-1][0] if entries else None
+        if size and entries:
+            # Último timestamp real de la partición (para mantener el orden no decreciente)
+            with open(self.data.name, 'rb') as f:
+                f.seek(entries[-1][1])
+                for line in f:
+                    self.last_timestamp = _line_timestamp(line)
+
+    def append(self, record, now=None):
+        now = time.time() if now is None else now
+        data_path, _ = partition_paths(self.history_dir, self.name, now)
+        if self.partition != os.path.basename(data_path):
+            self._open(now)
+        # Timestamps no decrecientes dentro de la partición: la búsqueda binaria depende del orden
+        if self.last_timestamp is not None:
+            now = max(now, self.last_timestamp)
+        self.last_timestamp = now
+
+        offset = self.data.tell()
+        if self.last_indexed is None or offset - self.last_indexed >= INDEX_STRIDE:
+            self.index.write(INDEX_RECORD.pack(now, offset))
+            self.index.flush()
+            self.last_indexed = offset
+        line = b'%s%.3f,"record":%s}\n' % (LINE_PREFIX, now, json.dumps(record, separators=(',', ':')).encode())
+        self.data.write(line)
+        self.data.flush()
+
+    def expire(self, now=None):
+        """Borra las particiones diarias completas que superaron el TTL"""
+        now = time.time() if now is None else now
+        for path in glob.glob(os.path.join(self.history_dir, f"{self.name}_*.jsonl")) + \
+                glob.glob(os.path.join(self.history_dir, f"{self.name}_*.idx")):
+            start = _partition_start(path)
+            if start is not None and start + 86400 < now - self.ttl:
+                os.remove(path)
+
+    def close(self):
+        for f in (self.data, self.index):
+            if f is not None:
+                f.close()
+        self.data = self.index = self.partition = None
+
+
+def _seek_offset(index_path, start):
+    """Offset de la última entrada del índice con timestamp < start (búsqueda binaria sobre mmap)"""
+    try:
+        size = os.path.getsize(index_path)
+    except OSError:
+        return 0
+    count = size // INDEX_RECORD.size
+    if not count or start is None:
+        return 0
+    with open(index_path, 'rb') as f, mmap.mmap(f.fileno(), count * INDEX_RECORD.size, access=mmap.ACCESS_READ) as mm:
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX_RECORD.unpack_from(mm, mid * INDEX_RECORD.size)[0] < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        return 0 if lo == 0 else INDEX_RECORD.unpack_from(mm, (lo - 1) * INDEX_RECORD.size)[1]
+
+
+def read_partition(data_path, index_path, start=None, end=None):
+    """(timestamp, registro) de una partición con start <= t <= end"""
+    try:
+        size = os.path.getsize(data_path)
+    except OSError:
+        return
+    if not size:
+        return
+    with open(data_path, 'rb') as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+        pos = _seek_offset(index_path, start)
+        while pos < size:
+            newline = mm.find(b'\n', pos)
+            if newline < 0:
+                break  # Línea a medio escribir
+            line = mm[pos:newline]
+            pos = newline + 1
+            try:
+                timestamp = _line_timestamp(line)
+            except ValueError:
+                continue
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp > end:
+                break
+            try:
+                yield timestamp, json.loads(line)['record']
+            except ValueError:
+                continue
+
+
+def query_history(history_dir, name, start=None, end=None):
+    """Registros del rango en orden temporal leyendo solo las particiones e intervalos necesarios"""
+    partitions = []
+    for data_path in glob.glob(os.path.join(history_dir, f"{name}_*.jsonl")):
+        partition_start = _partition_start(data_path)
+        if partition_start is None:
+            continue
+        if (end is not None and partition_start > end) or (start is not None and partition_start + 86400 < start):
+            continue
+        partitions.append((partition_start, data_path))
+    for _, data_path in sorted(partitions):
+        yield from read_partition(data_path, data_path[:-len('.jsonl')] + '.idx', start, end)
+
+
+def project(record, fields):
+    """Subconjunto {ruta: valor} de un registro para respuestas compactas ('segment_metrics.avg_latency_ms')"""
+    projected = {}
+    for path in fields:
+        value = record
+        for key in path.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        projected[path] = value
+    return projected
+
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consulta por rango el historial persistido de un analizador')
+    parser.add_argument('history_dir', help='Directorio history/ del analizador')
+    parser.add_argument('name', help='Nombre del historial (latency, quality, adaptation, suite, monitor)')
+    parser.add_argument('--from', dest='start', required=True, help='Inicio (ISO local o epoch)')
+    parser.add_argument('--to', dest='end', required=True, help='Fin (ISO local o epoch)')
+    parser.add_argument('--field', action='append', default=[], help='Campo a mostrar (ruta con puntos, repetible)')
+    args = parser.parse_args()
+
+    query_start = time.perf_counter()
+    records = list(query_history(args.history_dir, args.name, _parse_time(args.start), _parse_time(args.end)))
+    elapsed_ms = (time.perf_counter() - query_start) * 1000
+
+    if not args.field:
+        for timestamp, record in records:
+            print(json.dumps(record))
+        print(f"✓ {len(records)} registros en {elapsed_ms:.1f} ms")
+        return
+
+    # Reporte del rango: cada valor y resumen por campo
+    for timestamp, record in records:
+        values = project(record, args.field)
+        print(f"{datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')}  "
+              + "  ".join(f"{field}={value}" for field, value in values.items()))
+    print()
+    for field in args.field:
+        values = [value for value in (project(record, [field])[field] for _, record in records)
+                  if isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value)]
+        if values:
+            print(f"{field}: n={len(values)} mín={min(values):.3f} media={sum(values) / len(values):.3f} "
+                  f"máx={max(values):.3f}")
+        else:
+            print(f"{field}: sin valores en el rango")
+    print(f"✓ {len(records)} registros en {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
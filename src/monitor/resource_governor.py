@@ -0,0 +1,206 @@
+"""
+Resource Governor - Presupuesto compartido de peticiones salientes y procesos ffmpeg/ffprobe
+Limita la tasa por origen (token bucket), las peticiones en vuelo y los trabajos de ffmpeg concurrentes.
+Las esperas se atienden por prioridad: las sondas de latencia pasan antes que el trabajo pesado de calidad.
+"""
+
+import heapq
+import itertools
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Clases de prioridad (menor valor = se atiende antes)
+PRIORITY_LATENCY = 0
+PRIORITY_ADAPTATION = 1
+PRIORITY_QUALITY = 2
+PRIORITY_DEFAULT = PRIORITY_ADAPTATION
+
+PRIORITY_NAMES = {
+    PRIORITY_LATENCY: 'latency',
+    PRIORITY_ADAPTATION: 'adaptation',
+    PRIORITY_QUALITY: 'quality',
+}
+
+
+class GovernorTimeout(Exception):
+    """No se obtuvo el recurso dentro del tiempo máximo de espera"""
+
+
+class WaitStats:
+    """Tiempos de espera en cola de un recurso para una clase de prioridad"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_wait_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'max_wait_ms': self.max * 1000,
+            'last_wait_ms': self.last * 1000,
+        }
+
+
+class PriorityLimiter:
+    """Límite de concurrencia y/o tasa (token bucket) con cola de espera ordenada por prioridad"""
+
+    def __init__(self, max_concurrent=None, rate=None, burst=None):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst or (max(1.0, rate) if rate else None)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.waits = {}
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _blocked_for(self, now):
+        """0 si hay cupo; segundos hasta el próximo token; None si hay que esperar una liberación"""
+        if self.max_concurrent is not None and self.in_flight >= self.max_concurrent:
+            return None
+        if self.rate:
+            self._refill(now)
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+        return 0
+
+    def acquire(self, priority=PRIORITY_DEFAULT, timeout=None):
+        """Espera turno y cupo; devuelve el tiempo de espera en segundos"""
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        with self.condition:
+            entry = (priority, next(self.sequence))
+            heapq.heappush(self.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    blocked = self._blocked_for(now) if self.waiters[0] == entry else None
+                    if blocked == 0:
+                        break
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise GovernorTimeout(f"Sin cupo tras {timeout:.1f}s")
+                        blocked = remaining if blocked is None else min(blocked, remaining)
+                    self.condition.wait(blocked)
+            finally:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+                # El siguiente en la cola puede tener cupo ahora
+                self.condition.notify_all()
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+            waited = time.monotonic() - start
+            self.waits.setdefault(priority, WaitStats()).add(waited)
+            return waited
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def metrics(self):
+        with self.condition:
+            return {
+                'in_flight': self.in_flight,
+                'queued': len(self.waiters),
+                'waits': {PRIORITY_NAMES.get(p, str(p)): stats.summary() for p, stats in self.waits.items()},
+            }
+
+
+class ResourceGovernor:
+    """Presupuesto compartido por todos los analizadores de un proceso"""
+
+    def __init__(self, origin_rate=10.0, origin_burst=10, max_in_flight=8, max_jobs=2, acquire_timeout=60.0):
+        self.origin_rate = origin_rate
+        self.origin_burst = origin_burst
+        self.acquire_timeout = acquire_timeout
+        self.in_flight = PriorityLimiter(max_concurrent=max_in_flight)
+        self.jobs = PriorityLimiter(max_concurrent=max_jobs)
+        self.origins = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def config(self):
+        """Parámetros para reconstruir el mismo governor en otro proceso"""
+        return {
+            'origin_rate': self.origin_rate,
+            'origin_burst': self.origin_burst,
+            'max_in_flight': self.in_flight.max_concurrent,
+            'max_jobs': self.jobs.max_concurrent,
+            'acquire_timeout': self.acquire_timeout,
+        }
+
+    def set_thread_priority(self, priority):
+        """Prioridad por defecto de las peticiones emitidas desde el hilo actual"""
+        self.local.priority = priority
+
+    def thread_priority(self):
+        return getattr(self.local, 'priority', PRIORITY_DEFAULT)
+
+    def origin_limiter(self, url):
+        origin = urlparse(url).netloc
+        limiter = self.origins.get(origin)
+        if limiter is None:
+            with self.lock:
+                limiter = self.origins.setdefault(origin, PriorityLimiter(rate=self.origin_rate, burst=self.origin_burst))
+        return limiter
+
+    @contextmanager
+    def request(self, url, priority=None):
+        """Reserva un token del origen y un hueco de petición en vuelo"""
+        priority = self.thread_priority() if priority is None else priority
+        origin = self.origin_limiter(url)
+        origin.acquire(priority, self.acquire_timeout)
+        # El token de tasa se consume al salir; el origen no limita concurrencia
+        origin.release()
+        self.in_flight.acquire(priority, self.acquire_timeout)
+        try:
+            yield
+        finally:
+            self.in_flight.release()
+
+    @contextmanager
+    def job(self, priority=None):
+        """Reserva un hueco para un proceso ffmpeg/ffprobe"""
+        priority = self.thread_priority() if priority is None else priority
+        self.jobs.acquire(priority, self.acquire_timeout)
+        try:
+            yield
+        finally:
+            self.jobs.release()
+
+    def run(self, cmd, priority=None, **kwargs):
+        """subprocess.run dentro del límite de trabajos concurrentes"""
+        with self.job(priority):
+            return subprocess.run(cmd, **kwargs)
+
+    def metrics(self):
+        with self.lock:
+            origins = dict(self.origins)
+        return {
+            'in_flight': self.in_flight.metrics(),
+            'jobs': self.jobs.metrics(),
+            'origins': {origin: limiter.metrics()['waits'] for origin, limiter in origins.items()},
+        }
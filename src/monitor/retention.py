@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Retention - Retención de historial con rollups de 1 minuto y 1 hora
+Los datos crudos por ciclo se mantienen solo durante una ventana configurable; antes de descartarse
+quedan resumidos (count, min, max, media y sketch de percentiles) en archivos JSONL particionados por
+fecha, que se borran enteros al vencer su TTL. Los registros completos van además al historial indexado
+(record_log) para consultas por rango.
+Uso: python3 retention.py <directorio_rollups> <nombre> <campo> [--resolution 1h] [--days 30]
+"""
+
+import argparse
+import bisect
+import glob
+import json
+import math
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+
+from record_log import RecordLog
+
+RESOLUTION_MINUTE = '1m'
+RESOLUTION_HOUR = '1h'
+
+# Partición de archivos por resolución: diaria para minutos, mensual para horas
+PARTITION_FORMATS = {
+    RESOLUTION_MINUTE: '%Y%m%d',
+    RESOLUTION_HOUR: '%Y%m',
+}
+
+
+class RetentionPolicy:
+    """Ventana de datos crudos, TTL de cada nivel de rollup y del historial indexado (segundos)"""
+
+    def __init__(self, raw_window=3600, minute_ttl=7 * 86400, hour_ttl=400 * 86400, history_ttl=7 * 86400):
+        self.raw_window = raw_window
+        self.minute_ttl = minute_ttl
+        self.hour_ttl = hour_ttl
+        self.history_ttl = history_ttl
+
+    def ttl(self, resolution):
+        return self.minute_ttl if resolution == RESOLUTION_MINUTE else self.hour_ttl
+
+
+class LogSketch:
+    """Sketch de percentiles con error relativo acotado (buckets logarítmicos), combinable entre rollups"""
+
+    def __init__(self, relative_accuracy=0.02):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        self.count += count
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Punto medio del bucket en escala logarítmica
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {'z': self.zero_count, 'b': {str(k): v for k, v in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, data, relative_accuracy=0.02):
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = data.get('z', 0)
+        sketch.bins = {int(k): v for k, v in data.get('b', {}).items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+class FieldRollup:
+    """Agregado de un campo numérico dentro de un bucket de tiempo"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = LogSketch()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'sketch': self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        rollup = cls()
+        rollup.count = data['count']
+        rollup.total = (data['mean'] or 0) * data['count']
+        rollup.min, rollup.max = data['min'], data['max']
+        rollup.sketch = LogSketch.from_dict(data['sketch'])
+        return rollup
+
+
+class Rollup:
+    """Bucket de tiempo (inicio en epoch) con un FieldRollup por campo"""
+
+    def __init__(self, start):
+        self.start = start
+        self.fields = {}
+
+    def add(self, field, value):
+        rollup = self.fields.get(field)
+        if rollup is None:
+            rollup = self.fields[field] = FieldRollup()
+        rollup.add(value)
+
+    def merge(self, other):
+        for field, rollup in other.fields.items():
+            if field not in self.fields:
+                self.fields[field] = FieldRollup()
+            self.fields[field].merge(rollup)
+
+    def to_dict(self):
+        return {
+            'start': datetime.fromtimestamp(self.start, timezone.utc).isoformat(),
+            'epoch': self.start,
+            'fields': {field: rollup.to_dict() for field, rollup in self.fields.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, entry):
+        rollup = cls(entry['epoch'])
+        rollup.fields = {field: FieldRollup.from_dict(data) for field, data in entry['fields'].items()}
+        return rollup
+
+
+def add_retention_arguments(parser):
+    """Opciones de retención comunes a los analizadores, la suite y el monitor"""
+    parser.add_argument('--raw-window', type=float, default=3600,
+                        help='Segundos de datos crudos por ciclo que se conservan (el resto queda en rollups)')
+    parser.add_argument('--minute-rollup-days', type=float, default=7, help='Días de retención de los rollups de 1 minuto')
+    parser.add_argument('--hour-rollup-days', type=float, default=400, help='Días de retención de los rollups de 1 hora')
+    parser.add_argument('--history-days', type=float, default=7,
+                        help='Días de retención del historial completo indexado (history/)')
+
+
+def policy_from_args(args):
+    return RetentionPolicy(args.raw_window, args.minute_rollup_days * 86400, args.hour_rollup_days * 86400,
+                           args.history_days * 86400)
+
+
+def _extract(record, path):
+    """Valor numérico de un campo con ruta separada por puntos ('manifest_latency.latency_ms')"""
+    value = record
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+        return None
+    return value
+
+
+def partition_path(rollup_dir, name, resolution, epoch):
+    suffix = datetime.fromtimestamp(epoch, timezone.utc).strftime(PARTITION_FORMATS[resolution])
+    return os.path.join(rollup_dir, f"{name}_{resolution}_{suffix}.jsonl")
+
+
+def _read_rollups(path):
+    entries = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # Línea a medio escribir
+    except OSError:
+        pass
+    return entries
+
+
+class RetentionStore:
+    """Historial acotado: lista de registros crudos recientes + rollups persistidos de 1 min y 1 h + historial indexado"""
+
+    def __init__(self, name, output_dir, fields, policy=None):
+        self.name = name
+        self.fields = fields
+        self.policy = policy or RetentionPolicy()
+        self.rollup_dir = os.path.join(output_dir, 'rollups')
+        os.makedirs(self.rollup_dir, exist_ok=True)
+        self.history = RecordLog(os.path.join(output_dir, 'history'), name, self.policy.history_ttl)
+        # Lista compartida con el analizador (se recorta en el lugar)
+        self.records = []
+        self.times = []
+        self.total_added = 0
+        self.first_timestamp = None
+        self.minute = None
+        self.hour = None
+        # Identificador de cada bucket abierto, escrito con él: al restaurar un checkpoint se reconocen
+        # los buckets que ya se cerraron después (y los minutos que el bucket horario aún no incluye)
+        self.minute_id = None
+        self.hour_id = None
+        self.hour_minutes = set()
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record, now=None):
+        now = time.time() if now is None else now
+        if self.first_timestamp is None:
+            self.first_timestamp = record.get('timestamp') or datetime.now().isoformat()
+        self.records.append(record)
+        self.times.append(now)
+        self.total_added += 1
+        self.history.append(record, now)
+
+        minute_start = int(now // 60) * 60
+        if self.minute is not None and self.minute.start != minute_start:
+            self._close_minute()
+        if self.minute is None:
+            self.minute = Rollup(minute_start)
+            self.minute_id = secrets.token_hex(8)
+        for field in self.fields:
+            value = _extract(record, field)
+            if value is not None:
+                self.minute.add(field, value)
+
+        self._trim(now)
+
+    def _trim(self, now):
+        """Descarta los registros crudos fuera de la ventana (ya están incluidos en los rollups)"""
+        cutoff = now - self.policy.raw_window
+        if self.times and self.times[0] < cutoff:
+            index = bisect.bisect_left(self.times, cutoff)
+            del self.records[:index]
+            del self.times[:index]
+
+    def _write(self, resolution, rollup, **ids):
+        entry = dict(rollup.to_dict(), **ids)
+        with open(partition_path(self.rollup_dir, self.name, resolution, rollup.start), 'a') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def _close_minute(self):
+        minute, self.minute = self.minute, None
+        hour_start = minute.start // 3600 * 3600
+        if self.hour is not None and self.hour.start != hour_start:
+            self._close_hour()
+        if self.hour is None:
+            self.hour = Rollup(hour_start)
+            self.hour_id = secrets.token_hex(8)
+            self.hour_minutes = set()
+        self._write(RESOLUTION_MINUTE, minute, id=self.minute_id, hour=self.hour_id)
+        self.hour.merge(minute)
+        self.hour_minutes.add(self.minute_id)
+
+    def _close_hour(self):
+        hour, self.hour = self.hour, None
+        self._write(RESOLUTION_HOUR, hour, id=self.hour_id)
+        self.expire(hour.start + 3600)
+
+    def expire(self, now=None):
+        """Borra las particiones de rollups cuyo contenido completo superó el TTL"""
+        now = time.time() if now is None else now
+        for resolution, span in ((RESOLUTION_MINUTE, 86400), (RESOLUTION_HOUR, 31 * 86400)):
+            cutoff = now - self.policy.ttl(resolution)
+            for path in glob.glob(os.path.join(self.rollup_dir, f"{self.name}_{resolution}_*.jsonl")):
+                suffix = os.path.basename(path).rsplit('_', 1)[-1][:-len('.jsonl')]
+                try:
+                    start = datetime.strptime(suffix, PARTITION_FORMATS[resolution]).replace(tzinfo=timezone.utc).timestamp()
+                except ValueError:
+                    continue
+                if start + span < cutoff:
+                    os.remove(path)
+
+    def get_state(self):
+        """Estado para el checkpoint: ventana cruda, totales y buckets aún abiertos"""
+        return {
+            'records': self.records,
+            'times': self.times,
+            'total_added': self.total_added,
+            'first_timestamp': self.first_timestamp,
+            'minute': self.minute,
+            'hour': self.hour,
+            'minute_id': self.minute_id,
+            'hour_id': self.hour_id,
+            'hour_minutes': set(self.hour_minutes),
+        }
+
+    def _written_ids(self, resolution, epoch):
+        return {entry.get('id') for entry in _read_rollups(partition_path(self.rollup_dir, self.name, resolution, epoch))
+                if entry['epoch'] == epoch}
+
+    def restore_state(self, state):
+        # La lista de registros se reemplaza en el lugar: los analizadores mantienen la referencia
+        self.records[:] = state['records']
+        self.times[:] = state['times']
+        self.total_added = state['total_added']
+        self.first_timestamp = state['first_timestamp']
+        self.minute = state['minute']
+        self.hour = state['hour']
+        self.minute_id = state.get('minute_id')
+        self.hour_id = state.get('hour_id')
+        self.hour_minutes = set(state.get('hour_minutes', ()))
+
+        # Un corte después de cerrar un bucket y antes del siguiente checkpoint: restaurarlo lo escribiría
+        # dos veces y query_rollups (que combina epochs repetidos) lo contaría doble
+        if self.hour is not None and self.hour_id is not None:
+            if self.hour_id in self._written_ids(RESOLUTION_HOUR, self.hour.start):
+                self.hour = None
+            else:
+                # Minutos cerrados tras el checkpoint: ya están en disco pero no en el bucket horario restaurado
+                for entry in _read_rollups(partition_path(self.rollup_dir, self.name, RESOLUTION_MINUTE, self.hour.start)):
+                    if entry.get('hour') == self.hour_id and entry.get('id') not in self.hour_minutes:
+                        self.hour.merge(Rollup.from_dict(entry))
+                        self.hour_minutes.add(entry['id'])
+        if self.minute is not None and self.minute_id is not None and \
+                self.minute_id in self._written_ids(RESOLUTION_MINUTE, self.minute.start):
+            self.minute = None
+        if self.hour is None:
+            self._reopen_hour()
+        self._trim(time.time())
+
+    def _reopen_hour(self):
+        """Reconstruye desde disco un bucket horario abierto después del checkpoint (sus minutos ya se escribieron)"""
+        paths = sorted(glob.glob(os.path.join(self.rollup_dir, f"{self.name}_{RESOLUTION_MINUTE}_*.jsonl")))
+        entries = _read_rollups(paths[-1]) if paths else []
+        if not entries or entries[-1].get('hour') is None:
+            return
+        hour_id = entries[-1]['hour']
+        hour_start = entries[-1]['epoch'] // 3600 * 3600
+        if hour_id in self._written_ids(RESOLUTION_HOUR, hour_start):
+            return
+        self.hour = Rollup(hour_start)
+        self.hour_id = hour_id
+        self.hour_minutes = set()
+        for entry in entries:
+            if entry.get('hour') == hour_id:
+                self.hour.merge(Rollup.from_dict(entry))
+                self.hour_minutes.add(entry['id'])
+
+    def close(self):
+        """Persiste los buckets abiertos (al detener el analizador)"""
+        if self.minute is not None:
+            self._close_minute()
+        if self.hour is not None:
+            self._write(RESOLUTION_HOUR, self.hour, id=self.hour_id)
+            self.hour = None
+        self.history.close()
+
+
+def query_rollups(rollup_dir, name, field, since=None, until=None, resolution=RESOLUTION_HOUR, quantiles=(0.5, 0.95, 0.99)):
+    """Serie de (epoch, count, min, max, mean, percentiles) de un campo leyendo solo las particiones del rango"""
+    until = time.time() if until is None else until
+    since = until - 30 * 86400 if since is None else since
+    fmt = PARTITION_FORMATS[resolution]
+    first = datetime.fromtimestamp(since, timezone.utc).strftime(fmt)
+    last = datetime.fromtimestamp(until, timezone.utc).strftime(fmt)
+
+    buckets = {}
+    for path in sorted(glob.glob(os.path.join(rollup_dir, f"{name}_{resolution}_*.jsonl"))):
+        suffix = os.path.basename(path).rsplit('_', 1)[-1][:-len('.jsonl')]
+        if not first <= suffix <= last:
+            continue
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if not since <= entry['epoch'] < until or field not in entry['fields']:
+                    continue
+                rollup = FieldRollup.from_dict(entry['fields'][field])
+                # Un bucket puede aparecer más de una vez (cierre parcial al reiniciar): se combinan
+                if entry['epoch'] in buckets:
+                    buckets[entry['epoch']].merge(rollup)
+                else:
+                    buckets[entry['epoch']] = rollup
+
+    series = []
+    for epoch in sorted(buckets):
+        rollup = buckets[epoch]
+        point = {
+            'epoch': epoch,
+            'count': rollup.count,
+            'min': rollup.min,
+            'max': rollup.max,
+            'mean': rollup.total / rollup.count if rollup.count else None,
+        }
+        for q in quantiles:
+            point[f'p{int(round(q * 100))}'] = rollup.sketch.quantile(q)
+        series.append(point)
+    return series
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consulta de tendencias sobre los rollups de retención')
+    parser.add_argument('rollup_dir', help='Directorio rollups/ de un analizador')
+    parser.add_argument('name', help='Nombre del historial (latency, quality, adaptation, suite, monitor)')
+    parser.add_argument('field', help="Campo con ruta separada por puntos, p.ej. 'manifest_latency.latency_ms'")
+    parser.add_argument('--resolution', choices=[RESOLUTION_MINUTE, RESOLUTION_HOUR], default=RESOLUTION_HOUR)
+    parser.add_argument('--days', type=float, default=30, help='Días hacia atrás')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    series = query_rollups(args.rollup_dir, args.name, args.field, since=time.time() - args.days * 86400,
+                           resolution=args.resolution)
+    for point in series:
+        stamp = datetime.fromtimestamp(point['epoch'], timezone.utc).strftime('%Y-%m-%d %H:%M')
+        print(f"{stamp}  n={point['count']:<6} min={point['min']:.3f} media={point['mean']:.3f} "
+              f"p95={point['p95']:.3f} máx={point['max']:.3f}")
+    print(f"✓ {len(series)} buckets en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Segment Bitrate - Bitrate real por segmento y representación frente al bandwidth declarado en el MPD
+"""
+
+import os
+import re
+import struct
+from array import array
+from collections import deque
+
+from metric_history import RunningStats
+
+# Registro persistido por segmento: timestamp, número, bytes, duración (s), bandwidth declarado
+SEGMENT_RECORD = struct.Struct('<dIIfI')
+
+
+class RepresentationBitrates:
+    """Columnas compactas (array) con todos los segmentos medidos de una representación"""
+
+    def __init__(self, rep_id, declared_bandwidth, window=30):
+        self.rep_id = rep_id
+        self.declared_bandwidth = declared_bandwidth
+        self.timestamps = array('d')
+        self.numbers = array('I')
+        self.sizes = array('I')
+        self.durations = array('f')
+        self.window = deque(maxlen=window)
+        self.window_total = 0.0
+        self.stats = RunningStats()
+        self.exceed_count = 0
+
+    def __len__(self):
+        return len(self.numbers)
+
+    @property
+    def last_number(self):
+        return self.numbers[-1] if self.numbers else None
+
+    def add(self, timestamp, number, size_bytes, duration, tolerance):
+        measured = size_bytes * 8 / duration
+        self.timestamps.append(timestamp)
+        self.numbers.append(number)
+        self.sizes.append(size_bytes)
+        self.durations.append(duration)
+
+        if len(self.window) == self.window.maxlen:
+            self.window_total -= self.window[0]
+        self.window.append(measured)
+        self.window_total += measured
+        self.stats.add(measured)
+
+        exceeds = bool(self.declared_bandwidth) and measured > self.declared_bandwidth * tolerance
+        if exceeds:
+            self.exceed_count += 1
+        return measured, exceeds
+
+    def summary(self):
+        return {
+            'declared_bandwidth': self.declared_bandwidth,
+            'last_measured_bitrate': self.window[-1] if self.window else None,
+            'rolling_mean_bitrate': self.window_total / len(self.window) if self.window else None,
+            'rolling_peak_bitrate': max(self.window) if self.window else None,
+            'mean_bitrate': self.stats.mean if self.stats.count else None,
+            'peak_bitrate': self.stats.max,
+            'peak_to_declared': self.stats.max / self.declared_bandwidth if self.stats.count and self.declared_bandwidth else None,
+            'segments_measured': len(self),
+            'segments_over_declared': self.exceed_count,
+        }
+
+
+class SegmentBitrateTracker:
+    """Registra el bitrate medido de cada segmento (bytes reales / duración del timeline)"""
+
+    def __init__(self, store_dir=None, window=30, tolerance=1.0):
+        self.store_dir = store_dir
+        self.window = window
+        self.tolerance = tolerance
+        self.representations = {}
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+    def _store_path(self, rep_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', rep_id) or 'default'
+        return os.path.join(self.store_dir, f"{safe_id}.bin")
+
+    def record(self, rep_id, declared_bandwidth, number, size_bytes, duration, timestamp):
+        """Agrega un segmento; devuelve None si ya estaba medido o los datos no son válidos"""
+        if not size_bytes or not duration:
+            return None
+        rep = self.representations.get(rep_id)
+        if rep is None or rep.declared_bandwidth != declared_bandwidth:
+            rep = self.representations[rep_id] = RepresentationBitrates(rep_id, declared_bandwidth, self.window)
+        if rep.last_number == number:
+            return None
+
+        measured, exceeds = rep.add(timestamp, number, size_bytes, duration, self.tolerance)
+        if self.store_dir:
+            # Almacenamiento append-only: 24 bytes por segmento
+            with open(self._store_path(rep_id), 'ab') as f:
+                f.write(SEGMENT_RECORD.pack(timestamp, number, size_bytes, duration, declared_bandwidth or 0))
+        return {
+            'measured_bitrate': measured,
+            'exceeds_declared': exceeds,
+        }
+
+    def summaries(self):
+        return {rep_id: rep.summary() for rep_id, rep in self.representations.items()}
+
+
+def load_segment_store(path):
+    """Lee un archivo de segmentos persistidos como lista de tuplas (timestamp, número, bytes, duración, declarado)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % SEGMENT_RECORD.size
+    return list(SEGMENT_RECORD.iter_unpack(data[:usable]))
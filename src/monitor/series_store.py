@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Series Store - Series temporales append-only con consultas por rango y downsampling
+Un archivo por stream y métrica con registros fijos de 16 bytes (timestamp, valor); las consultas
+buscan el rango con búsqueda binaria sobre un mmap y reducen a N puntos con LTTB o min/max.
+Uso: python3 series_store.py <directorio_series> [stream] [métrica] [--hours 24] [--points 500]
+"""
+
+import argparse
+import math
+import os
+import re
+import struct
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import numpy as np
+
+# Registro: timestamp (epoch, s) y valor, little endian
+SERIES_RECORD = struct.Struct('<dd')
+SERIES_DTYPE = np.dtype([('t', '<f8'), ('v', '<f8')])
+
+METHOD_LTTB = 'lttb'
+METHOD_MINMAX = 'minmax'
+
+
+def stream_id(manifest_url):
+    """Identificador legible y seguro para nombre de directorio (host + ruta del manifest)"""
+    parsed = urlparse(manifest_url)
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{parsed.netloc}{parsed.path}").strip('_') or 'default'
+
+
+def _safe_name(name):
+    # Sin separadores ni nombres que empiecen por '.', para no salir del directorio de series
+    return re.sub(r'^\.+', '_', re.sub(r'[^A-Za-z0-9_.-]+', '_', name)) or 'default'
+
+
+def _epoch(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def analyzer_points(topic, payload):
+    """Puntos (métrica, valor) de un resultado de analizador publicado en el bus"""
+    points = []
+    if topic == 'latency':
+        manifest = payload.get('manifest_latency') or {}
+        points.append(('manifest_latency_ms', manifest.get('latency_ms')))
+        for segment in payload.get('segment_latencies') or []:
+            points.append(('segment_latency_ms', segment.get('latency_ms')))
+    elif topic == 'adaptation':
+        analysis = payload.get('adaptation_analysis') or {}
+        delays = [seg['availability_delay_s'] for seg in analysis.get('current_segments') or []
+                  if seg.get('availability_delay_s') is not None]
+        if delays:
+            points.append(('availability_delay_s', max(delays)))
+        metrics = analysis.get('adaptation_metrics') or {}
+        for rep_id, summary in (metrics.get('measured_bitrates') or {}).items():
+            points.append((f"measured_bitrate_bps.{rep_id}", summary.get('last_measured_bitrate')))
+    elif topic == 'quality':
+        aggregate = payload.get('aggregate_metrics') or {}
+        points.append(('quality_bitrate_bps', aggregate.get('avg_bitrate')))
+        points.append(('ssim', aggregate.get('avg_ssim')))
+    return points
+
+
+def health_points(overall_metrics):
+    return [
+        ('health_score', overall_metrics.get('stream_health_score')),
+        ('quality_score', overall_metrics.get('quality_score')),
+        ('latency_score', overall_metrics.get('latency_score')),
+        ('adaptation_score', overall_metrics.get('adaptation_score')),
+    ]
+
+
+class SeriesWriter:
+    """Escritor append-only de las series de un stream (un solo escritor por stream)"""
+
+    def __init__(self, root_dir, stream):
+        self.dir = os.path.join(root_dir, _safe_name(stream))
+        os.makedirs(self.dir, exist_ok=True)
+        self.files = {}
+        self.last_timestamp = {}
+
+    def _file(self, metric):
+        f = self.files.get(metric)
+        if f is None:
+            path = os.path.join(self.dir, f"{_safe_name(metric)}.bin")
+            f = self.files[metric] = open(path, 'ab')
+            # Descartar un registro incompleto de una escritura interrumpida
+            size = f.tell()
+            if size % SERIES_RECORD.size:
+                f.truncate(size - size % SERIES_RECORD.size)
+            if f.tell():
+                with open(path, 'rb') as existing:
+                    existing.seek(-SERIES_RECORD.size, os.SEEK_END)
+                    self.last_timestamp[metric] = SERIES_RECORD.unpack(existing.read())[0]
+        return f
+
+    def append(self, metric, timestamp, value):
+        if value is None or isinstance(value, bool) or math.isnan(value):
+            return
+        f = self._file(metric)
+        # Timestamps no decrecientes: la búsqueda binaria depende del orden
+        timestamp = max(timestamp, self.last_timestamp.get(metric, timestamp))
+        self.last_timestamp[metric] = timestamp
+        f.write(SERIES_RECORD.pack(timestamp, value))
+
+    def append_result(self, topic, payload):
+        timestamp = _epoch(payload.get('timestamp'))
+        for metric, value in analyzer_points(topic, payload):
+            self.append(metric, timestamp, value)
+
+    def append_health(self, timestamp, overall_metrics):
+        timestamp = _epoch(timestamp)
+        for metric, value in health_points(overall_metrics):
+            self.append(metric, timestamp, value)
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+def series_path(root_dir, stream, metric):
+    return os.path.join(root_dir, _safe_name(stream), f"{_safe_name(metric)}.bin")
+
+
+def list_series(root_dir):
+    """{stream: [métricas]} disponibles en el directorio de series"""
+    catalog = {}
+    if not os.path.isdir(root_dir):
+        return catalog
+    for stream in sorted(os.listdir(root_dir)):
+        stream_dir = os.path.join(root_dir, stream)
+        if os.path.isdir(stream_dir):
+            catalog[stream] = sorted(name[:-len('.bin')] for name in os.listdir(stream_dir) if name.endswith('.bin'))
+    return catalog
+
+
+def read_range(path, start=None, end=None):
+    """Registros con start <= t <= end; solo se leen las páginas del rango encontrado por búsqueda binaria"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return np.empty(0, dtype=SERIES_DTYPE)
+    count = size // SERIES_RECORD.size
+    if not count:
+        return np.empty(0, dtype=SERIES_DTYPE)
+    records = np.memmap(path, dtype=SERIES_DTYPE, mode='r', shape=(count,))
+    timestamps = records['t']
+    lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+    hi = count if end is None else int(np.searchsorted(timestamps, end, side='right'))
+    result = np.array(records[lo:hi])
+    del records
+    return result
+
+
+def lttb(t, v, points):
+    """Largest-Triangle-Three-Buckets: conserva la forma visual de la serie con `points` puntos"""
+    n = len(t)
+    if points >= n or points < 3:
+        return t, v
+    out = np.empty(points, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Promedio del bucket siguiente (o el último punto)
+        if i + 2 < points - 1:
+            nlo, nhi = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+            avg_t, avg_v = t[nlo:nhi].mean(), v[nlo:nhi].mean()
+        else:
+            avg_t, avg_v = t[-1], v[-1]
+        area = np.abs((t[selected] - avg_t) * (v[lo:hi] - v[selected])
+                      - (t[selected] - t[lo:hi]) * (avg_v - v[selected]))
+        selected = lo + int(area.argmax())
+        out[i + 1] = selected
+    return t[out], v[out]
+
+
+def minmax(t, v, points):
+    """Mínimo y máximo de cada bucket en orden temporal (no pierde picos)"""
+    n = len(t)
+    buckets = max(1, points // 2)
+    if points >= n or buckets >= n:
+        return t, v
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    lo_idx = starts + np.array([v[a:b].argmin() for a, b in zip(edges[:-1], edges[1:])])
+    hi_idx = starts + np.array([v[a:b].argmax() for a, b in zip(edges[:-1], edges[1:])])
+    idx = np.unique(np.concatenate((lo_idx, hi_idx)))
+    return t[idx], v[idx]
+
+
+def query_series(root_dir, stream, metric, start=None, end=None, points=500, method=METHOD_LTTB):
+    """Serie del rango reducida a como mucho `points` puntos"""
+    records = read_range(series_path(root_dir, stream, metric), start, end)
+    t, v = records['t'], records['v']
+    if method == METHOD_MINMAX:
+        dt, dv = minmax(t, v, points)
+    else:
+        dt, dv = lttb(t, v, points)
+    return {
+        'stream': stream,
+        'metric': metric,
+        'from': start,
+        'to': end,
+        'raw_count': int(len(t)),
+        'method': method,
+        't': dt.tolist(),
+        'v': dv.tolist(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consulta las series temporales almacenadas por la suite')
+    parser.add_argument('series_dir', help='Directorio series/ de la suite')
+    parser.add_argument('stream', nargs='?', help='Stream (sin él se listan las series disponibles)')
+    parser.add_argument('metric', nargs='?', help='Métrica')
+    parser.add_argument('--hours', type=float, default=24, help='Horas hacia atrás')
+    parser.add_argument('--points', type=int, default=500, help='Puntos tras el downsampling')
+    parser.add_argument('--method', choices=[METHOD_LTTB, METHOD_MINMAX], default=METHOD_LTTB)
+    args = parser.parse_args()
+
+    if not args.stream or not args.metric:
+        for stream, metrics in list_series(args.series_dir).items():
+            print(f"{stream}: {', '.join(metrics)}")
+        return
+
+    start = time.perf_counter()
+    now = time.time()
+    series = query_series(args.series_dir, args.stream, args.metric, now - args.hours * 3600, now,
+                          args.points, args.method)
+    for t, v in zip(series['t'], series['v']):
+        print(f"{datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')}  {v:.3f}")
+    print(f"✓ {len(series['t'])} de {series['raw_count']} puntos en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
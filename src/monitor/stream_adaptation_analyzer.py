@@ -7,22 +7,45 @@ Uso: python3 stream_adaptation_analyzer.py <manifest_url> [options]
 import argparse
 import json
 import time
-import requests
 import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
-from urllib.parse import urljoin
+from datetime import datetime, timedelta, timezone
 import os
-import matplotlib.pyplot as plt
-import numpy as np
+import threading
+from collections import deque
 
 import stream_analisys_common as common
+import profiling
+from resource_governor import PRIORITY_ADAPTATION
+from event_bus import TOPIC_ADAPTATION
+from metric_history import RingHistory
+from mpd_diff import ManifestDiffer, EVENT_PUBLISH_STALLED, EVENT_UNCHANGED
+from segment_bitrate import SegmentBitrateTracker
+from chart_renderer import ChartRenderer
+from throughput_trace import TraceRecorder
+from abr_simulator import OnlineAbrSimulator, RULE_HYBRID
+from retention import RetentionStore, add_retention_arguments, policy_from_args
+from checkpoint import Checkpointer
+
+# Segmentos por representación consultados (HEAD) por ciclo como máximo al ponerse al día
+MAX_SEGMENT_HEADS = 10
+
+# Campos numéricos resumidos en los rollups de 1 min / 1 h
+RETENTION_FIELDS = [
+    'adaptation_metrics.current_bitrate',
+    'aggregate_metrics.stability_score',
+    'aggregate_metrics.switching_frequency',
+]
 
 class StreamAdaptationAnalyzer:
-    def __init__(self, manifest_url, output_dir="./adaptation_analysis", interval=10):
+    def __init__(self, manifest_url, output_dir="./adaptation_analysis", interval=10, chart_dpi=100, history_window=100, event_bus=None, retention=None,
+                 checkpoint_interval=60, max_segment_heads=MAX_SEGMENT_HEADS):
         self.manifest_url = manifest_url
         self.output_dir = output_dir
         self.interval = interval
+        self.max_segment_heads = max_segment_heads
         self.running = False
+        self.stop_event = threading.Event()  # Interrumpe la espera entre ciclos al detener
+        self.event_bus = event_bus
         
         # Crear directorio de salida
         os.makedirs(output_dir, exist_ok=True)
@@ -33,19 +56,52 @@ class StreamAdaptationAnalyzer:
         self.chart_file = os.path.join(output_dir, "bitrate_adaptation.png")
         
         # Inicializar datos
-        self.adaptation_data = []
+        # Historial crudo acotado a la ventana de retención (lo anterior queda en rollups)
+        self.retention = RetentionStore('adaptation', output_dir, RETENTION_FIELDS, retention)
+        self.adaptation_data = self.retention.records
         self.session_start = datetime.now()
         
-        # Historial de bitrates
-        self.bitrate_history = []
-        self.switching_events = []
+        # Historial compacto de bitrates y contadores de switching
+        self.bitrate_history = RingHistory(history_window)
+        self.previous_bitrates = None
+        self.switching_events = deque(maxlen=100)
+        self.switching_counts = {'upgrade': 0, 'downgrade': 0, 'mixed': 0}
+        
+        # Simulador ABR alimentado con el throughput medido en cada tick
+        self.abr_simulator = None
+        
+        # Renderizador de gráficos en proceso separado (no bloquea el análisis)
+        self.chart_renderer = ChartRenderer(self.chart_file, dpi=chart_dpi, min_interval=max(1, interval))
+        
+        # Diferenciador de manifests: evita re-extraer representaciones si solo avanzó el timeline
+        self.manifest_differ = ManifestDiffer()
+        self.manifest_info = None
+        self.manifest_events = []
+        
+        # Bitrate real por segmento (bytes / duración del timeline) frente al bandwidth declarado
+        self.segment_templates = {}
+        self.availability_start_time = None
+        self.bitrate_tracker = SegmentBitrateTracker(os.path.join(output_dir, "segment_bitrates"))
+        
+        # Checkpoint del estado móvil: al reiniciar se continúa sin releer los logs
+        self.checkpointer = Checkpointer('adaptation', os.path.join(output_dir, "adaptation_checkpoint.pkl"), checkpoint_interval)
+        self.checkpointer.restore(self)
         
     def fetch_manifest_info(self):
         """Obtiene información detallada del manifest"""
         try:
-            root, namespace = common.fetch_mpd_root(self.manifest_url)
+            change = self.manifest_differ.fetch(self.manifest_url)
+            self.manifest_events = [e for e in change.events if e['type'] != EVENT_UNCHANGED]
+            
+            # Los templates (y su timeline) solo se vuelven a indexar si el contenido cambió
+            if change.content_changed or not self.segment_templates:
+                self.index_segment_templates(change.root, change.namespace)
             
-            manifest_info = common.extract_manifest_info(root, namespace)
+            # Sin cambios estructurales: reutilizar la información ya extraída
+            if not change.structure_changed and self.manifest_info is not None:
+                return dict(self.manifest_info, publishTime=change.root.get('publishTime', ''))
+            
+            root, namespace = change.root, change.namespace
             
             # Extraer información del manifest
             manifest_info = {
@@ -84,58 +140,153 @@ class StreamAdaptationAnalyzer:
                             'segment_template': {}
                         }
                         
-                        # Información de segmentación
+                        # Información de segmentación (del Representation o heredada del AdaptationSet)
                         segment_template = rep.find('.//mpd:SegmentTemplate', namespace)
-                        if segment_template:
+                        if segment_template is None:
+                            segment_template = adaptation.find('mpd:SegmentTemplate', namespace)
+                        if segment_template is not None:
                             rep_info['segment_template'] = {
                                 'media': segment_template.get('media', ''),
                                 'duration': segment_template.get('duration', ''),
                                 'timescale': segment_template.get('timescale', ''),
-                                'startNumber': segment_template.get('startNumber', '')
+                                'startNumber': segment_template.get('startNumber', ''),
+                                'segment_duration': self.get_segment_duration(segment_template, namespace)
                             }
                         
                         adaptation_info['representations'].append(rep_info)
                     
                     manifest_info['adaptation_sets'].append(adaptation_info)
             
+            self.manifest_info = manifest_info
             return manifest_info
             
         except Exception as e:
             print(f"Error obteniendo manifest: {e}")
             return None
     
+    def index_segment_templates(self, root, namespace):
+        """Indexa el SegmentTemplate efectivo de cada representación"""
+        self.availability_start_time = common.parse_iso_datetime(root.get('availabilityStartTime'))
+        self.segment_templates = {}
+        for adaptation in root.findall('.//mpd:AdaptationSet', namespace):
+            for rep in adaptation.findall('mpd:Representation', namespace):
+                segment_template = rep.find('mpd:SegmentTemplate', namespace)
+                if segment_template is None:
+                    segment_template = adaptation.find('mpd:SegmentTemplate', namespace)
+                if segment_template is not None:
+                    self.segment_templates[rep.get('id', '')] = segment_template
+    
+    def get_segment_duration(self, segment_template, namespace):
+        """Duración nominal de segmento en segundos (atributo duration o primer S del timeline)"""
+        timescale = float(segment_template.get('timescale', '1'))
+        duration = segment_template.get('duration')
+        if not duration:
+            first = segment_template.find('.//mpd:SegmentTimeline/mpd:S', namespace)
+            duration = first.get('d') if first is not None else None
+        return float(duration) / timescale if duration else None
+    
+    def measure_throughput(self, segment_url):
+        """Descarga un segmento completo y devuelve el throughput medido en bps"""
+        try:
+            start_time = time.time()
+            response = common.http_get(segment_url, timeout=30, url_class=common.URL_CLASS_SEGMENT)
+            response.raise_for_status()
+            elapsed = time.time() - start_time
+            if elapsed > 0 and response.content:
+                return len(response.content) * 8 / elapsed
+        except Exception as e:
+            print(f"Error midiendo throughput: {e}")
+        return None
+    
+    def simulate_abr(self, representations, current_segments):
+        """Alimenta el simulador ABR online con el throughput del segmento que elegiría el cliente"""
+        segment_duration = next((rep['segment_template'].get('segment_duration') for rep in representations
+                                 if rep['segment_template'].get('segment_duration')), None)
+        if not segment_duration or not current_segments:
+            return None
+        
+        if self.abr_simulator is None or self.abr_simulator.segment_duration != segment_duration:
+            self.abr_simulator = OnlineAbrSimulator(segment_duration)
+        self.abr_simulator.update_ladder([seg['bitrate'] for seg in current_segments])
+        
+        # Descargar el segmento de la representación que elegiría el cliente híbrido
+        next_bitrate = self.abr_simulator.next_bitrate(RULE_HYBRID)
+        segment = next((seg for seg in current_segments if seg['bitrate'] == next_bitrate), current_segments[0])
+        throughput = self.measure_throughput(segment['url'])
+        if throughput is None:
+            return None
+        
+        simulation = self.abr_simulator.step(throughput)
+        simulation['measured_throughput'] = throughput
+        return simulation
+    
     def get_current_segment_info(self, representation_info):
-        """Obtiene información del segmento actual"""
+        """Mide los segmentos publicados desde el último medido y devuelve la información del más reciente"""
         try:
             segment_template = representation_info['segment_template']
             if not segment_template.get('media'):
                 return None
             
-            # Construir URL del segmento actual
-            media_template = segment_template['media']
-            # Asumimos que queremos el segmento más reciente disponible
-            segment = segment_template['startNumber']
-            segment_url = urljoin(self.manifest_url, media_template.replace('$Number$', segment))
-            
-            # Obtener información del segmento
-            response = requests.head(segment_url, timeout=10)
-            if response.status_code == 200:
-                return {
-                    'url': segment_url,
-                    'size_bytes': int(response.headers.get('content-length', 0)),
-                    'bitrate': representation_info['bandwidth'],
-                    'resolution': f"{representation_info['width']}x{representation_info['height']}",
-                    'codec': representation_info['codecs']
-                }
-            
+            # Segmentos publicados desde el último medido (timeline o reloj de disponibilidad), acotados por ciclo
+            segments = None
+            template_element = self.segment_templates.get(representation_info['id'])
+            if template_element is not None:
+                measured = self.bitrate_tracker.representations.get(representation_info['id'])
+                last_number = measured.last_number if measured else None
+                segments = common.get_published_segments(template_element, common.MPD_NAMESPACE, last_number,
+                                                         self.max_segment_heads, self.availability_start_time)
+                if not segments:
+                    # Sin segmentos nuevos (o numeración reiniciada): se vuelve a consultar el último publicado
+                    segments = common.get_published_segments(template_element, common.MPD_NAMESPACE, None, 1,
+                                                             self.availability_start_time)
+            if not segments:
+                segments = [{'number': int(segment_template.get('startNumber') or 1), 'time': None,
+                             'duration': segment_template.get('segment_duration')}]
         except Exception as e:
             print(f"Error obteniendo información de segmento: {e}")
+            return None
         
-        return None
+        segment_info = None
+        for segment in segments:
+            segment_url = common.build_segment_url(self.manifest_url, segment_template['media'], representation_info['id'],
+                                                   segment['number'], segment['time'])
+            try:
+                response = common.http_head(segment_url, timeout=10, url_class=common.URL_CLASS_SEGMENT)
+            except Exception as e:
+                print(f"Error obteniendo información de segmento: {e}")
+                break
+            if response.status_code != 200:
+                continue
+            
+            # Bitrate medido con la duración propia del segmento (d del SegmentTimeline)
+            size_bytes = int(response.headers.get('content-length', 0))
+            segment_info = {
+                'url': segment_url,
+                'representation_id': representation_info['id'],
+                'segment_number': segment['number'],
+                'segment_duration': segment['duration'],
+                'size_bytes': size_bytes,
+                'bitrate': representation_info['bandwidth'],
+                'measured_bitrate': size_bytes * 8 / segment['duration'] if segment['duration'] else None,
+                'resolution': f"{representation_info['width']}x{representation_info['height']}",
+                'codec': representation_info['codecs']
+            }
+            
+            measurement = self.bitrate_tracker.record(representation_info['id'], representation_info['bandwidth'],
+                                                      segment['number'], size_bytes, segment['duration'], time.time())
+            if measurement:
+                segment_info['exceeds_declared'] = measurement['exceeds_declared']
+            if segment.get('availability_time'):
+                # Retraso entre la hora de disponibilidad anunciada y la observación del segmento
+                delay = datetime.now(timezone.utc) - segment['availability_time']
+                segment_info['availability_delay_s'] = delay.total_seconds()
+        
+        return segment_info
     
     def analyze_adaptation_behavior(self):
         """Analiza el comportamiento de adaptación"""
-        manifest_info = self.fetch_manifest_info()
+        with profiling.span('adaptation.manifest'):
+            manifest_info = self.fetch_manifest_info()
         if not manifest_info:
             return None
         
@@ -143,7 +294,8 @@ class StreamAdaptationAnalyzer:
             'timestamp': datetime.now().isoformat(),
             'manifest_info': manifest_info,
             'current_segments': [],
-            'adaptation_metrics': {}
+            'adaptation_metrics': {},
+            'manifest_events': self.manifest_events
         }
         
         # Analizar cada adaptation set
@@ -157,7 +309,8 @@ class StreamAdaptationAnalyzer:
                 # Obtener información de segmentos actuales
                 current_segments = []
                 for rep in representations:
-                    segment_info = self.get_current_segment_info(rep)
+                    with profiling.span('adaptation.segment_head'):
+                        segment_info = self.get_current_segment_info(rep)
                     if segment_info:
                         current_segments.append(segment_info)
                 
@@ -175,30 +328,27 @@ class StreamAdaptationAnalyzer:
                         'current_bitrate': bitrates[0],  # Asumimos el más bajo como actual
                         'resolutions': list(set([seg['resolution'] for seg in current_segments]))
                     }
+                    
+                    # Bitrate real medido frente al declarado por representación
+                    adaptation_analysis['adaptation_metrics']['measured_bitrates'] = self.bitrate_tracker.summaries()
+                    
+                    # Simular qué elegiría un cliente ABR real con el throughput medido
+                    with profiling.span('adaptation.abr_simulation'):
+                        abr_simulation = self.simulate_abr(representations, current_segments)
+                    if abr_simulation:
+                        adaptation_analysis['adaptation_metrics']['abr_simulation'] = abr_simulation
         
         return adaptation_analysis
     
     def detect_switching_events(self, current_analysis):
         """Detecta eventos de cambio de bitrate"""
-        if not self.bitrate_history:
-            self.bitrate_history.append(current_analysis)
-            return []
-        
-        previous_analysis = self.bitrate_history[-1]
+        current_bitrates = {seg['bitrate'] for seg in current_analysis.get('current_segments', [])}
+        previous_bitrates = self.previous_bitrates
+        self.previous_bitrates = current_bitrates
         switching_events = []
         
-        # Comparar bitrates actuales con anteriores
-        current_bitrates = set()
-        previous_bitrates = set()
-        
-        for seg in current_analysis.get('current_segments', []):
-            current_bitrates.add(seg['bitrate'])
-        
-        for seg in previous_analysis.get('current_segments', []):
-            previous_bitrates.add(seg['bitrate'])
-        
-        # Detectar cambios
-        if current_bitrates != previous_bitrates:
+        # Detectar cambios respecto del análisis anterior
+        if previous_bitrates is not None and current_bitrates != previous_bitrates:
             event = {
                 'timestamp': current_analysis['timestamp'],
                 'previous_bitrates': list(previous_bitrates),
@@ -207,112 +357,49 @@ class StreamAdaptationAnalyzer:
             }
             
             # Determinar dirección del cambio
-            if max(current_bitrates) > max(previous_bitrates):
+            if current_bitrates and previous_bitrates and max(current_bitrates) > max(previous_bitrates):
                 event['direction'] = 'upgrade'
-            elif min(current_bitrates) < min(previous_bitrates):
+            elif current_bitrates and previous_bitrates and min(current_bitrates) < min(previous_bitrates):
                 event['direction'] = 'downgrade'
             else:
                 event['direction'] = 'mixed'
             
             switching_events.append(event)
             self.switching_events.append(event)
+            self.switching_counts[event['direction']] += 1
         
-        self.bitrate_history.append(current_analysis)
-        
-        # Mantener solo los últimos 100 análisis
-        if len(self.bitrate_history) > 100:
-            self.bitrate_history = self.bitrate_history[-100:]
+        # Guardar solo las columnas necesarias en el historial compacto
+        metrics = current_analysis.get('adaptation_metrics')
+        segments = current_analysis.get('current_segments', [])
+        self.bitrate_history.append(
+            timestamp=datetime.fromisoformat(current_analysis['timestamp']).timestamp(),
+            bitrate=metrics['current_bitrate'] if metrics else None,
+            size=segments[0]['size_bytes'] if segments else 0,
+            switch=1 if switching_events else 0
+        )
         
         return switching_events
     
     def calculate_adaptation_metrics(self):
-        """Calcula métricas agregadas de adaptación"""
-        if not self.bitrate_history:
+        """Calcula métricas agregadas de adaptación (agregados incrementales de la ventana)"""
+        if not len(self.bitrate_history) or not self.bitrate_history.valid_count('bitrate'):
             return {}
         
-        # Extraer bitrates a lo largo del tiempo
-        timestamps = []
-        bitrates = []
-        
-        for analysis in self.bitrate_history:
-            if analysis.get('adaptation_metrics'):
-                timestamps.append(analysis['timestamp'])
-                bitrates.append(analysis['adaptation_metrics']['current_bitrate'])
-        
-        if not bitrates:
-            return {}
-        
-        # Calcular métricas
-        avg_bitrate = sum(bitrates) / len(bitrates)
-        bitrate_variance = sum((x - avg_bitrate) ** 2 for x in bitrates) / len(bitrates)
-        
-        # Contar eventos de switching
-        upgrade_events = len([e for e in self.switching_events if e.get('direction') == 'upgrade'])
-        downgrade_events = len([e for e in self.switching_events if e.get('direction') == 'downgrade'])
+        avg_bitrate = self.bitrate_history.mean('bitrate')
+        bitrate_variance = self.bitrate_history.variance('bitrate')
+        window_switches = self.bitrate_history.count_of('switch', 1)
         
         return {
             'avg_bitrate': avg_bitrate,
+            'ewma_bitrate': self.bitrate_history.ewma_value('bitrate'),
             'bitrate_variance': bitrate_variance,
-            'total_switching_events': len(self.switching_events),
-            'upgrade_events': upgrade_events,
-            'downgrade_events': downgrade_events,
-            'switching_frequency': len(self.switching_events) / max(1, len(self.bitrate_history)),
+            'total_switching_events': sum(self.switching_counts.values()),
+            'upgrade_events': self.switching_counts['upgrade'],
+            'downgrade_events': self.switching_counts['downgrade'],
+            'switching_frequency': window_switches / len(self.bitrate_history),
             'stability_score': 1.0 / (1.0 + bitrate_variance / (avg_bitrate ** 2)) if avg_bitrate > 0 else 0
         }
     
-    def generate_charts(self):
-        """Genera gráficos de adaptación"""
-        if not self.bitrate_history:
-            return
-        
-        try:
-            # Preparar datos
-            timestamps = []
-            bitrates = []
-            
-            for analysis in self.bitrate_history:
-                if analysis.get('adaptation_metrics'):
-                    timestamps.append(datetime.fromisoformat(analysis['timestamp']))
-                    bitrates.append(analysis['adaptation_metrics']['current_bitrate'] / 1000)  # Convertir a kbps
-            
-            if not bitrates:
-                return
-            
-            # Crear gráfico
-            plt.figure(figsize=(12, 8))
-            
-            # Gráfico de bitrate a lo largo del tiempo
-            plt.subplot(2, 1, 1)
-            plt.plot(timestamps, bitrates, 'b-', linewidth=2, marker='o', markersize=4)
-            plt.title('Adaptación de Bitrate a lo Largo del Tiempo')
-            plt.ylabel('Bitrate (kbps)')
-            plt.grid(True, alpha=0.3)
-            
-            # Marcar eventos de switching
-            for event in self.switching_events[-10:]:  # Últimos 10 eventos
-                event_time = datetime.fromisoformat(event['timestamp'])
-                if event_time in timestamps:
-                    idx = timestamps.index(event_time)
-                    color = 'green' if event['direction'] == 'upgrade' else 'red'
-                    plt.scatter(event_time, bitrates[idx], color=color, s=100, zorder=5)
-            
-            # Gráfico de distribución de bitrates
-            plt.subplot(2, 1, 2)
-            plt.hist(bitrates, bins=20, alpha=0.7, color='skyblue', edgecolor='black')
-            plt.title('Distribución de Bitrates')
-            plt.xlabel('Bitrate (kbps)')
-            plt.ylabel('Frecuencia')
-            plt.grid(True, alpha=0.3)
-            
-            plt.tight_layout()
-            plt.savefig(self.chart_file, dpi=300, bbox_inches='tight')
-            plt.close()
-            
-            print(f"✓ Gráfico guardado en {self.chart_file}")
-            
-        except Exception as e:
-            print(f"Error generando gráfico: {e}")
-    
     def run_analysis(self):
         """Ejecuta el análisis de adaptación"""
         print(f"=== Análisis de Adaptación de Stream ===")
@@ -321,8 +408,14 @@ class StreamAdaptationAnalyzer:
         print(f"Directorio de salida: {self.output_dir}")
         print()
         
+        # Prioridad de este analizador en el presupuesto compartido de peticiones
+        common.set_thread_priority(PRIORITY_ADAPTATION)
+        
         while self.running:
             try:
+                # Presupuesto de tiempo del ciclo: ninguna petición se extiende más allá del intervalo
+                common.start_tick(self.interval)
+                profiling.begin_tick('adaptation')
                 timestamp = datetime.now().isoformat()
                 print(f"[{timestamp}] Analizando adaptación...")
                 
@@ -330,16 +423,29 @@ class StreamAdaptationAnalyzer:
                 adaptation_analysis = self.analyze_adaptation_behavior()
                 if not adaptation_analysis:
                     print("Error: No se pudo analizar la adaptación")
-                    time.sleep(self.interval)
+                    self.wait_next_tick()
                     continue
                 
+                for event in adaptation_analysis['manifest_events']:
+                    if event['type'] == EVENT_PUBLISH_STALLED:
+                        print(f"  ⚠️  Manifest atascado: publishTime y timeline sin cambios hace {event['stalled_seconds']:.1f}s")
+                
                 # 2. Detectar eventos de switching
-                switching_events = self.detect_switching_events(adaptation_analysis)
+                with profiling.span('adaptation.switching'):
+                    switching_events = self.detect_switching_events(adaptation_analysis)
                 
-                # 3. Calcular métricas agregadas
-                aggregate_metrics = self.calculate_adaptation_metrics()
+                # 3. Enviar el punto al renderizador de gráficos
+                if adaptation_analysis.get('adaptation_metrics'):
+                    current_bitrate = adaptation_analysis['adaptation_metrics']['current_bitrate']
+                    self.chart_renderer.add_point(adaptation_analysis['timestamp'], current_bitrate)
+                    for event in switching_events:
+                        self.chart_renderer.add_event(event['timestamp'], current_bitrate, event['direction'])
+                
+                # 4. Calcular métricas agregadas
+                with profiling.span('adaptation.metrics'):
+                    aggregate_metrics = self.calculate_adaptation_metrics()
                 
-                # 4. Crear resultado completo
+                # 5. Crear resultado completo
                 analysis_result = {
                     'timestamp': timestamp,
                     'adaptation_analysis': adaptation_analysis,
@@ -349,8 +455,12 @@ class StreamAdaptationAnalyzer:
                 }
                 
                 # Guardar resultado
-                self.adaptation_data.append(analysis_result)
-                self.save_results()
+                self.retention.append(analysis_result)
+                if self.event_bus:
+                    self.event_bus.publish(TOPIC_ADAPTATION, analysis_result)
+                with profiling.span('adaptation.save_results'):
+                    self.save_results()
+                self.checkpointer.maybe_save(self)
                 
                 # Mostrar resumen
                 if adaptation_analysis.get('adaptation_metrics'):
@@ -358,6 +468,14 @@ class StreamAdaptationAnalyzer:
                     print(f"  ✓ Bitrate actual: {metrics['current_bitrate']/1000:.1f} kbps")
                     print(f"  ✓ Rango de bitrates: {metrics['min_bitrate']/1000:.1f} - {metrics['max_bitrate']/1000:.1f} kbps")
                     print(f"  ✓ Niveles disponibles: {metrics['bitrate_levels']}")
+                    over_declared = [seg for seg in adaptation_analysis['current_segments'] if seg.get('exceeds_declared')]
+                    for seg in over_declared:
+                        print(f"  ⚠️  Segmento {seg['segment_number']} a {seg['measured_bitrate']/1000:.1f} kbps supera lo declarado ({seg['bitrate']/1000:.1f} kbps)")
+                    if metrics.get('abr_simulation'):
+                        simulation = metrics['abr_simulation']
+                        print(f"  ✓ Throughput medido: {simulation['measured_throughput']/1000:.1f} kbps")
+                        print(f"  ✓ Bitrate ABR simulado (híbrido): {simulation[RULE_HYBRID]['selected_bitrate']/1000:.1f} kbps, "
+                              f"stalls: {simulation[RULE_HYBRID]['stall_time']:.1f}s")
                 
                 if switching_events:
                     print(f"  🔄 Eventos de switching detectados: {len(switching_events)}")
@@ -367,25 +485,26 @@ class StreamAdaptationAnalyzer:
                     print(f"  📊 Frecuencia de switching: {aggregate_metrics['switching_frequency']:.3f} eventos/intervalo")
                 
                 print(f"  Esperando {self.interval} segundos...")
-                time.sleep(self.interval)
+                self.wait_next_tick()
                 
             except KeyboardInterrupt:
                 print("\nDetención solicitada por el usuario")
                 break
             except Exception as e:
                 print(f"Error en análisis: {e}")
-                time.sleep(self.interval)
+                self.wait_next_tick()
+        
+        # Persistir los buckets de rollup abiertos y el estado final
+        self.retention.close()
+        self.checkpointer.save(self)
     
     def save_results(self):
         """Guarda los resultados en archivos"""
         common.save_results(self.adaptation_data, self.adaptation_log)
 
         # Generar reporte de texto
-        self.generate_report()
-        
-        # Generar gráficos cada 10 análisis
-        if len(self.adaptation_data) % 10 == 0:
-            self.generate_charts()
+        with profiling.span('adaptation.report'):
+            self.generate_report()
     
     def generate_report(self):
         """Genera reporte de texto"""
@@ -394,7 +513,7 @@ class StreamAdaptationAnalyzer:
             f.write(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Manifest: {self.manifest_url}\n")
             f.write(f"Duración de sesión: {self.session_duration:.1f} segundos\n")
-            f.write(f"Total de análisis: {len(self.adaptation_data)}\n\n")
+            f.write(f"Total de análisis: {self.retention.total_added}\n\n")
             
             if self.adaptation_data:
                 latest = self.adaptation_data[-1]
@@ -408,6 +527,26 @@ class StreamAdaptationAnalyzer:
                 f.write(f"Niveles de bitrate: {adaptation_metrics.get('bitrate_levels', 0)}\n")
                 f.write(f"Resoluciones: {', '.join(adaptation_metrics.get('resolutions', []))}\n\n")
                 
+                if adaptation_metrics.get('measured_bitrates'):
+                    f.write("--- BITRATE MEDIDO VS DECLARADO ---\n")
+                    for rep_id, summary in adaptation_metrics['measured_bitrates'].items():
+                        if summary['mean_bitrate'] is None:
+                            continue
+                        f.write(f"{rep_id}: declarado {summary['declared_bandwidth']/1000:.1f} kbps, "
+                                f"medio {summary['mean_bitrate']/1000:.1f} kbps, pico {summary['peak_bitrate']/1000:.1f} kbps, "
+                                f"segmentos sobre lo declarado {summary['segments_over_declared']}/{summary['segments_measured']}\n")
+                    f.write("\n")
+                
+                if adaptation_metrics.get('abr_simulation'):
+                    simulation = adaptation_metrics['abr_simulation']
+                    f.write("--- SIMULACIÓN ABR ---\n")
+                    f.write(f"Throughput medido: {simulation['measured_throughput']/1000:.1f} kbps\n")
+                    for rule, result in simulation.items():
+                        if isinstance(result, dict):
+                            f.write(f"{rule}: {result['selected_bitrate']/1000:.1f} kbps, buffer {result['buffer_level']:.1f}s, "
+                                    f"switches {result['switch_count']}, stalls {result['stall_time']:.1f}s\n")
+                    f.write("\n")
+                
                 f.write("--- MÉTRICAS AGREGADAS ---\n")
                 f.write(f"Bitrate promedio: {aggregate_metrics.get('avg_bitrate', 0)/1000:.1f} kbps\n")
                 f.write(f"Varianza de bitrate: {aggregate_metrics.get('bitrate_variance', 0):.2f}\n")
@@ -427,17 +566,52 @@ class StreamAdaptationAnalyzer:
                     f.write("⚠️  Más downgrades que upgrades\n")
                 
                 f.write("\n--- HISTORIAL DE SWITCHING ---\n")
-                for i, event in enumerate(self.switching_events[-10:], 1):  # Últimos 10
+                for i, event in enumerate(list(self.switching_events)[-10:], 1):  # Últimos 10
                     f.write(f"{i}. {event['timestamp']} - {event['direction']} - {event['previous_bitrates']} → {event['current_bitrates']}\n")
     
+    def get_state(self):
+        """Estado móvil para el checkpoint (bitrates, switching, simulador ABR y último segmento medido)"""
+        return {
+            'session_start': self.session_start,
+            'bitrate_history': self.bitrate_history,
+            'previous_bitrates': self.previous_bitrates,
+            'switching_events': self.switching_events,
+            'switching_counts': self.switching_counts,
+            'abr_simulator': self.abr_simulator,
+            'representations': self.bitrate_tracker.representations,
+            'retention': self.retention.get_state(),
+        }
+    
+    def restore_state(self, state):
+        self.session_start = state['session_start']
+        self.bitrate_history = state['bitrate_history']
+        self.previous_bitrates = state['previous_bitrates']
+        self.switching_events = state['switching_events']
+        self.switching_counts = state['switching_counts']
+        self.abr_simulator = state['abr_simulator']
+        self.bitrate_tracker.representations = state['representations']
+        self.retention.restore_state(state['retention'])
+    
     def start(self):
         """Inicia el análisis"""
         self.running = True
-        self.run_analysis()
+        self.stop_event.clear()
+        self.chart_renderer.start()
+        try:
+            self.run_analysis()
+        finally:
+            self.chart_renderer.stop()
+    
+    def wait_next_tick(self):
+        """Cierra el span del ciclo y espera al siguiente (interrumpible por stop)"""
+        profiling.end_tick()
+        self.stop_event.wait(self.interval)
     
     def stop(self):
         """Detiene el análisis"""
         self.running = False
+        self.stop_event.set()
+        self.chart_renderer.stop()
     
     @property
     def session_duration(self):
@@ -448,10 +622,21 @@ def main():
     parser.add_argument('manifest_url', help='URL del manifest DASH')
     parser.add_argument('-o', '--output', default='./adaptation_analysis', help='Directorio de salida')
     parser.add_argument('-i', '--interval', type=int, default=10, help='Intervalo de análisis en segundos')
+    parser.add_argument('--chart-dpi', type=int, default=100, help='Resolución del gráfico de adaptación (dpi)')
+    parser.add_argument('--max-segment-heads', type=int, default=MAX_SEGMENT_HEADS,
+                        help='Segmentos por representación medidos por ciclo como máximo al ponerse al día')
+    parser.add_argument('--record-trace', help='Registra una traza binaria de todas las peticiones HTTP en este archivo')
+    add_retention_arguments(parser)
+    parser.add_argument('--checkpoint-interval', type=float, default=60,
+                        help='Segundos entre checkpoints del estado del analizador (0 = desactivado)')
     
     args = parser.parse_args()
     
-    analyzer = StreamAdaptationAnalyzer(args.manifest_url, args.output, args.interval)
+    if args.record_trace:
+        common.set_trace_recorder(TraceRecorder(args.record_trace))
+    
+    analyzer = StreamAdaptationAnalyzer(args.manifest_url, args.output, args.interval, args.chart_dpi, retention=policy_from_args(args),
+                                        checkpoint_interval=args.checkpoint_interval, max_segment_heads=args.max_segment_heads)
     
     try:
         analyzer.start()
@@ -1,15 +1,269 @@
+import re
 import requests
+import subprocess
+import time
 import xml.etree.ElementTree as ET
 import csv
+from collections import deque
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urljoin
 
+from resource_governor import GovernorTimeout
+from circuit_breaker import TickDeadline
+
+# Clases de URL registradas en las trazas de red
+URL_CLASS_MANIFEST = 0
+URL_CLASS_INIT = 1
+URL_CLASS_SEGMENT = 2
+URL_CLASS_OTHER = 3
+
+# Estados no HTTP registrados en las trazas de red
+TRACE_STATUS_ERROR = 0
+TRACE_STATUS_TIMEOUT = 1
+
+_trace_recorder = None
+_resource_governor = None
+_circuit_breakers = None
+_tick_deadline = TickDeadline()
+
+def set_trace_recorder(recorder):
+    """Activa (o desactiva con None) el registro de trazas para todas las peticiones HTTP."""
+    global _trace_recorder
+    _trace_recorder = recorder
+
+def set_resource_governor(governor):
+    """Activa (o desactiva con None) el presupuesto compartido de peticiones y procesos ffmpeg."""
+    global _resource_governor
+    _resource_governor = governor
+
+def get_resource_governor():
+    return _resource_governor
+
+def set_thread_priority(priority):
+    """Prioridad de las peticiones y procesos lanzados desde el hilo actual."""
+    if _resource_governor:
+        _resource_governor.set_thread_priority(priority)
+
+def set_circuit_breakers(registry):
+    """Activa (o desactiva con None) los circuit breakers por origen."""
+    global _circuit_breakers
+    _circuit_breakers = registry
+
+def get_circuit_breakers():
+    return _circuit_breakers
+
+def start_tick(seconds):
+    """Inicia el presupuesto de tiempo del ciclo del hilo actual (None lo desactiva)."""
+    _tick_deadline.start(seconds)
+
+def end_tick():
+    _tick_deadline.clear()
+
+def run_tool(cmd, priority=None, **kwargs):
+    """Ejecuta ffmpeg/ffprobe respetando el límite de trabajos concurrentes si hay governor activo."""
+    if 'timeout' in kwargs:
+        kwargs['timeout'], _ = _tick_deadline.clamp(kwargs['timeout'])
+    if _resource_governor:
+        return _resource_governor.run(cmd, priority=priority, **kwargs)
+    return subprocess.run(cmd, **kwargs)
+
+def http_request(method, url, timeout=10, url_class=URL_CLASS_OTHER, session=None, priority=None, **kwargs):
+    """Ejecuta una petición HTTP registrando su traza (bytes, tiempos por fase y estado) si hay recorder activo."""
+    timeout, clamped = _tick_deadline.clamp(timeout)
+    breaker = _circuit_breakers.get(url) if _circuit_breakers else None
+    if breaker:
+        breaker.before_request()
+    try:
+        if _resource_governor:
+            with _resource_governor.request(url, priority):
+                response = _http_request(method, url, timeout, url_class, session, **kwargs)
+        else:
+            response = _http_request(method, url, timeout, url_class, session, **kwargs)
+    except GovernorTimeout as e:
+        if breaker:
+            breaker.release_probe()
+        raise requests.exceptions.Timeout(f"Presupuesto de peticiones agotado: {e}")
+    except requests.exceptions.Timeout:
+        if breaker:
+            # Un timeout recortado por el presupuesto del ciclo no dice nada del origen
+            if clamped:
+                breaker.release_probe()
+            else:
+                breaker.record_failure()
+        raise
+    except requests.exceptions.ConnectionError:
+        if breaker:
+            breaker.record_failure()
+        raise
+    except requests.RequestException:
+        if breaker:
+            breaker.release_probe()
+        raise
+    if breaker:
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    return response
+
+def _http_request(method, url, timeout, url_class, session, **kwargs):
+    start_time = time.time()
+    try:
+        response = (session or requests).request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.Timeout:
+        if _trace_recorder:
+            _trace_recorder.record(start_time, url_class, TRACE_STATUS_TIMEOUT, 0, None, (time.time() - start_time) * 1000)
+        raise
+    except requests.RequestException:
+        if _trace_recorder:
+            _trace_recorder.record(start_time, url_class, TRACE_STATUS_ERROR, 0, None, (time.time() - start_time) * 1000)
+        raise
+    if _trace_recorder:
+        if method == 'HEAD' or kwargs.get('stream'):
+            size = int(response.headers.get('content-length', 0) or 0)
+        else:
+            size = len(response.content)
+        _trace_recorder.record(start_time, url_class, response.status_code, size,
+                               response.elapsed.total_seconds() * 1000, (time.time() - start_time) * 1000)
+    return response
+
+def http_get(url, timeout=10, url_class=URL_CLASS_OTHER, **kwargs):
+    """GET con registro de traza."""
+    return http_request('GET', url, timeout=timeout, url_class=url_class, **kwargs)
+
+def http_head(url, timeout=10, url_class=URL_CLASS_OTHER, **kwargs):
+    """HEAD con registro de traza."""
+    return http_request('HEAD', url, timeout=timeout, url_class=url_class, **kwargs)
+
+MPD_NAMESPACE = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
+
+_ISO_DURATION = re.compile(
+    r'^P(?:(?P<days>[\d.]+)D)?(?:T(?:(?P<hours>[\d.]+)H)?(?:(?P<minutes>[\d.]+)M)?(?:(?P<seconds>[\d.]+)S)?)?$'
+)
+
+def parse_iso_duration(value):
+    """Convierte una duración ISO 8601 (p.ej. PT2.000S) a segundos; None si no es válida."""
+    match = _ISO_DURATION.match(value or '')
+    if not match:
+        return None
+    parts = {k: float(v) for k, v in match.groupdict().items() if v}
+    return parts.get('days', 0) * 86400 + parts.get('hours', 0) * 3600 + parts.get('minutes', 0) * 60 + parts.get('seconds', 0)
+
+def fetch_mpd_content(manifest_url, timeout=10):
+    """Descarga el manifest MPD y devuelve los bytes sin parsear."""
+    response = http_get(manifest_url, timeout=timeout, url_class=URL_CLASS_MANIFEST)
+    response.raise_for_status()
+    return response.content
+
 def fetch_mpd_root(manifest_url, timeout=10):
     """Descarga y parsea el manifest MPD, devolviendo el root y el namespace."""
-    response = requests.get(manifest_url, timeout=timeout)
-    response.raise_for_status()
-    root = ET.fromstring(response.content)
-    namespace = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
-    return root, namespace
+    root = ET.fromstring(fetch_mpd_content(manifest_url, timeout))
+    return root, MPD_NAMESPACE
+
+def parse_iso_datetime(value):
+    """Convierte una fecha ISO 8601 del MPD (con 'Z') a datetime con zona horaria; None si no es válida."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def get_live_edge_segment(segment_template, namespace, availability_start_time=None, now=None):
+    """Número, tiempo, duración (s) y hora de disponibilidad (si hay availabilityStartTime) del último segmento publicado."""
+    timescale = float(segment_template.get('timescale', '1'))
+    start_number = int(segment_template.get('startNumber', '1'))
+    presentation_offset = int(segment_template.get('presentationTimeOffset', '0'))
+    timeline = segment_template.find('mpd:SegmentTimeline', namespace)
+    
+    if timeline is not None:
+        number = start_number - 1
+        current_time = 0
+        last = None
+        for s in timeline.findall('mpd:S', namespace):
+            if s.get('t') is not None:
+                current_time = int(s.get('t'))
+            duration = int(s.get('d'))
+            repeat = max(0, int(s.get('r', '0')))
+            number += repeat + 1
+            last = (current_time + repeat * duration, duration)
+            current_time += (repeat + 1) * duration
+        if last is None:
+            return None
+        edge = {'number': number, 'time': last[0], 'duration': last[1] / timescale}
+        if availability_start_time is not None:
+            # Un segmento está disponible cuando termina (se asume Period@start = 0)
+            edge['availability_time'] = availability_start_time + timedelta(
+                seconds=(last[0] + last[1] - presentation_offset) / timescale)
+        return edge
+    
+    duration = segment_template.get('duration')
+    if not duration:
+        return None
+    duration = float(duration)
+    number = start_number
+    if availability_start_time is not None:
+        now = now or datetime.now(timezone.utc)
+        elapsed = (now - availability_start_time).total_seconds()
+        # Último segmento completo disponible
+        number = start_number + max(0, int(elapsed // (duration / timescale)) - 1)
+    edge = {'number': number, 'time': int((number - start_number) * duration), 'duration': duration / timescale}
+    if availability_start_time is not None:
+        edge['availability_time'] = availability_start_time + timedelta(
+            seconds=(number - start_number + 1) * duration / timescale)
+    return edge
+
+def get_published_segments(segment_template, namespace, after_number=None, limit=1, availability_start_time=None, now=None):
+    """Segmentos publicados posteriores a after_number, hasta el último: los `limit` más recientes, en orden.
+    Cada uno con número, tiempo, su propia duración (s) y hora de disponibilidad, como get_live_edge_segment."""
+    timescale = float(segment_template.get('timescale', '1'))
+    start_number = int(segment_template.get('startNumber', '1'))
+    presentation_offset = int(segment_template.get('presentationTimeOffset', '0'))
+    first = start_number if after_number is None else after_number + 1
+    segments = deque(maxlen=max(1, limit))
+    timeline = segment_template.find('mpd:SegmentTimeline', namespace)
+    
+    if timeline is not None:
+        number = start_number
+        current_time = 0
+        for s in timeline.findall('mpd:S', namespace):
+            if s.get('t') is not None:
+                current_time = int(s.get('t'))
+            duration = int(s.get('d'))
+            repeat = max(0, int(s.get('r', '0')))
+            # Entradas S completas anteriores a first: se saltan sin expandir las repeticiones
+            skip = min(repeat + 1, max(0, first - number))
+            number += skip
+            current_time += skip * duration
+            for _ in range(repeat + 1 - skip):
+                segment = {'number': number, 'time': current_time, 'duration': duration / timescale}
+                if availability_start_time is not None:
+                    segment['availability_time'] = availability_start_time + timedelta(
+                        seconds=(current_time + duration - presentation_offset) / timescale)
+                segments.append(segment)
+                number += 1
+                current_time += duration
+        return list(segments)
+    
+    edge = get_live_edge_segment(segment_template, namespace, availability_start_time, now)
+    if edge is None:
+        return []
+    duration = float(segment_template.get('duration'))
+    for number in range(max(first, edge['number'] - segments.maxlen + 1), edge['number'] + 1):
+        segment = {'number': number, 'time': int((number - start_number) * duration), 'duration': duration / timescale}
+        if availability_start_time is not None:
+            segment['availability_time'] = availability_start_time + timedelta(
+                seconds=(number - start_number + 1) * duration / timescale)
+        segments.append(segment)
+    return list(segments)
+
+def build_segment_url(manifest_url, media_template, representation_id, number, segment_time=None):
+    """Resuelve la URL de un segmento a partir del template media."""
+    media = media_template.replace('$RepresentationID$', representation_id).replace('$Number$', str(number))
+    if segment_time is not None:
+        media = media.replace('$Time$', str(segment_time))
+    return urljoin(manifest_url, media)
 
 def get_adaptation_sets(root, namespace):
     """Devuelve todos los AdaptationSet del MPD."""
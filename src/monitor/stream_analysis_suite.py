@@ -14,17 +14,49 @@ import sys
 from datetime import datetime
 import subprocess
 
+import stream_analisys_common as common
+import profiling
+from throughput_trace import TraceRecorder
+
+from event_bus import EventBus, ANALYZER_TOPICS, TOPIC_QUALITY, TOPIC_LATENCY, TOPIC_ADAPTATION, TOPIC_RESOURCES
+from resource_governor import ResourceGovernor
+from circuit_breaker import CircuitBreakerRegistry
+from metrics_exporter import MetricsRegistry, MetricsServer, StreamMetricsFeeder
+from process_runner import AnalyzerSupervisor
+from health_scoring import HealthScorer
+from series_store import SeriesWriter, stream_id
+from stream_summary import StreamSummaryStore, SUMMARY_DB_NAME, summary_from_result
+from retention import RetentionStore, add_retention_arguments, policy_from_args
+
 # Importar los analizadores
 from stream_quality_analyzer import StreamQualityAnalyzer
 from stream_latency_analyzer import StreamLatencyAnalyzer
 from stream_adaptation_analyzer import StreamAdaptationAnalyzer
 
+# Puntuaciones resumidas en los rollups de 1 min / 1 h
+SUITE_RETENTION_FIELDS = [
+    'overall_metrics.stream_health_score',
+    'overall_metrics.quality_score',
+    'overall_metrics.latency_score',
+    'overall_metrics.adaptation_score',
+]
+
+def format_score(score):
+    return 'N/A' if score is None else f"{score:.3f}"
+
 class StreamAnalysisSuite:
-    def __init__(self, manifest_url, output_dir="./stream_analysis", interval=30):
+    def __init__(self, manifest_url, output_dir="./stream_analysis", interval=30, process_mode=False, trace_path=None,
+                 governor=None, circuit_breakers=None, metrics_port=None, retention=None,
+                 checkpoint_interval=60, summary_db=None):
         self.manifest_url = manifest_url
         self.output_dir = output_dir
         self.interval = interval
+        self.process_mode = process_mode
+        self.trace_path = trace_path
+        self.governor = governor
+        self.circuit_breakers = circuit_breakers
         self.running = False
+        self.analyzers_started = False
         
         # Crear directorio principal
         os.makedirs(output_dir, exist_ok=True)
@@ -43,20 +75,81 @@ class StreamAnalysisSuite:
         self.suite_log = os.path.join(output_dir, "analysis_suite.json")
         self.suite_report = os.path.join(output_dir, "comprehensive_report.txt")
         self.dashboard_data = os.path.join(output_dir, "dashboard_data.json")
+        self.profile_stats = os.path.join(output_dir, "profile_stats.json")
+        
+        # Bus de resultados: los analizadores publican, la suite se suscribe (sin releer archivos)
+        self.event_bus = EventBus()
+        self.results_subscription = self.event_bus.subscribe(*ANALYZER_TOPICS, TOPIC_RESOURCES, maxsize=100)
+        self.latest_results = {topic: None for topic in ANALYZER_TOPICS}
+        self.result_counts = {topic: 0 for topic in ANALYZER_TOPICS}
+        self.resource_metrics = {}
+        self.circuit_summaries = {}
+        
+        # Scores de salud actualizados en O(1) con cada resultado del bus
+        self.health = HealthScorer(interval, interval//6, interval//3)
+        
+        # Series temporales indexadas para /api/series del dashboard
+        self.series = SeriesWriter(os.path.join(output_dir, "series"), stream_id(manifest_url))
+        
+        # Fila de este stream en la tabla resumen compartida (vista general multicanal)
+        self.summary = StreamSummaryStore(summary_db or os.path.join(output_dir, SUMMARY_DB_NAME),
+                                          stream_id(manifest_url), manifest_url)
+        
+        # Exportador OpenMetrics alimentado desde el bus (sin leer archivos en cada scrape)
+        self.metrics_server = None
+        self.metrics_feeder = None
+        if metrics_port:
+            registry = MetricsRegistry()
+            self.metrics_feeder = StreamMetricsFeeder(registry, manifest_url, self.event_bus)
+            collectors = [] if process_mode else [self.collect_profile_metrics]
+            self.metrics_server = MetricsServer(registry, metrics_port, collectors=collectors)
         
         # Inicializar analizadores
-        self.quality_analyzer = StreamQualityAnalyzer(manifest_url, self.quality_dir, interval)
-        self.latency_analyzer = StreamLatencyAnalyzer(manifest_url, self.latency_dir, interval//6)  # Más frecuente
-        self.adaptation_analyzer = StreamAdaptationAnalyzer(manifest_url, self.adaptation_dir, interval//3)
+        self.supervisor = None
+        if process_mode:
+            # Cada analizador en su proceso: las mediciones de latencia no compiten por el GIL
+            self.supervisor = AnalyzerSupervisor(self.event_bus)
+            self.supervisor.add('quality', 'stream_quality_analyzer', 'StreamQualityAnalyzer',
+                                manifest_url, self.quality_dir, interval, runtime=self.analyzer_runtime('quality'),
+                                retention=retention, checkpoint_interval=checkpoint_interval)
+            self.supervisor.add('latency', 'stream_latency_analyzer', 'StreamLatencyAnalyzer',
+                                manifest_url, self.latency_dir, interval//6, runtime=self.analyzer_runtime('latency'),
+                                retention=retention, checkpoint_interval=checkpoint_interval)
+            self.supervisor.add('adaptation', 'stream_adaptation_analyzer', 'StreamAdaptationAnalyzer',
+                                manifest_url, self.adaptation_dir, interval//3, runtime=self.analyzer_runtime('adaptation'),
+                                retention=retention, checkpoint_interval=checkpoint_interval)
+        else:
+            self.quality_analyzer = StreamQualityAnalyzer(manifest_url, self.quality_dir, interval, event_bus=self.event_bus, retention=retention,
+                                                          checkpoint_interval=checkpoint_interval)
+            self.latency_analyzer = StreamLatencyAnalyzer(manifest_url, self.latency_dir, interval//6, event_bus=self.event_bus, retention=retention,
+                                                          checkpoint_interval=checkpoint_interval)  # Más frecuente
+            self.adaptation_analyzer = StreamAdaptationAnalyzer(manifest_url, self.adaptation_dir, interval//3, event_bus=self.event_bus, retention=retention,
+                                                                checkpoint_interval=checkpoint_interval)
         
-        # Datos agregados
-        self.suite_data = []
+        # Datos agregados: ventana cruda acotada + rollups de las puntuaciones
+        self.retention = RetentionStore('suite', output_dir, SUITE_RETENTION_FIELDS, retention)
+        self.suite_data = self.retention.records
         self.session_start = datetime.now()
         
+    def analyzer_runtime(self, name):
+        """Configuración a instalar en el proceso de un analizador; cada uno escribe su propia traza (<trace>.<analizador>)"""
+        return {
+            'trace_path': f"{self.trace_path}.{name}" if self.trace_path else None,
+            'governor': self.governor.config() if self.governor else None,
+            'circuit_breakers': self.circuit_breakers.config() if self.circuit_breakers else None,
+            'profile_path': os.path.join(self.output_dir, f"profile_stats.{name}.json"),
+        }
+    
     def start_analyzers(self):
-        """Inicia todos los analizadores en hilos separados"""
+        """Inicia todos los analizadores en hilos o procesos separados"""
         print("Iniciando analizadores...")
         
+        self.analyzers_started = True
+        if self.supervisor:
+            self.supervisor.start()
+            print("✓ Procesos de análisis lanzados")
+            return
+        
         # Hilo para análisis de calidad
         self.quality_thread = threading.Thread(target=self.quality_analyzer.start)
         self.quality_thread.daemon = True
@@ -76,8 +169,16 @@ class StreamAnalysisSuite:
     
     def stop_analyzers(self):
         """Detiene todos los analizadores"""
+        if not self.analyzers_started:
+            return
+        self.analyzers_started = False
         print("Deteniendo analizadores...")
         
+        if self.supervisor:
+            self.supervisor.stop()
+            print("✓ Todos los analizadores detenidos")
+            return
+        
         self.quality_analyzer.stop()
         self.latency_analyzer.stop()
         self.adaptation_analyzer.stop()
@@ -93,53 +194,52 @@ class StreamAnalysisSuite:
         print("✓ Todos los analizadores detenidos")
     
     def aggregate_results(self):
-        """Agrega resultados de todos los analizadores"""
+        """Agrega resultados de todos los analizadores a partir de los eventos del bus"""
         try:
-            # Leer datos de cada analizador
-            quality_data = []
-            latency_data = []
-            adaptation_data = []
-            
-            # Calidad
-            quality_file = os.path.join(self.quality_dir, "stream_quality_analysis.json")
-            if os.path.exists(quality_file):
-                with open(quality_file, 'r') as f:
-                    quality_data = json.load(f)
-            
-            # Latencia
-            latency_file = os.path.join(self.latency_dir, "latency_analysis.json")
-            if os.path.exists(latency_file):
-                with open(latency_file, 'r') as f:
-                    latency_data = json.load(f)
-            
-            # Adaptación
-            adaptation_file = os.path.join(self.adaptation_dir, "adaptation_analysis.json")
-            if os.path.exists(adaptation_file):
-                with open(adaptation_file, 'r') as f:
-                    adaptation_data = json.load(f)
+            # Consumir solo los eventos nuevos: el costo no depende de la duración de la sesión
+            for topic, payload in self.results_subscription.drain():
+                if topic == TOPIC_RESOURCES:
+                    if payload['metrics']:
+                        self.resource_metrics[payload['source']] = payload['metrics']
+                    if payload['circuits']:
+                        self.circuit_summaries[payload['source']] = payload['circuits']
+                    continue
+                self.latest_results[topic] = payload
+                self.result_counts[topic] += 1
+                self.health.update(topic, payload)
+                self.series.append_result(topic, payload)
+            if self.governor and not self.supervisor:
+                # En modo hilos los analizadores comparten el governor de este proceso
+                self.resource_metrics['suite'] = self.governor.metrics()
+            if self.circuit_breakers and not self.supervisor:
+                self.circuit_summaries['suite'] = self.circuit_breakers.summary()
             
             # Crear resumen agregado
             aggregated_result = {
                 'timestamp': datetime.now().isoformat(),
                 'session_duration': (datetime.now() - self.session_start).total_seconds(),
                 'quality_analysis': {
-                    'total_analyses': len(quality_data),
-                    'latest_analysis': quality_data[-1] if quality_data else None
+                    'total_analyses': self.result_counts[TOPIC_QUALITY],
+                    'latest_analysis': self.latest_results[TOPIC_QUALITY]
                 },
                 'latency_analysis': {
-                    'total_analyses': len(latency_data),
-                    'latest_analysis': latency_data[-1] if latency_data else None
+                    'total_analyses': self.result_counts[TOPIC_LATENCY],
+                    'latest_analysis': self.latest_results[TOPIC_LATENCY]
                 },
                 'adaptation_analysis': {
-                    'total_analyses': len(adaptation_data),
-                    'latest_analysis': adaptation_data[-1] if adaptation_data else None
-                }
+                    'total_analyses': self.result_counts[TOPIC_ADAPTATION],
+                    'latest_analysis': self.latest_results[TOPIC_ADAPTATION]
+                },
+                'resource_governor': dict(self.resource_metrics),
+                'circuit_breakers': dict(self.circuit_summaries)
             }
             
             # Calcular métricas agregadas
-            aggregated_result['overall_metrics'] = self.calculate_overall_metrics(
-                quality_data, latency_data, adaptation_data
-            )
+            aggregated_result['overall_metrics'] = self.calculate_overall_metrics()
+            if self.metrics_feeder:
+                self.metrics_feeder.update_health(aggregated_result['overall_metrics'])
+            self.series.append_health(aggregated_result['timestamp'], aggregated_result['overall_metrics'])
+            self.series.flush()
             
             return aggregated_result
             
@@ -149,66 +249,12 @@ class StreamAnalysisSuite:
             traceback.print_exc()
             return None
     
-    def calculate_overall_metrics(self, quality_data, latency_data, adaptation_data):
-        """Calcula métricas generales del sistema"""
-        overall_metrics = {
-            'stream_health_score': 0.0,
-            'quality_score': 0.0,
-            'latency_score': 0.0,
-            'adaptation_score': 0.0,
-            'recommendations': []
-        }
-        
-        # Calcular score de calidad
-        if quality_data:
-            latest_quality = quality_data[-1]
-            if latest_quality.get('aggregate_metrics'):
-                avg_ssim = latest_quality['aggregate_metrics'].get('avg_ssim', 0)
-                if avg_ssim:
-                    val = avg_ssim
-                else:
-                    val = 0.0
-                overall_metrics['quality_score'] = min(1.0, avg_ssim)
-        
-        # Calcular score de latencia
-        if latency_data:
-            latest_latency = latency_data[-1]
-            if latest_latency.get('manifest_metrics'):
-                avg_latency = latest_latency['manifest_metrics'].get('avg_latency_ms', 0)
-                if avg_latency:
-                    # Score basado en latencia (menor es mejor)
-                    overall_metrics['latency_score'] = max(0.0, 1.0 - (avg_latency / 1000))
-        
-        # Calcular score de adaptación
-        if adaptation_data:
-            latest_adaptation = adaptation_data[-1]
-            if latest_adaptation.get('aggregate_metrics'):
-                stability = latest_adaptation['aggregate_metrics'].get('stability_score', 0)
-                overall_metrics['adaptation_score'] = stability
-        
-        # Calcular score general
-        scores = [
-            overall_metrics['quality_score'],
-            overall_metrics['latency_score'],
-            overall_metrics['adaptation_score']
-        ]
-        overall_metrics['stream_health_score'] = sum(scores) / len(scores)
-        
-        # Generar recomendaciones
-        if overall_metrics['quality_score'] < 0.7:
-            overall_metrics['recommendations'].append("Calidad de video baja - revisar configuración de codificación")
-        
-        if overall_metrics['latency_score'] < 0.8:
-            overall_metrics['recommendations'].append("Latencia alta - optimizar red o servidor")
-        
-        if overall_metrics['adaptation_score'] < 0.6:
-            overall_metrics['recommendations'].append("Inestabilidad en adaptación - revisar configuración de bitrates")
-        
-        return overall_metrics
+    def calculate_overall_metrics(self):
+        """Calcula métricas generales del sistema (EWMA por dimensión ponderada por confianza)"""
+        return self.health.overall_metrics()
     
-    def generate_dashboard_data(self):
+    def generate_dashboard_data(self, aggregated_result):
         """Genera datos para el dashboard"""
-        aggregated_result = self.aggregate_results()
         if not aggregated_result:
             return
         
@@ -220,6 +266,7 @@ class StreamAnalysisSuite:
             'latency_score': aggregated_result['overall_metrics']['latency_score'],
             'adaptation_score': aggregated_result['overall_metrics']['adaptation_score'],
             'recommendations': aggregated_result['overall_metrics']['recommendations'],
+            'health_confidence': aggregated_result['overall_metrics']['confidence'],
             'session_duration': aggregated_result['session_duration']
         }
         
@@ -241,9 +288,11 @@ class StreamAnalysisSuite:
                 dashboard_data['stability_score'] = adaptation['aggregate_metrics'].get('stability_score', 0)
                 dashboard_data['switching_events'] = adaptation['aggregate_metrics'].get('total_switching_events', 0)
         
-        # Guardar datos del dashboard
-        with open(self.dashboard_data, 'w') as f:
+        # Guardar datos del dashboard de forma atómica: el dashboard lo relee al cambiar su mtime
+        tmp_path = f"{self.dashboard_data}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(dashboard_data, f, indent=2)
+        os.replace(tmp_path, self.dashboard_data)
         
         return dashboard_data
     
@@ -255,37 +304,54 @@ class StreamAnalysisSuite:
         print(f"Intervalo principal: {self.interval} segundos")
         print()
         
+        # Perfil por etapas: volcado periódico y captura bajo demanda con `kill -USR1 <pid>`
+        profiling.PROFILER.enable(self.profile_stats)
+        if threading.current_thread() is threading.main_thread():
+            profiling.PROFILER.install_signal_handler(forward=self.worker_pids)
+        
+        if self.metrics_server:
+            self.metrics_feeder.start()
+            self.metrics_server.start()
+        
         # Iniciar analizadores
         self.start_analyzers()
         
         # Bucle principal
         while self.running:
             try:
+                profiling.begin_tick('suite')
                 timestamp = datetime.now().isoformat()
                 print(f"[{timestamp}] Ejecutando análisis completo...")
                 
                 # Agregar resultados
-                aggregated_result = self.aggregate_results()
+                with profiling.span('suite.aggregate'):
+                    aggregated_result = self.aggregate_results()
                 if aggregated_result:
-                    self.suite_data.append(aggregated_result)
+                    self.retention.append(aggregated_result)
                     
                     # Generar datos del dashboard
-                    dashboard_data = self.generate_dashboard_data()
+                    with profiling.span('suite.dashboard_data'):
+                        dashboard_data = self.generate_dashboard_data(aggregated_result)
+                    with profiling.span('suite.summary'):
+                        self.summary.update(summary_from_result(aggregated_result))
                     
                     # Mostrar resumen
                     metrics = aggregated_result['overall_metrics']
-                    print(f"  📊 Health Score: {metrics['stream_health_score']:.3f}")
-                    print(f"  📊 Quality: {metrics['quality_score']:.3f}")
-                    print(f"  📊 Latency: {metrics['latency_score']:.3f}")
-                    print(f"  📊 Adaptation: {metrics['adaptation_score']:.3f}")
+                    print(f"  📊 Health Score: {format_score(metrics['stream_health_score'])} "
+                          f"(confianza {metrics['confidence']:.2f})")
+                    print(f"  📊 Quality: {format_score(metrics['quality_score'])}")
+                    print(f"  📊 Latency: {format_score(metrics['latency_score'])}")
+                    print(f"  📊 Adaptation: {format_score(metrics['adaptation_score'])}")
                     
                     if metrics['recommendations']:
                         print(f"  ⚠️  Recomendaciones: {len(metrics['recommendations'])}")
                 
                 # Guardar resultados
-                self.save_results()
+                with profiling.span('suite.save_results'):
+                    self.save_results()
                 
                 print(f"  Esperando {self.interval} segundos...")
+                profiling.end_tick()
                 time.sleep(self.interval)
                 
             except KeyboardInterrupt:
@@ -293,6 +359,7 @@ class StreamAnalysisSuite:
                 break
             except Exception as e:
                 print(f"Error en suite: {e}")
+                profiling.end_tick()
                 time.sleep(self.interval)
     
     def flatten_dict(self, d, parent_key='', sep='.'):
@@ -336,17 +403,17 @@ class StreamAnalysisSuite:
             f.write(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Manifest: {self.manifest_url}\n")
             f.write(f"Duración de sesión: {self.session_duration:.1f} segundos\n")
-            f.write(f"Total de análisis: {len(self.suite_data)}\n\n")
+            f.write(f"Total de análisis: {self.retention.total_added}\n\n")
             
             if self.suite_data:
                 latest = self.suite_data[-1]
                 metrics = latest['overall_metrics']
                 
                 f.write("--- PUNTUACIONES GENERALES ---\n")
-                f.write(f"Health Score: {metrics['stream_health_score']:.3f}\n")
-                f.write(f"Quality Score: {metrics['quality_score']:.3f}\n")
-                f.write(f"Latency Score: {metrics['latency_score']:.3f}\n")
-                f.write(f"Adaptation Score: {metrics['adaptation_score']:.3f}\n\n")
+                f.write(f"Health Score: {format_score(metrics['stream_health_score'])} (confianza {metrics['confidence']:.2f})\n")
+                f.write(f"Quality Score: {format_score(metrics['quality_score'])}\n")
+                f.write(f"Latency Score: {format_score(metrics['latency_score'])}\n")
+                f.write(f"Adaptation Score: {format_score(metrics['adaptation_score'])}\n\n")
                 
                 f.write("--- RECOMENDACIONES ---\n")
                 for rec in metrics['recommendations']:
@@ -357,16 +424,55 @@ class StreamAnalysisSuite:
                 f.write(f"Análisis de latencia: {latest['latency_analysis']['total_analyses']}\n")
                 f.write(f"Análisis de adaptación: {latest['adaptation_analysis']['total_analyses']}\n")
                 
+                if latest.get('resource_governor'):
+                    f.write("\n--- ESPERAS EN COLA (RESOURCE GOVERNOR) ---\n")
+                    for source, governor_metrics in latest['resource_governor'].items():
+                        for resource in ('in_flight', 'jobs'):
+                            for priority, waits in governor_metrics[resource]['waits'].items():
+                                f.write(f"{source}/{resource}/{priority}: {waits['count']} esperas, "
+                                        f"media {waits['avg_wait_ms']:.1f} ms, máx {waits['max_wait_ms']:.1f} ms\n")
+                
+                if latest.get('circuit_breakers'):
+                    f.write("\n--- CORTES DEL ORIGEN ---\n")
+                    for source, circuits in latest['circuit_breakers'].items():
+                        for origin, circuit in circuits.items():
+                            f.write(f"{source}/{origin}: circuito {circuit['state']}, {len(circuit['outages'])} cortes\n")
+                            for outage in circuit['outages'][-5:]:
+                                f.write(f"  {outage['start']} → {outage['end'] or 'en curso'} "
+                                        f"({outage['duration_s']:.0f}s, {outage['rejected']} peticiones evitadas)\n")
+                
+    
+    def collect_profile_metrics(self):
+        """En modo hilos el profiler de este proceso ya tiene las etapas de todos los analizadores"""
+        self.metrics_feeder.update_stages(profiling.PROFILER.snapshot()['stages'])
+    
+    def worker_pids(self):
+        """PIDs de los procesos de análisis (para reenviar la señal de captura de perfil)"""
+        if not self.supervisor:
+            return []
+        return [status['pid'] for status in self.supervisor.status().values() if status['alive']]
     
     def start(self):
         """Inicia la suite de análisis"""
         self.running = True
-        self.run_suite()
+        try:
+            self.run_suite()
+        finally:
+            # Los procesos de análisis no son daemon: siempre hay que detenerlos
+            self.stop()
     
     def stop(self):
         """Detiene la suite de análisis"""
         self.running = False
         self.stop_analyzers()
+        self.retention.close()
+        self.series.close()
+        self.summary.close()
+        profiling.PROFILER.dump()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_feeder.stop()
+            self.metrics_server = None
     
     @property
     def session_duration(self):
@@ -380,33 +486,67 @@ def main():
     parser.add_argument('--quality-only', action='store_true', help='Solo análisis de calidad')
     parser.add_argument('--latency-only', action='store_true', help='Solo análisis de latencia')
     parser.add_argument('--adaptation-only', action='store_true', help='Solo análisis de adaptación')
+    parser.add_argument('--record-trace', help='Registra una traza binaria de todas las peticiones HTTP en este archivo')
+    parser.add_argument('--process-mode', action='store_true', help='Ejecuta cada analizador en su propio proceso supervisado')
+    parser.add_argument('--origin-rate', type=float, default=10.0, help='Peticiones por segundo permitidas por origen')
+    parser.add_argument('--origin-burst', type=int, default=10, help='Ráfaga máxima de peticiones por origen')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Máximo de peticiones HTTP simultáneas')
+    parser.add_argument('--max-ffmpeg-jobs', type=int, default=2, help='Máximo de procesos ffmpeg/ffprobe simultáneos')
+    parser.add_argument('--breaker-failures', type=int, default=3, help='Fallos seguidos que abren el circuito de un origen')
+    parser.add_argument('--breaker-reset', type=float, default=15.0, help='Segundos con el circuito abierto antes de probar el origen')
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('METRICS_PORT', 0)),
+                        help='Puerto del endpoint OpenMetrics /metrics (0 = desactivado, por defecto $METRICS_PORT)')
+    add_retention_arguments(parser)
+    parser.add_argument('--checkpoint-interval', type=float, default=60,
+                        help='Segundos entre checkpoints del estado de cada analizador (0 = desactivado)')
+    parser.add_argument('--summary-db', default=os.environ.get('STREAM_SUMMARY_DB'),
+                        help='Base SQLite compartida con el resumen de todos los streams '
+                             '(por defecto <output>/streams.db o $STREAM_SUMMARY_DB)')
     
     args = parser.parse_args()
+    retention = policy_from_args(args)
+    
+    governor = ResourceGovernor(args.origin_rate, args.origin_burst, args.max_in_flight, args.max_ffmpeg_jobs)
+    circuit_breakers = CircuitBreakerRegistry(args.breaker_failures, args.breaker_reset)
+    if not args.process_mode:
+        common.set_resource_governor(governor)
+        common.set_circuit_breakers(circuit_breakers)
+    
+    # En modo procesos cada analizador abre su propia traza
+    if args.record_trace and not args.process_mode:
+        common.set_trace_recorder(TraceRecorder(args.record_trace))
     
     if args.quality_only:
         print("Ejecutando solo análisis de calidad...")
-        analyzer = StreamQualityAnalyzer(args.manifest_url, args.output, args.interval)
+        analyzer = StreamQualityAnalyzer(args.manifest_url, args.output, args.interval, retention=retention,
+                                         checkpoint_interval=args.checkpoint_interval)
         try:
             analyzer.start()
         except KeyboardInterrupt:
             analyzer.stop()
     elif args.latency_only:
         print("Ejecutando solo análisis de latencia...")
-        analyzer = StreamLatencyAnalyzer(args.manifest_url, args.output, args.interval//6)
+        analyzer = StreamLatencyAnalyzer(args.manifest_url, args.output, args.interval//6, retention=retention,
+                                         checkpoint_interval=args.checkpoint_interval)
         try:
             analyzer.start()
         except KeyboardInterrupt:
             analyzer.stop()
     elif args.adaptation_only:
         print("Ejecutando solo análisis de adaptación...")
-        analyzer = StreamAdaptationAnalyzer(args.manifest_url, args.output, args.interval//3)
+        analyzer = StreamAdaptationAnalyzer(args.manifest_url, args.output, args.interval//3, retention=retention,
+                                            checkpoint_interval=args.checkpoint_interval)
         try:
             analyzer.start()
         except KeyboardInterrupt:
             analyzer.stop()
     else:
         print("Ejecutando suite completa de análisis...")
-        suite = StreamAnalysisSuite(args.manifest_url, args.output, args.interval)
+        suite = StreamAnalysisSuite(args.manifest_url, args.output, args.interval,
+                                    process_mode=args.process_mode, trace_path=args.record_trace, governor=governor,
+                                    circuit_breakers=circuit_breakers, metrics_port=args.metrics_port,
+                                    retention=retention, checkpoint_interval=args.checkpoint_interval,
+                                    summary_db=args.summary_db)
         try:
             suite.start()
         except KeyboardInterrupt:
@@ -15,13 +15,42 @@ import threading
 import os
 
 import stream_analisys_common as common
+import profiling
+from resource_governor import PRIORITY_LATENCY
+from event_bus import TOPIC_LATENCY
+from metric_history import RingHistory, STATUS_CODES, STATUS_ERROR, STATUS_TIMEOUT
+from circuit_breaker import CircuitOpenError
+from mpd_diff import ManifestDiffer, EVENT_PUBLISH_STALLED, EVENT_UNCHANGED
+from throughput_trace import TraceRecorder
+from retention import RetentionStore, add_retention_arguments, policy_from_args
+from checkpoint import Checkpointer
+import cmaf_chunk_probe
+
+# Timeout de lectura entre chunks del sondeo LL-DASH
+CHUNK_PROBE_TIMEOUT = 10
+
+# Campos numéricos resumidos en los rollups de 1 min / 1 h
+RETENTION_FIELDS = [
+    'manifest_latency.latency_ms',
+    'manifest_metrics.avg_latency_ms',
+    'segment_metrics.avg_latency_ms',
+    'segment_metrics.p95_latency_ms',
+    'segment_metrics.timeout_rate',
+    'segment_metrics.error_rate',
+    'chunk_metrics.chunk_latency_avg_ms',
+    'chunk_metrics.chunk_interval_jitter_ms',
+]
 
 class StreamLatencyAnalyzer:
-    def __init__(self, manifest_url, output_dir="./latency_analysis", interval=5):
+    def __init__(self, manifest_url, output_dir="./latency_analysis", interval=5, history_window=50, event_bus=None, retention=None,
+                 checkpoint_interval=60, chunk_probe=True):
         self.manifest_url = manifest_url
         self.output_dir = output_dir
         self.interval = interval
+        self.chunk_probe = chunk_probe  # Sondeo de chunks CMAF si el MPD es LL-DASH
         self.running = False
+        self.stop_event = threading.Event()  # Interrumpe la espera entre ciclos al detener
+        self.event_bus = event_bus
         
         # Crear directorio de salida
         os.makedirs(output_dir, exist_ok=True)
@@ -31,18 +60,47 @@ class StreamLatencyAnalyzer:
         self.report_file = os.path.join(output_dir, "latency_report.txt")
         
         # Inicializar datos
-        self.latency_data = []
+        # Historial crudo acotado a la ventana de retención (lo anterior queda en rollups)
+        self.retention = RetentionStore('latency', output_dir, RETENTION_FIELDS, retention)
+        self.latency_data = self.retention.records
         self.session_start = datetime.now()
         
+        # Historial compacto de las últimas mediciones (ventana de métricas)
+        self.manifest_history = RingHistory(history_window)
+        self.segment_history = RingHistory(history_window)
+        
+        # Diferenciador de manifests: la información de segmentos solo se recalcula si cambió la estructura
+        self.manifest_differ = ManifestDiffer()
+        self.manifest_change = None
+        self.segment_info = None
+        self.segment_urls = None
+        
+        # El sondeo de chunks espera la disponibilidad del segmento y lo descarga entero: corre en su propio
+        # hilo con su propio presupuesto y el ciclo recoge el último resultado
+        self.chunk_lock = threading.Lock()
+        self.chunk_result = None
+        
+        # Checkpoint del estado móvil: al reiniciar se continúa sin releer los logs
+        self.checkpointer = Checkpointer('latency', os.path.join(output_dir, "latency_checkpoint.pkl"), checkpoint_interval)
+        self.checkpointer.restore(self)
+        
     def measure_manifest_latency(self):
         """Mide la latencia de respuesta del manifest"""
         start_time = time.time()
         try:
-            response = requests.get(self.manifest_url, timeout=10)
+            response = common.http_get(self.manifest_url, timeout=10, url_class=common.URL_CLASS_MANIFEST)
             end_time = time.time()
             
             latency = (end_time - start_time) * 1000  # Convertir a ms
             
+            # Reutilizar la respuesta medida para el análisis del manifest
+            self.manifest_change = None
+            if response.status_code == 200:
+                try:
+                    self.manifest_change = self.manifest_differ.update(response.content)
+                except ET.ParseError as e:
+                    print(f"Error parseando manifest: {e}")
+            
             return {
                 'status': 'success',
                 'latency_ms': latency,
@@ -50,6 +108,13 @@ class StreamLatencyAnalyzer:
                 'content_length': len(response.content),
                 'timestamp': datetime.now().isoformat()
             }
+        except CircuitOpenError as e:
+            return {
+                'status': 'circuit_open',
+                'latency_ms': None,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }
         except requests.exceptions.Timeout:
             return {
                 'status': 'timeout',
@@ -68,9 +133,10 @@ class StreamLatencyAnalyzer:
     def analyze_segment_availability(self):
         """Analiza la disponibilidad de segmentos"""
         try:
-            # Descargar y parsear el manifest
-           
-            root, namespace = common.fetch_mpd_root(self.manifest_url)
+            change = self.manifest_change or self.manifest_differ.fetch(self.manifest_url)
+            if not change.structure_changed and self.segment_info is not None:
+                return self.segment_info
+            root, namespace = change.root, change.namespace
 
             # Extraer información de segmentos
             period = root.find('.//mpd:Period', namespace)
@@ -87,7 +153,7 @@ class StreamLatencyAnalyzer:
                     representations = adaptation.findall('.//mpd:Representation', namespace)
                     for rep in representations:
                         segment_template = rep.find('.//mpd:SegmentTemplate', namespace)
-                        if segment_template:
+                        if segment_template is not None:
                             # Extraer información de segmentación
                             segment_duration = segment_template.get('duration')
                             timescale = segment_template.get('timescale', '1')
@@ -102,6 +168,7 @@ class StreamLatencyAnalyzer:
                                 }
                                 break
             
+            self.segment_info = segment_info
             return segment_info
             
         except Exception as e:
@@ -112,7 +179,7 @@ class StreamLatencyAnalyzer:
         """Mide la latencia de descarga de un segmento"""
         start_time = time.time()
         try:
-            response = requests.get(segment_url, timeout=30)
+            response = common.http_get(segment_url, timeout=30, url_class=common.URL_CLASS_SEGMENT)
             end_time = time.time()
             
             latency = (end_time - start_time) * 1000  # Convertir a ms
@@ -125,6 +192,14 @@ class StreamLatencyAnalyzer:
                 'segment_url': segment_url,
                 'timestamp': datetime.now().isoformat()
             }
+        except CircuitOpenError as e:
+            return {
+                'status': 'circuit_open',
+                'latency_ms': None,
+                'error': str(e),
+                'segment_url': segment_url,
+                'timestamp': datetime.now().isoformat()
+            }
         except requests.exceptions.Timeout:
             return {
                 'status': 'timeout',
@@ -142,14 +217,53 @@ class StreamLatencyAnalyzer:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def probe_chunks(self):
+        """Llegada de chunks CMAF del próximo segmento LL-DASH (None si el MPD no anuncia availabilityTimeOffset)"""
+        # El manifest lo descarga el ciclo principal; aquí solo se lee el último
+        change = self.manifest_change
+        if change is None:
+            return None
+        try:
+            target = cmaf_chunk_probe.chunk_probe_target(change.root, change.namespace, self.manifest_url)
+        except Exception as e:
+            print(f"Error preparando sondeo de chunks: {e}")
+            return None
+        if target is None:
+            return None
+        # Presupuesto propio: espera hasta la disponibilidad, duración del segmento y timeout de lectura
+        common.start_tick(max(0.0, target['available_at'] - time.time()) + target['duration'] + CHUNK_PROBE_TIMEOUT)
+        try:
+            return cmaf_chunk_probe.probe_segment(target, timeout=CHUNK_PROBE_TIMEOUT, wait=self.stop_event.wait)
+        finally:
+            common.end_tick()
+    
+    def run_chunk_probe(self):
+        """Hilo del sondeo de chunks: un segmento por intervalo, fuera del presupuesto del ciclo"""
+        common.set_thread_priority(PRIORITY_LATENCY)
+        while not self.stop_event.wait(self.interval):
+            try:
+                with profiling.span('latency.chunk_probe'):
+                    result = self.probe_chunks()
+            except Exception as e:
+                print(f"Error en sondeo de chunks: {e}")
+                continue
+            if result is not None and result['status'] != 'cancelled':
+                with self.chunk_lock:
+                    self.chunk_result = result
+    
+    def take_chunk_metrics(self):
+        """Último resultado del sondeo de chunks aún no registrado (None si no hay uno nuevo)"""
+        with self.chunk_lock:
+            result, self.chunk_result = self.chunk_result, None
+        return result
+    
     def get_segment_urls(self):
         """Obtiene URLs de segmentos del manifest"""
         try:
-            response = requests.get(self.manifest_url, timeout=10)
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            namespace = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
+            change = self.manifest_change or self.manifest_differ.fetch(self.manifest_url)
+            if not change.structure_changed and self.segment_urls is not None:
+                return self.segment_urls
+            root, namespace = change.root, change.namespace
             
             segment_urls = []
             
@@ -161,7 +275,7 @@ class StreamLatencyAnalyzer:
                     for rep in representations:
                         # Obtener el primer segmento como muestra
                         segment_template = rep.find('.//mpd:SegmentTemplate', namespace)
-                        if segment_template:
+                        if segment_template is not None:
                             media = segment_template.get('media')
                             if media:
                                 # Construir URL del primer segmento
@@ -169,20 +283,30 @@ class StreamLatencyAnalyzer:
                                 segment_urls.append(segment_url)
                                 break
             
-            return segment_urls[:2]  # Limitar a 2 segmentos para análisis
+            self.segment_urls = segment_urls[:2]  # Limitar a 2 segmentos para análisis
+            return self.segment_urls
             
         except Exception as e:
             print(f"Error obteniendo URLs de segmentos: {e}")
             return []
     
+    def record_latency(self, history, result):
+        """Agrega una medición al historial compacto de latencias"""
+        history.append(
+            timestamp=time.time(),
+            latency=result.get('latency_ms'),
+            size=result.get('content_length'),
+            status=STATUS_CODES.get(result.get('status'), STATUS_ERROR)
+        )
+    
     def calculate_buffering_metrics(self, latency_history):
-        """Calcula métricas de buffering basadas en latencia"""
-        if not latency_history:
+        """Calcula métricas de buffering basadas en latencia (agregados incrementales de la ventana)"""
+        total = len(latency_history)
+        if not total:
             return {}
         
-        successful_latencies = [l['latency_ms'] for l in latency_history if l.get('latency_ms') is not None]
-        
-        if not successful_latencies:
+        successful = latency_history.valid_count('latency')
+        if not successful:
             return {
                 'avg_latency_ms': None,
                 'min_latency_ms': None,
@@ -192,30 +316,22 @@ class StreamLatencyAnalyzer:
                 'error_rate': 1.0
             }
         
-        avg_latency = sum(successful_latencies) / len(successful_latencies)
-        min_latency = min(successful_latencies)
-        max_latency = max(successful_latencies)
-        
-        # Calcular varianza
-        variance = sum((x - avg_latency) ** 2 for x in successful_latencies) / len(successful_latencies)
-        
-        # Calcular tasas de error
-        timeouts = len([l for l in latency_history if l.get('status') == 'timeout'])
-        errors = len([l for l in latency_history if l.get('status') == 'error'])
-        total = len(latency_history)
-        
-        timeout_rate = timeouts / total if total > 0 else 0
-        error_rate = errors / total if total > 0 else 0
+        timeouts = latency_history.count_of('status', STATUS_TIMEOUT)
+        errors = latency_history.count_of('status', STATUS_ERROR)
         
         return {
-            'avg_latency_ms': avg_latency,
-            'min_latency_ms': min_latency,
-            'max_latency_ms': max_latency,
-            'latency_variance': variance,
-            'timeout_rate': timeout_rate,
-            'error_rate': error_rate,
+            'avg_latency_ms': latency_history.mean('latency'),
+            'min_latency_ms': latency_history.nan_min('latency'),
+            'max_latency_ms': latency_history.nan_max('latency'),
+            'latency_variance': latency_history.variance('latency'),
+            'ewma_latency_ms': latency_history.ewma_value('latency'),
+            'p50_latency_ms': latency_history.percentile('latency', 50),
+            'p95_latency_ms': latency_history.percentile('latency', 95),
+            'p99_latency_ms': latency_history.percentile('latency', 99),
+            'timeout_rate': timeouts / total,
+            'error_rate': errors / total,
             'total_measurements': total,
-            'successful_measurements': len(successful_latencies)
+            'successful_measurements': successful
         }
     
     def run_analysis(self):
@@ -226,58 +342,95 @@ class StreamLatencyAnalyzer:
         print(f"Directorio de salida: {self.output_dir}")
         print()
         
-        manifest_latency_history = []
-        segment_latency_history = []
+        # Prioridad de este analizador en el presupuesto compartido de peticiones
+        common.set_thread_priority(PRIORITY_LATENCY)
         
         while self.running:
             try:
+                # Presupuesto de tiempo del ciclo: ninguna petición se extiende más allá del intervalo
+                common.start_tick(self.interval)
+                profiling.begin_tick('latency')
                 timestamp = datetime.now().isoformat()
                 print(f"[{timestamp}] Analizando latencia...")
                 
                 # 1. Medir latencia del manifest
-                manifest_result = self.measure_manifest_latency()
-                manifest_latency_history.append(manifest_result)
+                with profiling.span('latency.manifest'):
+                    manifest_result = self.measure_manifest_latency()
+                if manifest_result['status'] == 'circuit_open':
+                    # Origen caído: la caída queda registrada como intervalo en el circuit breaker,
+                    # no se acumulan resultados de error por ciclo
+                    print(f"  ⚠️  {manifest_result['error']}, se omite el ciclo")
+                    self.wait_next_tick()
+                    continue
+                self.record_latency(self.manifest_history, manifest_result)
                 
                 if manifest_result['status'] == 'success':
                     print(f"  ✓ Latencia manifest: {manifest_result['latency_ms']:.1f} ms")
                 else:
                     print(f"  ✗ Error manifest: {manifest_result.get('error', 'Unknown')}")
                 
-                # 2. Analizar disponibilidad de segmentos
-                segment_info = self.analyze_segment_availability()
+                # 2. Analizar disponibilidad de segmentos (solo si cambió la estructura del manifest)
+                with profiling.span('latency.segment_availability'):
+                    segment_info = self.analyze_segment_availability()
+                manifest_events = []
+                if self.manifest_change:
+                    manifest_events = [e for e in self.manifest_change.events if e['type'] != EVENT_UNCHANGED]
+                for event in manifest_events:
+                    if event['type'] == EVENT_PUBLISH_STALLED:
+                        print(f"  ⚠️  Manifest atascado: publishTime y timeline sin cambios hace {event['stalled_seconds']:.1f}s")
                 
                 # 3. Medir latencia de segmentos
                 segment_urls = self.get_segment_urls()
                 segment_results = []
                 
                 for i, segment_url in enumerate(segment_urls):
-                    segment_result = self.measure_segment_download_latency(segment_url)
+                    with profiling.span('latency.segment_download'):
+                        segment_result = self.measure_segment_download_latency(segment_url)
+                    if segment_result['status'] == 'circuit_open':
+                        break
                     segment_results.append(segment_result)
-                    segment_latency_history.append(segment_result)
+                    self.record_latency(self.segment_history, segment_result)
                     
                     if segment_result['status'] == 'success':
                         print(f"  ✓ Latencia segmento {i+1}: {segment_result['latency_ms']:.1f} ms")
                     else:
                         print(f"  ✗ Error segmento {i+1}: {segment_result.get('error', 'Unknown')}")
                 
-                # 4. Calcular métricas agregadas
-                manifest_metrics = self.calculate_buffering_metrics(manifest_latency_history[-50:])  # Últimos 50
-                segment_metrics = self.calculate_buffering_metrics(segment_latency_history[-50:])   # Últimos 50
+                # 4. Llegada de chunks CMAF en streams de baja latencia (último sondeo del hilo de chunks)
+                chunk_metrics = self.take_chunk_metrics()
+                if chunk_metrics and chunk_metrics.get('chunks'):
+                    print(f"  {'⚠️ ' if chunk_metrics['partial'] else '✓'} Chunks CMAF: {chunk_metrics['chunks']}, "
+                          f"latencia media {chunk_metrics['chunk_latency_avg_ms']:.1f} ms, "
+                          f"jitter {chunk_metrics['chunk_interval_jitter_ms'] or 0:.1f} ms"
+                          + (f" (interrumpido: {chunk_metrics['error']})" if chunk_metrics['partial'] else ""))
+                elif chunk_metrics:
+                    print(f"  ✗ Error sondeo de chunks: {chunk_metrics.get('error', 'Unknown')}")
+                
+                # 5. Calcular métricas agregadas
+                with profiling.span('latency.metrics'):
+                    manifest_metrics = self.calculate_buffering_metrics(self.manifest_history)
+                    segment_metrics = self.calculate_buffering_metrics(self.segment_history)
                 
-                # 5. Crear resultado del análisis
+                # 6. Crear resultado del análisis
                 analysis_result = {
                     'timestamp': timestamp,
                     'manifest_latency': manifest_result,
                     'segment_latencies': segment_results,
                     'segment_info': segment_info,
+                    'manifest_events': manifest_events,
                     'manifest_metrics': manifest_metrics,
                     'segment_metrics': segment_metrics,
+                    'chunk_metrics': chunk_metrics,
                     'session_duration': (datetime.now() - self.session_start).total_seconds()
                 }
                 
                 # Guardar resultado
-                self.latency_data.append(analysis_result)
-                self.save_results()
+                self.retention.append(analysis_result)
+                if self.event_bus:
+                    self.event_bus.publish(TOPIC_LATENCY, analysis_result)
+                with profiling.span('latency.save_results'):
+                    self.save_results()
+                self.checkpointer.maybe_save(self)
                 
                 # Mostrar resumen
                 if manifest_metrics['avg_latency_ms']:
@@ -286,14 +439,18 @@ class StreamLatencyAnalyzer:
                     print(f"  📊 Latencia promedio segmentos: {segment_metrics['avg_latency_ms']:.1f} ms")
                 
                 print(f"  Esperando {self.interval} segundos...")
-                time.sleep(self.interval)
+                self.wait_next_tick()
                 
             except KeyboardInterrupt:
                 print("\nDetención solicitada por el usuario")
                 break
             except Exception as e:
                 print(f"Error en análisis: {e}")
-                time.sleep(self.interval)
+                self.wait_next_tick()
+        
+        # Persistir los buckets de rollup abiertos y el estado final
+        self.retention.close()
+        self.checkpointer.save(self)
     
     # def flatten_dict(self, d, parent_key='', sep='.'):
     #     items = []
@@ -324,7 +481,8 @@ class StreamLatencyAnalyzer:
         common.save_results(self.latency_data, self.latency_log)
 
         # Generar reporte de texto
-        self.generate_report()
+        with profiling.span('latency.report'):
+            self.generate_report()
     
     def generate_report(self):
         """Genera reporte de texto"""
@@ -333,7 +491,7 @@ class StreamLatencyAnalyzer:
             f.write(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Manifest: {self.manifest_url}\n")
             f.write(f"Duración de sesión: {self.session_duration:.1f} segundos\n")
-            f.write(f"Total de análisis: {len(self.latency_data)}\n\n")
+            f.write(f"Total de análisis: {self.retention.total_added}\n\n")
             
             if self.latency_data:
                 latest = self.latency_data[-1]
@@ -358,6 +516,24 @@ class StreamLatencyAnalyzer:
                 f.write(f"Tasa de timeout: {segment_metrics['timeout_rate']:.2%}\n")
                 f.write(f"Tasa de error: {segment_metrics['error_rate']:.2%}\n\n")
                 
+                chunk_metrics = latest.get('chunk_metrics')
+                if chunk_metrics and chunk_metrics.get('chunks'):
+                    f.write("--- CHUNKS CMAF (LL-DASH) ---\n")
+                    f.write(f"Segmento: {chunk_metrics['number']} ({chunk_metrics['representation_id']})\n")
+                    if chunk_metrics['partial']:
+                        f.write(f"⚠️  Descarga interrumpida ({chunk_metrics['error']}): solo los chunks recibidos\n")
+                    f.write(f"availabilityTimeOffset: {chunk_metrics['availability_time_offset']:.3f} s\n")
+                    f.write(f"Chunks: {chunk_metrics['chunks']} (nominal {chunk_metrics['nominal_chunk_ms']:.1f} ms)\n")
+                    if chunk_metrics['chunk_interval_avg_ms'] is not None:
+                        f.write(f"Intervalo entre chunks: {chunk_metrics['chunk_interval_avg_ms']:.1f} ms "
+                                f"(jitter {chunk_metrics['chunk_interval_jitter_ms']:.1f} ms, máx {chunk_metrics['chunk_interval_max_ms']:.1f} ms)\n")
+                    f.write(f"Latencia extremo a extremo: {chunk_metrics['chunk_latency_avg_ms']:.1f} ms "
+                            f"(máx {chunk_metrics['chunk_latency_max_ms']:.1f} ms)\n")
+                    f.write(f"Retraso frente a la disponibilidad anunciada: {chunk_metrics['availability_delay_avg_ms']:.1f} ms\n")
+                    if not chunk_metrics['chunked']:
+                        f.write("⚠️  El origen no entrega el segmento con Transfer-Encoding chunked\n")
+                    f.write("\n")
+                
                 f.write("--- RECOMENDACIONES ---\n")
                 if manifest_metrics['avg_latency_ms'] and manifest_metrics['avg_latency_ms'] > 1000:
                     f.write("⚠️  Latencia del manifest muy alta (>1s)\n")
@@ -374,14 +550,38 @@ class StreamLatencyAnalyzer:
                     if manifest_lat != 'N/A':
                         f.write(f"{i}. {analysis['timestamp']} - Manifest: {manifest_lat:.1f} ms\n")
     
+    def get_state(self):
+        """Estado móvil para el checkpoint (ventanas de latencia y retención)"""
+        return {
+            'session_start': self.session_start,
+            'manifest_history': self.manifest_history,
+            'segment_history': self.segment_history,
+            'retention': self.retention.get_state(),
+        }
+    
+    def restore_state(self, state):
+        self.session_start = state['session_start']
+        self.manifest_history = state['manifest_history']
+        self.segment_history = state['segment_history']
+        self.retention.restore_state(state['retention'])
+    
     def start(self):
         """Inicia el análisis"""
         self.running = True
+        self.stop_event.clear()
+        if self.chunk_probe:
+            threading.Thread(target=self.run_chunk_probe, name="latency-chunk-probe", daemon=True).start()
         self.run_analysis()
     
+    def wait_next_tick(self):
+        """Cierra el span del ciclo y espera al siguiente (interrumpible por stop)"""
+        profiling.end_tick()
+        self.stop_event.wait(self.interval)
+    
     def stop(self):
         """Detiene el análisis"""
         self.running = False
+        self.stop_event.set()
     
     @property
     def session_duration(self):
@@ -392,10 +592,20 @@ def main():
     parser.add_argument('manifest_url', help='URL del manifest DASH/HLS')
     parser.add_argument('-o', '--output', default='./latency_analysis', help='Directorio de salida')
     parser.add_argument('-i', '--interval', type=int, default=5, help='Intervalo de análisis en segundos')
+    parser.add_argument('--no-chunk-probe', action='store_true',
+                        help='No sondear la llegada de chunks CMAF en manifests LL-DASH')
+    parser.add_argument('--record-trace', help='Registra una traza binaria de todas las peticiones HTTP en este archivo')
+    add_retention_arguments(parser)
+    parser.add_argument('--checkpoint-interval', type=float, default=60,
+                        help='Segundos entre checkpoints del estado del analizador (0 = desactivado)')
     
     args = parser.parse_args()
     
-    analyzer = StreamLatencyAnalyzer(args.manifest_url, args.output, args.interval)
+    if args.record_trace:
+        common.set_trace_recorder(TraceRecorder(args.record_trace))
+    
+    analyzer = StreamLatencyAnalyzer(args.manifest_url, args.output, args.interval, retention=policy_from_args(args),
+                                     checkpoint_interval=args.checkpoint_interval, chunk_probe=not args.no_chunk_probe)
     
     try:
         analyzer.start()
@@ -9,16 +9,137 @@ import time
 import json
 import argparse
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 import xml.etree.ElementTree as ET
 
+import stream_analisys_common as common
+import profiling
+from throughput_trace import TraceRecorder
+from retention import RetentionStore, LogSketch, add_retention_arguments, policy_from_args
+from metric_history import RunningStats
+import hls_engine
+
+# Campos numéricos resumidos en los rollups de 1 min / 1 h
+RETENTION_FIELDS = [
+    'network_info.response_time',
+    'network_info.ttfb',
+    'segment_check.avg_response_time',
+    'manifest_info.latency_s',
+    'bitrate_stats.avg',
+]
+
+# Segmentos del live edge verificados por ciclo (uno por representación de video)
+MAX_SEGMENT_CHECKS = 5
+
+REPORT_QUANTILES = (0.5, 0.95, 0.99)
+
+class MonitorAggregates:
+    """Agregados de toda la sesión actualizados en O(1) por ciclo: el reporte final no recorre las métricas"""
+    
+    def __init__(self):
+        self.total_checks = 0
+        self.start_time = None
+        self.end_time = None
+        self.status_counts = {}
+        self.bitrate_min = None
+        self.bitrate_max = None
+        self.bitrate_avg = RunningStats()
+        self.response_time = RunningStats()
+        self.response_time_sketch = LogSketch()
+        self.ttfb_sketch = LogSketch()
+        self.segment_response_time = RunningStats()
+        self.segment_response_time_sketch = LogSketch()
+        self.accessible_segments = 0
+        self.failed_segments = 0
+        self.latency = RunningStats()
+        self.latency_sketch = LogSketch()
+    
+    def add(self, metrics):
+        self.total_checks += 1
+        if self.start_time is None:
+            self.start_time = metrics['timestamp']
+        self.end_time = metrics['timestamp']
+        
+        network_info = metrics['network_info']
+        self.status_counts[network_info['status']] = self.status_counts.get(network_info['status'], 0) + 1
+        if network_info.get('response_time') is not None:
+            self.response_time.add(network_info['response_time'])
+            self.response_time_sketch.add(network_info['response_time'])
+        if network_info.get('ttfb') is not None:
+            self.ttfb_sketch.add(network_info['ttfb'])
+        
+        if 'bitrate_stats' in metrics:
+            stats = metrics['bitrate_stats']
+            self.bitrate_min = stats['min'] if self.bitrate_min is None else min(self.bitrate_min, stats['min'])
+            self.bitrate_max = stats['max'] if self.bitrate_max is None else max(self.bitrate_max, stats['max'])
+            self.bitrate_avg.add(stats['avg'])
+        
+        if 'segment_check' in metrics:
+            self.accessible_segments += metrics['segment_check']['accessible_segments']
+            self.failed_segments += metrics['segment_check']['failed_segments']
+        
+        latency = (metrics.get('manifest_info') or {}).get('latency_s')
+        if latency is not None:
+            self.latency.add(latency)
+            self.latency_sketch.add(max(0.0, latency))
+    
+    def add_segment_times(self, response_times):
+        for response_time in response_times:
+            self.segment_response_time.add(response_time)
+            self.segment_response_time_sketch.add(response_time)
+    
+    @staticmethod
+    def _timing(stats, sketch):
+        if not stats.count:
+            return None
+        summary = {'min': stats.min, 'max': stats.max, 'avg': stats.mean}
+        for q in REPORT_QUANTILES:
+            summary[f"p{int(q * 100)}"] = sketch.quantile(q)
+        return summary
+    
+    def report(self):
+        ok = self.status_counts.get('ok', 0)
+        statistics = {
+            'network': {
+                'success_rate': ok / self.total_checks * 100 if self.total_checks else 0.0,
+                'total_errors': self.status_counts.get('error', 0),
+                'status_counts': dict(self.status_counts),
+                'response_time': self._timing(self.response_time, self.response_time_sketch),
+                'ttfb_p95': self.ttfb_sketch.quantile(0.95),
+            }
+        }
+        if self.bitrate_avg.count:
+            statistics['bitrate'] = {
+                'min': self.bitrate_min,
+                'max': self.bitrate_max,
+                'avg': self.bitrate_avg.mean
+            }
+        if self.accessible_segments or self.failed_segments:
+            statistics['segments'] = {
+                'accessible': self.accessible_segments,
+                'failed': self.failed_segments,
+                'response_time': self._timing(self.segment_response_time, self.segment_response_time_sketch),
+            }
+        if self.latency.count:
+            statistics['hls_latency'] = self._timing(self.latency, self.latency_sketch)
+        return statistics
+
 class StreamMonitor:
-    def __init__(self, manifest_url, output_file=None):
+    def __init__(self, manifest_url, output_file=None, retention=None, max_segment_checks=MAX_SEGMENT_CHECKS):
         self.manifest_url = manifest_url
-        self.output_file = output_file or f"stream_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        self.max_segment_checks = max_segment_checks
+        # Una línea JSON por ciclo (append): la escritura no crece con la duración de la sesión
+        self.output_file = output_file or f"stream_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
         self.session = requests.Session()
-        self.metrics = []
+        # Seguimiento incremental de cada media playlist HLS (por URL)
+        self.hls_trackers = {}
+        # Métricas crudas acotadas a la ventana de retención (lo anterior queda en rollups)
+        self.retention = RetentionStore('monitor', os.path.dirname(self.output_file) or '.', RETENTION_FIELDS, retention)
+        self.metrics = self.retention.records
+        self.aggregates = MonitorAggregates()
         
         # Configurar logging
         logging.basicConfig(
@@ -31,25 +152,48 @@ class StreamMonitor:
         )
         self.logger = logging.getLogger(__name__)
         
-    def analyze_manifest(self):
-        """Analiza el manifest DASH o HLS"""
+    def fetch_manifest(self):
+        """Única descarga del manifest por ciclo: la misma petición da el contenido, el estado de red y los tiempos"""
+        network_info = {
+            'status': 'unknown',
+            'response_time': None,
+            'error': None
+        }
         try:
-            response = self.session.get(self.manifest_url, timeout=10)
-            response.raise_for_status()
-            
-            content_type = response.headers.get('content-type', '')
-            
-            if 'mpd' in content_type or self.manifest_url.endswith('.mpd'):
-                return self.analyze_dash_manifest(response.text)
-            elif 'm3u8' in content_type or self.manifest_url.endswith('.m3u8'):
-                return self.analyze_hls_manifest(response.text)
-            else:
-                self.logger.warning(f"Tipo de manifest no reconocido: {content_type}")
-                return None
-                
+            start_time = time.time()
+            response = common.http_get(self.manifest_url, timeout=10, url_class=common.URL_CLASS_MANIFEST, session=self.session)
+            response_time = time.time() - start_time
         except requests.RequestException as e:
             self.logger.error(f"Error al obtener manifest: {e}")
-            return None
+            network_info['status'] = 'error'
+            network_info['error'] = str(e)
+            return None, network_info
+        
+        # Desglose: hasta las cabeceras (TTFB) y descarga del cuerpo
+        ttfb = response.elapsed.total_seconds()
+        network_info['status'] = 'ok' if response.status_code == 200 else 'error'
+        network_info['response_time'] = response_time
+        network_info['ttfb'] = ttfb
+        network_info['download_time'] = max(0.0, response_time - ttfb)
+        network_info['http_status'] = response.status_code
+        network_info['content_length'] = len(response.content)
+        if response.status_code != 200:
+            network_info['error'] = f"HTTP {response.status_code}"
+            self.logger.error(f"Error al obtener manifest: HTTP {response.status_code}")
+            return None, network_info
+        return response, network_info
+    
+    def analyze_manifest(self, response):
+        """Analiza el manifest DASH o HLS ya descargado; devuelve la info y las URLs de segmentos del live edge"""
+        content_type = response.headers.get('content-type', '')
+        
+        if 'mpd' in content_type or self.manifest_url.endswith('.mpd'):
+            return self.analyze_dash_manifest(response.text)
+        elif 'm3u8' in content_type or self.manifest_url.endswith('.m3u8'):
+            return self.analyze_hls_manifest(response.text)
+        else:
+            self.logger.warning(f"Tipo de manifest no reconocido: {content_type}")
+            return None, []
     
     def analyze_dash_manifest(self, manifest_content):
         """Analiza manifest DASH"""
@@ -100,44 +244,121 @@ class StreamMonitor:
                 elif content_type == 'text':
                     manifest_info['subtitle_streams'] = len(representations)
             
-            return manifest_info
+            return manifest_info, self.dash_live_edge_urls(root)
             
         except ET.ParseError as e:
             self.logger.error(f"Error al parsear manifest DASH: {e}")
-            return None
+            return None, []
+    
+    def dash_live_edge_urls(self, root):
+        """URL del último segmento publicado de cada representación de video"""
+        namespace = common.MPD_NAMESPACE
+        availability_start_time = common.parse_iso_datetime(root.get('availabilityStartTime'))
+        urls = []
+        for adaptation in common.get_adaptation_sets(root, namespace):
+            if adaptation.get('contentType') != 'video' and not adaptation.get('mimeType', '').startswith('video'):
+                continue
+            for rep in adaptation.findall('mpd:Representation', namespace):
+                segment_template = rep.find('mpd:SegmentTemplate', namespace)
+                if segment_template is None:
+                    segment_template = adaptation.find('mpd:SegmentTemplate', namespace)
+                if segment_template is None or not segment_template.get('media'):
+                    continue
+                live_edge = common.get_live_edge_segment(segment_template, namespace, availability_start_time)
+                if live_edge is not None:
+                    urls.append(common.build_segment_url(self.manifest_url, segment_template.get('media'), rep.get('id', ''),
+                                                         live_edge['number'], live_edge['time']))
+        return urls[:self.max_segment_checks]
     
     def analyze_hls_manifest(self, manifest_content):
-        """Analiza manifest HLS"""
-        lines = manifest_content.split('\n')
+        """Analiza manifest HLS: de una master se siguen las variantes, de una media solo los segmentos nuevos"""
+        playlist = hls_engine.parse_playlist(manifest_content, self.manifest_url)
         manifest_info = {
             'type': 'HLS',
             'variants': 0,
             'bitrates': [],
             'resolutions': [],
-            'codecs': []
+            'codecs': [],
+            'media_playlists': [],
+            'latency_s': None
         }
         
-        for line in lines:
-            line = line.strip()
-            if line.startswith('#EXT-X-STREAM-INF'):
-                manifest_info['variants'] += 1
-                # Extraer bitrate
-                if 'BANDWIDTH=' in line:
-                    bitrate = line.split('BANDWIDTH=')[1].split(',')[0]
-                    manifest_info['bitrates'].append(int(bitrate))
-                # Extraer resolución
-                if 'RESOLUTION=' in line:
-                    resolution = line.split('RESOLUTION=')[1].split(',')[0]
-                    manifest_info['resolutions'].append(resolution)
-                # Extraer codec
-                if 'CODECS=' in line:
-                    codec = line.split('CODECS=')[1].split(',')[0].strip('"')
-                    manifest_info['codecs'].append(codec)
-        
-        return manifest_info
+        if isinstance(playlist, hls_engine.MasterPlaylist):
+            manifest_info['variants'] = len(playlist.variants)
+            for variant in playlist.variants:
+                if variant['bandwidth']:
+                    manifest_info['bitrates'].append(variant['bandwidth'])
+                if variant['resolution']:
+                    manifest_info['resolutions'].append(variant['resolution'])
+                if variant['codecs']:
+                    manifest_info['codecs'].append(variant['codecs'])
+            
+            # Una recarga por variante seguida (hasta max_segment_checks), en paralelo
+            trackers = []
+            for variant in playlist.variants[:self.max_segment_checks]:
+                if variant['uri'] not in self.hls_trackers:
+                    self.hls_trackers[variant['uri']] = hls_engine.HlsMediaTracker(variant['uri'], self.session, blocking=False)
+                trackers.append(self.hls_trackers[variant['uri']])
+            if trackers:
+                with ThreadPoolExecutor(max_workers=len(trackers), thread_name_prefix='hls-variant') as pool:
+                    updates = list(pool.map(self.update_hls_tracker, trackers))
+            else:
+                updates = []
+        else:
+            # Media playlist: se reutiliza el contenido ya descargado
+            if self.manifest_url not in self.hls_trackers:
+                self.hls_trackers[self.manifest_url] = hls_engine.HlsMediaTracker(self.manifest_url, self.session, blocking=False)
+            trackers = [self.hls_trackers[self.manifest_url]]
+            updates = [trackers[0].ingest(manifest_content)]
+        
+        live_edge_urls = []
+        for tracker, update in zip(trackers, updates):
+            if 'error' in update:
+                manifest_info['media_playlists'].append(update)
+                continue
+            manifest_info['media_playlists'].append({
+                'url': update['url'],
+                'media_sequence': update['media_sequence'],
+                'last_msn': update['last_msn'],
+                'new_segments': len(update['new_segments']),
+                'new_parts': update['new_parts'],
+                'missed_segments': update['missed_segments'],
+                'target_duration': update['target_duration'],
+                'low_latency': update['low_latency'],
+                'can_block_reload': update['can_block_reload'],
+                'endlist': update['endlist'],
+                'latency_s': update['latency_s']
+            })
+            if tracker.playlist.segments:
+                live_edge_urls.append(tracker.playlist.segments[-1]['uri'])
+        
+        # Latencia del stream: la de la variante más fresca (según EXT-X-PROGRAM-DATE-TIME)
+        latencies = [media['latency_s'] for media in manifest_info['media_playlists'] if media.get('latency_s') is not None]
+        if latencies:
+            manifest_info['latency_s'] = min(latencies)
+        return manifest_info, live_edge_urls[:self.max_segment_checks]
+    
+    def update_hls_tracker(self, tracker):
+        try:
+            return tracker.update()
+        except requests.RequestException as e:
+            self.logger.error(f"Error al recargar media playlist {tracker.url}: {e}")
+            return {'url': tracker.url, 'error': str(e)}
+    
+    def check_segment(self, url):
+        """HEAD de un segmento: (tiempo de respuesta, error)"""
+        try:
+            start_time = time.time()
+            response = common.http_head(url, timeout=5, url_class=common.URL_CLASS_SEGMENT, session=self.session)
+            response_time = time.time() - start_time
+            if response.status_code == 200:
+                return response_time, None
+            return None, f"HTTP {response.status_code}: {url}"
+        except requests.RequestException as e:
+            return None, f"Error: {e}"
     
     def check_segment_accessibility(self, segment_urls, max_checks=5):
-        """Verifica la accesibilidad de los segmentos"""
+        """Verifica la accesibilidad de los segmentos (en paralelo: el ciclo dura lo que el HEAD más lento)"""
         results = {
             'accessible_segments': 0,
             'failed_segments': 0,
@@ -145,22 +366,19 @@ class StreamMonitor:
             'errors': []
         }
         
-        for i, url in enumerate(segment_urls[:max_checks]):
-            try:
-                start_time = time.time()
-                response = self.session.head(url, timeout=5)
-                response_time = time.time() - start_time
-                
-                if response.status_code == 200:
-                    results['accessible_segments'] += 1
-                    results['response_times'].append(response_time)
-                else:
-                    results['failed_segments'] += 1
-                    results['errors'].append(f"HTTP {response.status_code}: {url}")
-                    
-            except requests.RequestException as e:
+        segment_urls = segment_urls[:max_checks]
+        if not segment_urls:
+            return results
+        with ThreadPoolExecutor(max_workers=len(segment_urls), thread_name_prefix='segment-check') as pool:
+            checks = list(pool.map(self.check_segment, segment_urls))
+        
+        for response_time, error in checks:
+            if error is None:
+                results['accessible_segments'] += 1
+                results['response_times'].append(response_time)
+            else:
                 results['failed_segments'] += 1
-                results['errors'].append(f"Error: {e}")
+                results['errors'].append(error)
         
         if results['response_times']:
             results['avg_response_time'] = sum(results['response_times']) / len(results['response_times'])
@@ -171,8 +389,19 @@ class StreamMonitor:
         """Recolecta métricas del stream"""
         timestamp = datetime.now().isoformat()
         
-        # Analizar manifest
-        manifest_info = self.analyze_manifest()
+        # Una sola descarga del manifest alimenta el análisis, el estado de red y los tiempos
+        with profiling.span('monitor.manifest'):
+            response, network_info = self.fetch_manifest()
+        if response is None:
+            # El fallo de red también es una medición (cuenta en la tasa de éxito del reporte)
+            return {
+                'timestamp': timestamp,
+                'manifest_url': self.manifest_url,
+                'network_info': network_info
+            }
+        
+        with profiling.span('monitor.parse'):
+            manifest_info, segment_urls = self.analyze_manifest(response)
         
         if not manifest_info:
             return None
@@ -182,26 +411,15 @@ class StreamMonitor:
             'timestamp': timestamp,
             'manifest_url': self.manifest_url,
             'manifest_info': manifest_info,
-            'network_info': {
-                'status': 'unknown',
-                'response_time': None,
-                'error': None
-            }
+            'network_info': network_info
         }
         
-        # Verificar conectividad
-        try:
-            start_time = time.time()
-            response = self.session.get(self.manifest_url, timeout=10)
-            response_time = time.time() - start_time
-            
-            metrics['network_info']['status'] = 'ok' if response.status_code == 200 else 'error'
-            metrics['network_info']['response_time'] = response_time
-            metrics['network_info']['http_status'] = response.status_code
-            
-        except requests.RequestException as e:
-            metrics['network_info']['status'] = 'error'
-            metrics['network_info']['error'] = str(e)
+        # Accesibilidad de los segmentos del live edge
+        if segment_urls:
+            with profiling.span('monitor.segments'):
+                segment_check = self.check_segment_accessibility(segment_urls, self.max_segment_checks)
+            self.aggregates.add_segment_times(segment_check.pop('response_times'))
+            metrics['segment_check'] = segment_check
         
         # Calcular estadísticas de bitrate
         if manifest_info['bitrates']:
@@ -223,20 +441,24 @@ class StreamMonitor:
         
         start_time = time.time()
         iteration = 0
+        output = open(self.output_file, 'a')
         
         try:
             while True:
                 iteration += 1
                 self.logger.info(f"Iteración {iteration}: Recolectando métricas...")
+                profiling.begin_tick('monitor')
                 
                 metrics = self.collect_metrics()
                 if metrics:
-                    self.metrics.append(metrics)
-                    self.logger.info(f"Métricas recolectadas: {len(self.metrics)} total")
+                    self.retention.append(metrics)
+                    self.aggregates.add(metrics)
+                    self.logger.info(f"Métricas recolectadas: {self.retention.total_added} total")
                     
-                    # Guardar en archivo
-                    with open(self.output_file, 'w') as f:
-                        json.dump(self.metrics, f, indent=2)
+                    # Agregar el registro del ciclo al archivo (sin reescribir los anteriores)
+                    with profiling.span('monitor.save'):
+                        output.write(json.dumps(metrics, separators=(',', ':')) + '\n')
+                        output.flush()
                     
                     # Mostrar resumen
                     self.print_summary(metrics)
@@ -246,65 +468,66 @@ class StreamMonitor:
                     self.logger.info("Duración de monitoreo alcanzada")
                     break
                 
+                profiling.end_tick()
                 time.sleep(interval)
                 
         except KeyboardInterrupt:
             self.logger.info("Monitoreo interrumpido por el usuario")
+        finally:
+            output.close()
         
-        self.logger.info(f"Monitoreo finalizado. Total de métricas: {len(self.metrics)}")
+        self.logger.info(f"Monitoreo finalizado. Total de métricas: {self.retention.total_added}")
+        self.retention.close()
+        profiling.end_tick()
+        profiling.PROFILER.dump()
         self.generate_final_report()
     
     def print_summary(self, metrics):
         """Imprime un resumen de las métricas actuales"""
         print(f"\n=== RESUMEN {metrics['timestamp']} ===")
-        print(f"Tipo: {metrics['manifest_info']['type']}")
         print(f"Estado red: {metrics['network_info']['status']}")
+        if metrics['network_info']['error']:
+            print(f"Error: {metrics['network_info']['error']}")
+        if 'manifest_info' not in metrics:
+            return
+        print(f"Tipo: {metrics['manifest_info']['type']}")
         
         if metrics['network_info']['response_time']:
-            print(f"Tiempo respuesta: {metrics['network_info']['response_time']:.3f}s")
+            print(f"Tiempo respuesta: {metrics['network_info']['response_time']:.3f}s "
+                  f"(TTFB {metrics['network_info']['ttfb']:.3f}s)")
+        
+        if 'segment_check' in metrics:
+            check = metrics['segment_check']
+            total = check['accessible_segments'] + check['failed_segments']
+            print(f"Segmentos live edge: {check['accessible_segments']}/{total} accesibles", end='')
+            print(f" (avg {check['avg_response_time']:.3f}s)" if 'avg_response_time' in check else "")
         
         if 'bitrate_stats' in metrics:
             stats = metrics['bitrate_stats']
             print(f"Bitrates: {stats['min']}-{stats['max']} kbps (avg: {stats['avg']:.0f})")
         
+        if metrics['manifest_info'].get('latency_s') is not None:
+            print(f"Latencia HLS (PROGRAM-DATE-TIME): {metrics['manifest_info']['latency_s']:.2f}s")
+        
         if metrics['manifest_info']['resolutions']:
             print(f"Resoluciones: {', '.join(set(metrics['manifest_info']['resolutions']))}")
     
     def generate_final_report(self):
-        """Genera un reporte final del monitoreo"""
-        if not self.metrics:
+        """Genera un reporte final del monitoreo (desde los agregados de la sesión completa)"""
+        if not self.aggregates.total_checks:
             return
         
         report = {
             'summary': {
-                'total_checks': len(self.metrics),
-                'start_time': self.metrics[0]['timestamp'],
-                'end_time': self.metrics[-1]['timestamp'],
-                'manifest_url': self.manifest_url
+                'total_checks': self.aggregates.total_checks,
+                'start_time': self.aggregates.start_time,
+                'end_time': self.aggregates.end_time,
+                'manifest_url': self.manifest_url,
+                'metrics_file': self.output_file
             },
-            'statistics': {}
-        }
-        
-        # Estadísticas de red
-        network_statuses = [m['network_info']['status'] for m in self.metrics]
-        report['statistics']['network'] = {
-            'success_rate': network_statuses.count('ok') / len(network_statuses) * 100,
-            'total_errors': network_statuses.count('error')
+            'statistics': self.aggregates.report()
         }
         
-        # Estadísticas de bitrate
-        bitrate_stats = [m['bitrate_stats'] for m in self.metrics if 'bitrate_stats' in m]
-        if bitrate_stats:
-            all_bitrates = []
-            for stats in bitrate_stats:
-                all_bitrates.extend([stats['min'], stats['max'], stats['avg']])
-            
-            report['statistics']['bitrate'] = {
-                'min': min(all_bitrates),
-                'max': max(all_bitrates),
-                'avg': sum(all_bitrates) / len(all_bitrates)
-            }
-        
         # Guardar reporte final
         report_file = f"final_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         with open(report_file, 'w') as f:
@@ -315,17 +538,35 @@ class StreamMonitor:
         print(f"Total de verificaciones: {report['summary']['total_checks']}")
         print(f"Tasa de éxito de red: {report['statistics']['network']['success_rate']:.1f}%")
         print(f"Errores totales: {report['statistics']['network']['total_errors']}")
+        response_time = report['statistics']['network']['response_time']
+        if response_time:
+            print(f"Tiempo de respuesta: p50 {response_time['p50']:.3f}s, p95 {response_time['p95']:.3f}s, "
+                  f"p99 {response_time['p99']:.3f}s")
+        if 'bitrate' in report['statistics']:
+            bitrate = report['statistics']['bitrate']
+            print(f"Bitrates: {bitrate['min']}-{bitrate['max']} kbps (avg: {bitrate['avg']:.0f})")
 
 def main():
     parser = argparse.ArgumentParser(description='Monitor de calidad de streaming DASH/HLS')
     parser.add_argument('manifest_url', help='URL del manifest DASH (.mpd) o HLS (.m3u8)')
     parser.add_argument('-i', '--interval', type=int, default=30, help='Intervalo de monitoreo en segundos (default: 30)')
     parser.add_argument('-d', '--duration', type=int, help='Duración total del monitoreo en segundos')
-    parser.add_argument('-o', '--output', help='Archivo de salida para las métricas')
+    parser.add_argument('-o', '--output', help='Archivo de salida para las métricas (JSONL, un registro por ciclo)')
+    parser.add_argument('--record-trace', help='Registra una traza binaria de todas las peticiones HTTP en este archivo')
+    parser.add_argument('--segment-checks', type=int, default=MAX_SEGMENT_CHECKS,
+                        help='Segmentos del live edge verificados por ciclo (0 = desactivado)')
+    parser.add_argument('--profile-stats', help='Vuelca periódicamente la duración por etapa en este archivo JSON (captura con kill -USR1)')
+    add_retention_arguments(parser)
     
     args = parser.parse_args()
     
-    monitor = StreamMonitor(args.manifest_url, args.output)
+    if args.record_trace:
+        common.set_trace_recorder(TraceRecorder(args.record_trace))
+    if args.profile_stats:
+        profiling.PROFILER.enable(args.profile_stats)
+        profiling.PROFILER.install_signal_handler()
+    
+    monitor = StreamMonitor(args.manifest_url, args.output, policy_from_args(args), args.segment_checks)
     monitor.monitor_stream(args.interval, args.duration)
 
 if __name__ == '__main__':
@@ -7,9 +7,6 @@ Uso: python3 stream_quality_analyzer.py <manifest_url> [options]
 import argparse
 import json
 import time
-import subprocess
-import requests
-import xml.etree.ElementTree as ET
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 import threading
@@ -18,13 +15,30 @@ import os
 import traceback
 
 import stream_analisys_common as common
+import profiling
+from resource_governor import PRIORITY_QUALITY
+from event_bus import TOPIC_QUALITY
+from mpd_diff import ManifestDiffer
+from throughput_trace import TraceRecorder
+from retention import RetentionStore, add_retention_arguments, policy_from_args
+from checkpoint import Checkpointer
+
+# Campos numéricos resumidos en los rollups de 1 min / 1 h
+RETENTION_FIELDS = [
+    'aggregate_metrics.avg_bitrate',
+    'aggregate_metrics.avg_ssim',
+    'aggregate_metrics.segments_analyzed',
+]
 
 class StreamQualityAnalyzer:
-    def __init__(self, manifest_url, output_dir="./stream_analysis", interval=30):
+    def __init__(self, manifest_url, output_dir="./stream_analysis", interval=30, event_bus=None, retention=None,
+                 checkpoint_interval=60):
         self.manifest_url = manifest_url
         self.output_dir = output_dir
         self.interval = interval
         self.running = False
+        self.stop_event = threading.Event()  # Interrumpe la espera entre ciclos al detener
+        self.event_bus = event_bus
         self.analysis_queue = queue.Queue()
         
         # Crear directorio de salida
@@ -35,13 +49,27 @@ class StreamQualityAnalyzer:
         self.report_file = os.path.join(output_dir, "quality_report.txt")
         
         # Inicializar datos
-        self.quality_data = []
+        # Historial crudo acotado a la ventana de retención (lo anterior queda en rollups)
+        self.retention = RetentionStore('quality', output_dir, RETENTION_FIELDS, retention)
+        self.quality_data = self.retention.records
+        self.session_start = datetime.now()
+        
+        # Diferenciador de manifests: evita re-extraer información si la estructura no cambió
+        self.manifest_differ = ManifestDiffer()
+        self.manifest_info = None
+        
+        # Checkpoint del estado móvil: al reiniciar se continúa sin releer los logs
+        self.checkpointer = Checkpointer('quality', os.path.join(output_dir, "quality_checkpoint.pkl"), checkpoint_interval)
+        self.checkpointer.restore(self)
         
     def fetch_manifest(self):
         """Obtiene y parsea el manifest DASH"""
         try:
-            # Descargar y parsear el manifest
-            root, namespace = common.fetch_mpd_root(self.manifest_url)
+            # Descargar el manifest y compararlo con el anterior
+            change = self.manifest_differ.fetch(self.manifest_url)
+            if not change.structure_changed and self.manifest_info is not None:
+                return self.manifest_info
+            root, namespace = change.root, change.namespace
 
             # Extraer información básica
             period = root.find('.//mpd:Period', namespace)
@@ -83,6 +111,7 @@ class StreamQualityAnalyzer:
                 elif content_type == 'text':
                     manifest_info['subtitle_streams'] += 1
             
+            self.manifest_info = manifest_info
             return manifest_info
             
         except Exception as e:
@@ -99,7 +128,7 @@ class StreamQualityAnalyzer:
                 '-select_streams', 'v:0',  # Solo video
                 segment_url
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            result = common.run_tool(cmd, capture_output=True, text=True, timeout=30)
 
             
             if result.returncode == 0:
@@ -145,7 +174,7 @@ class StreamQualityAnalyzer:
                 '-f', 'null', '-'
             ]
             
-            result = subprocess.run(cmd, capture_output=True, timeout=30)
+            result = common.run_tool(cmd, capture_output=True, timeout=30)
             
             if result.returncode == 0 and os.path.exists(ssim_file):
                 # Buscar el valor SSIM global en stderr
@@ -174,7 +203,7 @@ class StreamQualityAnalyzer:
                 '-lavfi', f'ssim=stats_file={ssim_file}',
                 '-f', 'null', '-'
             ]
-            result = subprocess.run(cmd, capture_output=True, timeout=30)
+            result = common.run_tool(cmd, capture_output=True, timeout=30)
             # Buscar el valor SSIM global en stderr
             stderr_str = result.stderr.decode() if isinstance(result.stderr, bytes) else result.stderr
             match = re.search(r'All:([0-9.]+)', stderr_str)
@@ -187,10 +216,10 @@ class StreamQualityAnalyzer:
             print(f"Error en análisis SSIM entre segmentos: {e}")
         return None
     
-    def download_segment(self, segment_url, output_path):
+    def download_segment(self, segment_url, output_path, url_class=common.URL_CLASS_SEGMENT):
         """Descarga un segmento para análisis"""
         try:
-            response = requests.get(segment_url, timeout=30)
+            response = common.http_get(segment_url, timeout=30, url_class=url_class)
             response.raise_for_status()
             
             with open(output_path, 'wb') as f:
@@ -203,11 +232,10 @@ class StreamQualityAnalyzer:
     def get_segment_urls(self, manifest_info):
         """Obtiene URLs de inicialización y de los dos primeros segmentos de video del manifest"""
         try:
-            response = requests.get(self.manifest_url, timeout=10)
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            namespace = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
+            # Reutilizar el manifest ya descargado en fetch_manifest (el timeline puede haber avanzado)
+            root, namespace = self.manifest_differ.root, self.manifest_differ.namespace
+            if root is None:
+                root, namespace = common.fetch_mpd_root(self.manifest_url)
             
             segment_info_list = []
             
@@ -262,23 +290,31 @@ class StreamQualityAnalyzer:
         print(f"Directorio de salida: {self.output_dir}")
         print()
         
+        # Prioridad de este analizador en el presupuesto compartido de peticiones
+        common.set_thread_priority(PRIORITY_QUALITY)
+        
         while self.running:
             try:
+                # Presupuesto de tiempo del ciclo: ninguna petición se extiende más allá del intervalo
+                common.start_tick(self.interval)
+                profiling.begin_tick('quality')
                 timestamp = datetime.now().isoformat()
                 print(f"[{timestamp}] Analizando stream...")
                 
                 # 1. Obtener información del manifest
-                manifest_info = self.fetch_manifest()
+                with profiling.span('quality.manifest'):
+                    manifest_info = self.fetch_manifest()
                 if not manifest_info:
                     print("Error: No se pudo obtener información del manifest")
-                    time.sleep(self.interval)
+                    self.wait_next_tick()
                     continue
                 
                 # 2. Obtener URLs de segmentos y de inicialización
-                segment_info_list = self.get_segment_urls(manifest_info)
+                with profiling.span('quality.segment_urls'):
+                    segment_info_list = self.get_segment_urls(manifest_info)
                 if not segment_info_list:
                     print("Error: No se encontraron segmentos para analizar")
-                    time.sleep(self.interval)
+                    self.wait_next_tick()
                     continue
                 
                 # 3. Analizar calidad de segmentos
@@ -291,14 +327,18 @@ class StreamQualityAnalyzer:
                     temp_init = f"/tmp/init_{i}_{int(time.time())}.mp4"
                     temp_segment = f"/tmp/segment_{i}_{int(time.time())}.m4s"
                     temp_concat = f"/tmp/concat_{i}_{int(time.time())}.mp4"
-                    if self.download_segment(init_url, temp_init) and self.download_segment(segment_url, temp_segment):
+                    with profiling.span('quality.segment_download'):
+                        downloaded = self.download_segment(init_url, temp_init, common.URL_CLASS_INIT) and self.download_segment(segment_url, temp_segment)
+                    if downloaded:
                         # Concatenar init + segmento
-                        with open(temp_concat, 'wb') as wfd:
-                            for f in [temp_init, temp_segment]:
-                                with open(f, 'rb') as fd:
-                                    wfd.write(fd.read())
+                        with profiling.span('quality.temp_io'):
+                            with open(temp_concat, 'wb') as wfd:
+                                for f in [temp_init, temp_segment]:
+                                    with open(f, 'rb') as fd:
+                                        wfd.write(fd.read())
                         # Analizar el archivo concatenado
-                        quality_metrics = self.analyze_segment_quality(temp_concat)
+                        with profiling.span('quality.ffprobe'):
+                            quality_metrics = self.analyze_segment_quality(temp_concat)
                         if quality_metrics:
                             quality_results.append(quality_metrics)
                         concat_files.append(temp_concat)
@@ -309,7 +349,8 @@ class StreamQualityAnalyzer:
                 # Calcular SSIM entre primer y segundo segmento si existen
                 ssim_between = None
                 if len(concat_files) >= 2:
-                    ssim_between = self.analyze_ssim_between_segments(concat_files[0], concat_files[-1])
+                    with profiling.span('quality.ssim'):
+                        ssim_between = self.analyze_ssim_between_segments(concat_files[0], concat_files[-1])
                     quality_metrics['ssim'] = ssim_between
                     print(f"  ✓ SSIM entre primer y segundo segmento: {ssim_between if ssim_between is not None else 'N/A'}")
                 # Limpiar archivos concatenados
@@ -338,8 +379,12 @@ class StreamQualityAnalyzer:
                     }
                     
                     # Guardar resultado
-                    self.quality_data.append(analysis_result)
-                    self.save_results()
+                    self.retention.append(analysis_result)
+                    if self.event_bus:
+                        self.event_bus.publish(TOPIC_QUALITY, analysis_result)
+                    with profiling.span('quality.save_results'):
+                        self.save_results()
+                    self.checkpointer.maybe_save(self)
                     
                     # Mostrar resumen
                     print(f"  ✓ Bitrate promedio: {avg_bitrate/1000:.1f} kbps")
@@ -350,7 +395,7 @@ class StreamQualityAnalyzer:
                     print(f"  ✓ Segmentos analizados: {len(quality_results)}")
                 
                 print(f"  Esperando {self.interval} segundos...")
-                time.sleep(self.interval)
+                self.wait_next_tick()
                 
             except KeyboardInterrupt:
                 print("\nDetención solicitada por el usuario")
@@ -358,7 +403,11 @@ class StreamQualityAnalyzer:
             except Exception as e:
                 print(f"Error en análisis: {e}")
                 traceback.print_exc()
-                time.sleep(self.interval)
+                self.wait_next_tick()
+        
+        # Persistir los buckets de rollup abiertos y el estado final
+        self.retention.close()
+        self.checkpointer.save(self)
     
 
     def save_results(self):
@@ -366,7 +415,8 @@ class StreamQualityAnalyzer:
         common.save_results(self.quality_data, self.quality_log)
       
         # Generar reporte de texto
-        self.generate_report()
+        with profiling.span('quality.report'):
+            self.generate_report()
     
     def generate_report(self):
         """Genera reporte de texto"""
@@ -374,7 +424,7 @@ class StreamQualityAnalyzer:
             f.write("=== REPORTE DE CALIDAD DE STREAM ===\n")
             f.write(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"Manifest: {self.manifest_url}\n")
-            f.write(f"Total de análisis: {len(self.quality_data)}\n\n")
+            f.write(f"Total de análisis: {self.retention.total_added}\n\n")
             
             if self.quality_data:
                 latest = self.quality_data[-1]
@@ -413,24 +463,50 @@ class StreamQualityAnalyzer:
                     else:
                         f.write("\n")
     
+    def get_state(self):
+        """Estado móvil para el checkpoint (ventana de retención)"""
+        return {
+            'session_start': self.session_start,
+            'retention': self.retention.get_state(),
+        }
+    
+    def restore_state(self, state):
+        self.session_start = state['session_start']
+        self.retention.restore_state(state['retention'])
+    
     def start(self):
         """Inicia el análisis"""
         self.running = True
+        self.stop_event.clear()
         self.run_analysis()
     
+    def wait_next_tick(self):
+        """Cierra el span del ciclo y espera al siguiente (interrumpible por stop)"""
+        profiling.end_tick()
+        self.stop_event.wait(self.interval)
+    
     def stop(self):
         """Detiene el análisis"""
         self.running = False
+        self.stop_event.set()
 
 def main():
     parser = argparse.ArgumentParser(description='Analiza la calidad de streams DASH/HLS en tiempo real')
     parser.add_argument('manifest_url', help='URL del manifest DASH/HLS')
     parser.add_argument('-o', '--output', default='./stream_analysis', help='Directorio de salida')
     parser.add_argument('-i', '--interval', type=int, default=30, help='Intervalo de análisis en segundos')
+    parser.add_argument('--record-trace', help='Registra una traza binaria de todas las peticiones HTTP en este archivo')
+    add_retention_arguments(parser)
+    parser.add_argument('--checkpoint-interval', type=float, default=60,
+                        help='Segundos entre checkpoints del estado del analizador (0 = desactivado)')
     
     args = parser.parse_args()
     
-    analyzer = StreamQualityAnalyzer(args.manifest_url, args.output, args.interval)
+    if args.record_trace:
+        common.set_trace_recorder(TraceRecorder(args.record_trace))
+    
+    analyzer = StreamQualityAnalyzer(args.manifest_url, args.output, args.interval, retention=policy_from_args(args),
+                                     checkpoint_interval=args.checkpoint_interval)
     
     try:
         analyzer.start()
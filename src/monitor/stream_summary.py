@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Stream Summary - Tabla resumen por stream para la vista general de un despliegue multicanal
+Cada suite actualiza su fila (upsert) al final de cada ciclo; el dashboard ordena, filtra y pagina
+en SQLite con índices en lugar de abrir un archivo por stream en cada petición.
+Uso: python3 stream_summary.py <streams.db> [--sort health_score] [--status critical] [--limit 20]
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+SUMMARY_DB_NAME = "streams.db"
+
+# Umbrales de estado, los mismos que usa la tarjeta principal del dashboard
+STATUS_THRESHOLDS = (('excellent', 0.8), ('good', 0.6), ('fair', 0.4), ('critical', 0.0))
+
+SORT_COLUMNS = ('stream', 'health_score', 'confidence', 'latency_p95_ms', 'measured_bitrate_bps', 'updated_at')
+
+STATUS_FILTERS = {
+    'excellent': "health_score >= 0.8",
+    'good': "health_score >= 0.6 AND health_score < 0.8",
+    'fair': "health_score >= 0.4 AND health_score < 0.6",
+    'critical': "health_score < 0.4",
+    'nodata': "health_score IS NULL",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stream_summary (
+    stream TEXT PRIMARY KEY,
+    manifest_url TEXT NOT NULL,
+    health_score REAL,
+    confidence REAL,
+    latency_p95_ms REAL,
+    measured_bitrate_bps REAL,
+    recommendations INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stream_summary_health ON stream_summary (health_score);
+CREATE INDEX IF NOT EXISTS stream_summary_latency ON stream_summary (latency_p95_ms);
+CREATE INDEX IF NOT EXISTS stream_summary_bitrate ON stream_summary (measured_bitrate_bps);
+CREATE INDEX IF NOT EXISTS stream_summary_updated ON stream_summary (updated_at);
+"""
+
+
+def health_status(score):
+    if score is None:
+        return 'nodata'
+    for status, threshold in STATUS_THRESHOLDS:
+        if score >= threshold:
+            return status
+    return 'critical'
+
+
+def summary_from_result(aggregated_result):
+    """Campos de la fila a partir del resultado agregado de un ciclo de la suite"""
+    overall = aggregated_result['overall_metrics']
+    latency = aggregated_result['latency_analysis']['latest_analysis'] or {}
+    adaptation = aggregated_result['adaptation_analysis']['latest_analysis'] or {}
+    measured = ((adaptation.get('adaptation_analysis') or {}).get('adaptation_metrics') or {}).get('measured_bitrates') or {}
+    bitrates = [summary['last_measured_bitrate'] for summary in measured.values()
+                if summary.get('last_measured_bitrate') is not None]
+    return {
+        'health_score': overall['stream_health_score'],
+        'confidence': overall['confidence'],
+        'latency_p95_ms': (latency.get('manifest_metrics') or {}).get('p95_latency_ms'),
+        # Bitrate medido de la representación más alta
+        'measured_bitrate_bps': max(bitrates) if bitrates else None,
+        'recommendations': len(overall['recommendations']),
+    }
+
+
+class StreamSummaryStore:
+    """Fila resumen de un stream; varias suites pueden escribir en la misma base (WAL)"""
+
+    def __init__(self, path, stream, manifest_url):
+        self.path = path
+        self.stream = stream
+        self.manifest_url = manifest_url
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def update(self, summary, updated_at=None):
+        row = dict(summary, stream=self.stream, manifest_url=self.manifest_url,
+                   updated_at=time.time() if updated_at is None else updated_at)
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO stream_summary (stream, manifest_url, health_score, confidence, latency_p95_ms, "
+                    "measured_bitrate_bps, recommendations, updated_at) VALUES (:stream, :manifest_url, :health_score, "
+                    ":confidence, :latency_p95_ms, :measured_bitrate_bps, :recommendations, :updated_at) "
+                    "ON CONFLICT(stream) DO UPDATE SET manifest_url=excluded.manifest_url, "
+                    "health_score=excluded.health_score, confidence=excluded.confidence, "
+                    "latency_p95_ms=excluded.latency_p95_ms, measured_bitrate_bps=excluded.measured_bitrate_bps, "
+                    "recommendations=excluded.recommendations, updated_at=excluded.updated_at",
+                    row)
+        except sqlite3.Error as e:
+            print(f"Error actualizando resumen de {self.stream}: {e}")
+
+    def close(self):
+        self.conn.close()
+
+
+def open_readonly(path):
+    """Conexión de solo lectura para el dashboard (None si la base aún no existe)"""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def query_summaries(conn, sort='health_score', descending=False, search=None, status=None, page=1, per_page=50,
+                    now=None):
+    """Página de filas ordenada y filtrada en SQLite; los NULL quedan siempre al final"""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"sort debe ser uno de: {', '.join(SORT_COLUMNS)}")
+    if status is not None and status not in STATUS_FILTERS:
+        raise ValueError(f"status debe ser uno de: {', '.join(STATUS_FILTERS)}")
+    now = time.time() if now is None else now
+    page = max(1, page)
+
+    where = []
+    params = []
+    if search:
+        where.append("(stream LIKE ? ESCAPE '\\' OR manifest_url LIKE ? ESCAPE '\\')")
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        params += [pattern, pattern]
+    if status:
+        where.append(STATUS_FILTERS[status])
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    total = conn.execute(f"SELECT COUNT(*) FROM stream_summary {where_sql}", params).fetchone()[0]
+    rows = conn.execute(
+        f"SELECT * FROM stream_summary {where_sql} "
+        f"ORDER BY {sort} IS NULL, {sort} {'DESC' if descending else 'ASC'}, stream LIMIT ? OFFSET ?",
+        params + [per_page, (page - 1) * per_page]).fetchall()
+
+    streams = []
+    for row in rows:
+        item = dict(row)
+        item['status'] = health_status(item['health_score'])
+        item['age_s'] = max(0.0, now - item['updated_at'])
+        streams.append(item)
+    return {
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+        'sort': sort,
+        'order': 'desc' if descending else 'asc',
+        'streams': streams,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consulta la tabla resumen de streams')
+    parser.add_argument('db', help='Base de datos streams.db')
+    parser.add_argument('--sort', choices=SORT_COLUMNS, default='health_score')
+    parser.add_argument('--desc', action='store_true', help='Orden descendente')
+    parser.add_argument('--search', help='Texto a buscar en el stream o la URL')
+    parser.add_argument('--status', choices=list(STATUS_FILTERS))
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = open_readonly(args.db)
+    if conn is None:
+        print(f"✗ No existe {args.db}")
+        return
+    result = query_summaries(conn, args.sort, args.desc, args.search, args.status, 1, args.limit)
+    for item in result['streams']:
+        health = 'N/A' if item['health_score'] is None else f"{item['health_score']:.3f}"
+        latency = 'N/A' if item['latency_p95_ms'] is None else f"{item['latency_p95_ms']:.1f} ms"
+        print(f"{item['stream']:<50} {item['status']:<9} health={health} p95={latency} hace {item['age_s']:.0f}s")
+    print(f"✓ {len(result['streams'])} de {result['total']} streams")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Throughput Trace - Registro compacto de trazas de red por petición y replay offline
+Uso: python3 throughput_trace.py {info,replay} <trace_file> [options]
+"""
+
+import argparse
+import atexit
+import os
+import struct
+import threading
+import time
+import warnings
+
+import numpy as np
+
+import stream_analisys_common as common
+import abr_simulator
+
+# Formato binario: cabecera fija + registros de tamaño fijo (little endian, sin padding)
+TRACE_MAGIC = b'LVLTRC01'
+HEADER_SIZE = 16
+RECORD_STRUCT = struct.Struct('<dBHIff')
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),   # Inicio de la petición (epoch, segundos)
+    ('url_class', 'u1'),    # common.URL_CLASS_*
+    ('status', '<u2'),      # Código HTTP o common.TRACE_STATUS_*
+    ('bytes', '<u4'),       # Bytes recibidos
+    ('ttfb_ms', '<f4'),     # Tiempo hasta cabeceras (NaN si falló)
+    ('total_ms', '<f4'),    # Tiempo total de la petición
+])
+
+URL_CLASS_NAMES = {
+    common.URL_CLASS_MANIFEST: 'manifest',
+    common.URL_CLASS_INIT: 'init',
+    common.URL_CLASS_SEGMENT: 'segment',
+    common.URL_CLASS_OTHER: 'other',
+}
+
+
+class TraceRecorder:
+    """Escribe trazas de peticiones HTTP en un archivo binario de registros fijos (thread-safe)"""
+
+    def __init__(self, path, flush_every=64):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.pending = []
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if new_file:
+            self.file.write(TRACE_MAGIC.ljust(HEADER_SIZE, b'\0'))
+            self.file.flush()
+        atexit.register(self.close)
+
+    def record(self, timestamp, url_class, status, size, ttfb_ms, total_ms):
+        """Agrega una petición a la traza"""
+        packed = RECORD_STRUCT.pack(timestamp, url_class, status, min(size, 0xFFFFFFFF),
+                                    float('nan') if ttfb_ms is None else ttfb_ms, total_ms)
+        with self.lock:
+            self.pending.append(packed)
+            if len(self.pending) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.file.write(b''.join(self.pending))
+            self.file.flush()
+            self.pending = []
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._flush()
+                self.file.close()
+
+
+def load_trace(path):
+    """Carga una traza como array estructurado de NumPy (memmap, sin copiar)"""
+    with open(path, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} no es una traza válida")
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+class TraceReplay:
+    """Reproduce una traza sobre los cálculos de latencia, adaptación y buffer más rápido que tiempo real"""
+
+    def __init__(self, records):
+        self.records = records
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_trace(path))
+
+    def select(self, url_class):
+        return self.records[self.records['url_class'] == url_class]
+
+    def latency_metrics(self, url_class, window=50):
+        """Equivalente vectorizado de calculate_buffering_metrics para cada petición (ventana deslizante)"""
+        records = self.select(url_class)
+        n = records.size
+        if n == 0:
+            return {}
+
+        status = records['status']
+        success = status >= 200
+        latency = np.where(success, records['total_ms'].astype(np.float64), np.nan)
+        timeouts = (status == common.TRACE_STATUS_TIMEOUT).astype(np.float64)
+        errors = (status == common.TRACE_STATUS_ERROR).astype(np.float64)
+
+        # Sumas acumuladas para medias y varianzas por ventana en O(n)
+        def rolling_sum(values):
+            cumsum = np.concatenate(([0.0], np.cumsum(values)))
+            start = np.maximum(np.arange(1, n + 1) - window, 0)
+            return cumsum[1:] - cumsum[start]
+
+        valid = ~np.isnan(latency)
+        values = np.where(valid, latency, 0.0)
+        count = rolling_sum(valid.astype(np.float64))
+        total = np.minimum(np.arange(1, n + 1), window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = rolling_sum(values) / count
+            variance = rolling_sum(values ** 2) / count - mean ** 2
+
+        padded = np.concatenate((np.full(window - 1, np.nan), latency))
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            minimum = np.nanmin(windows, axis=1)
+            maximum = np.nanmax(windows, axis=1)
+
+        return {
+            'timestamp': records['timestamp'],
+            'avg_latency_ms': mean,
+            'min_latency_ms': minimum,
+            'max_latency_ms': maximum,
+            'latency_variance': np.maximum(variance, 0.0),
+            'timeout_rate': rolling_sum(timeouts) / total,
+            'error_rate': rolling_sum(errors) / total,
+        }
+
+    def segment_throughputs(self):
+        """Throughput medido (bps) de cada descarga de segmento exitosa"""
+        records = self.select(common.URL_CLASS_SEGMENT)
+        ok = (records['status'] >= 200) & (records['status'] < 300) & (records['bytes'] > 0) & (records['total_ms'] > 0)
+        return records['bytes'][ok] * 8.0 / (records['total_ms'][ok] / 1000.0)
+
+    def adaptation(self, ladder, segment_duration, rule=abr_simulator.RULE_HYBRID, **params):
+        """Simula clientes ABR sobre el throughput de la traza"""
+        return abr_simulator.simulate(ladder, segment_duration, self.segment_throughputs(), rule, **params)
+
+    def buffer(self, bitrate, segment_duration, buffer_target=abr_simulator.DEFAULT_PARAMS['buffer_target']):
+        """Evolución del buffer de un cliente que reproduce siempre el mismo bitrate"""
+        return abr_simulator.simulate([bitrate], segment_duration, self.segment_throughputs(),
+                                      abr_simulator.RULE_THROUGHPUT, buffer_target=buffer_target)
+
+
+def print_info(records):
+    if records.size == 0:
+        print("Traza vacía")
+        return
+    duration = records['timestamp'][-1] - records['timestamp'][0]
+    print(f"Registros: {records.size}")
+    print(f"Duración: {duration/3600:.2f} h")
+    for url_class, name in URL_CLASS_NAMES.items():
+        count = int(np.count_nonzero(records['url_class'] == url_class))
+        if count:
+            print(f"  {name}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspecciona y reproduce trazas de red registradas')
+    parser.add_argument('command', choices=['info', 'replay'], help='Acción a ejecutar')
+    parser.add_argument('trace', help='Archivo de traza (.trace)')
+    parser.add_argument('--ladder', type=abr_simulator.parse_float_list, help='Escalera de bitrates en bps para simular adaptación')
+    parser.add_argument('-d', '--segment-duration', type=float, default=2.0, help='Duración de segmento en segundos')
+    parser.add_argument('-w', '--window', type=int, default=50, help='Ventana de métricas de latencia (mediciones)')
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    replay = TraceReplay.from_file(args.trace)
+    print_info(replay.records)
+    if args.command == 'info':
+        return
+
+    print("\n--- LATENCIA ---")
+    for url_class in (common.URL_CLASS_MANIFEST, common.URL_CLASS_SEGMENT):
+        metrics = replay.latency_metrics(url_class, args.window)
+        if metrics:
+            print(f"{URL_CLASS_NAMES[url_class]}: latencia promedio final {np.nan_to_num(metrics['avg_latency_ms'][-1]):.1f} ms, "
+                  f"máxima {np.nan_to_num(metrics['max_latency_ms'][-1]):.1f} ms, "
+                  f"timeouts {metrics['timeout_rate'][-1]:.2%}, errores {metrics['error_rate'][-1]:.2%}")
+
+    throughputs = replay.segment_throughputs()
+    if throughputs.size and args.ladder:
+        print("\n--- ADAPTACIÓN ---")
+        for rule in abr_simulator.RULES:
+            result = replay.adaptation(args.ladder, args.segment_duration, rule)
+            print(f"{rule}: bitrate medio {result['avg_bitrate'][0]/1000:.1f} kbps, "
+                  f"switches {result['switch_count'][0]}, stalls {result['stall_time'][0]:.1f}s")
+
+        print("\n--- BUFFER ---")
+        for bitrate in args.ladder:
+            result = replay.buffer(bitrate, args.segment_duration)
+            print(f"{bitrate/1000:.0f} kbps fijo: stalls {result['stall_time'][0]:.1f}s en {result['stall_events'][0]} eventos")
+
+    print(f"\n✓ Replay completado en {time.time() - start_time:.2f} s")
+
+
+if __name__ == "__main__":
+    main()